@@ -1,6 +1,19 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import SEARCH_VAR
+from django.db import connection
 from django.utils.translation import ugettext_lazy as _
-from coltrane.models import Category, Entry, Link
+from coltrane.models import Category, Entry, Link, ModerationTask, OutboundPost, PopularItem
+from coltrane import search
+
+def _search_index_filter(request, qs):
+    """
+    Narrows a changelist ``QuerySet`` down to the objects which the
+    search index says match the changelist's search query, so that
+    the ``LIKE`` lookups the admin adds for ``search_fields`` only
+    have to re-check those instead of scanning the table.
+    
+    """
+    return search.filter_matching(qs, request.GET.get(SEARCH_VAR, ''))
 
 class CategoryOptions(admin.ModelAdmin):
     prepopulated_fields = {
@@ -24,6 +37,29 @@ class EntryOptions(admin.ModelAdmin):
     prepopulated_fields = {
         'slug': ('title',),
     }
+    
+    def queryset(self, request):
+        """
+        Adds the category count for each Entry to the changelist
+        query as a correlated subquery, so the whole page is fetched
+        in a single query instead of an extra ``COUNT`` query per row
+        (the comment count is the stored ``comment_count``, which
+        only counts public comments), and applies the search index.
+        
+        """
+        qn = connection.ops.quote_name
+        entry_pk = '%s.%s' % (qn(Entry._meta.db_table), qn(Entry._meta.pk.column))
+        categories_field = Entry._meta.get_field('categories')
+        category_sql = 'SELECT COUNT(*) FROM %s WHERE %s.%s = %s' % \
+                       (qn(categories_field.m2m_db_table()),
+                        qn(categories_field.m2m_db_table()), qn(categories_field.m2m_column_name()),
+                        entry_pk)
+        qs = _search_index_filter(request, super(EntryOptions, self).queryset(request))
+        return qs.extra(select={ 'admin_category_count': category_sql })
+    
+    def _get_category_count(self, obj):
+        return obj.admin_category_count
+    _get_category_count.short_description = Entry._get_category_count.short_description
 
 class LinkOptions(admin.ModelAdmin):
     date_hierarchy = 'pub_date'
@@ -38,7 +74,26 @@ class LinkOptions(admin.ModelAdmin):
     prepopulated_fields = {
         'slug': ('title',),
     }
+    
+    def queryset(self, request):
+        return _search_index_filter(request, super(LinkOptions, self).queryset(request))
+
+class OutboundPostOptions(admin.ModelAdmin):
+    list_display = ('link', 'status', 'attempts', 'queued', 'next_attempt', 'posted')
+    list_filter = ('status',)
+    raw_id_fields = ('link',)
+
+class ModerationTaskOptions(admin.ModelAdmin):
+    list_display = ('comment_id', 'content_type', 'object_id', 'status', 'queued', 'processed', 'mailed')
+    list_filter = ('status',)
+
+class PopularItemOptions(admin.ModelAdmin):
+    list_display = ('rank', 'content_type', 'object_id', 'count')
+    list_filter = ('content_type',)
 
 admin.site.register(Category, CategoryOptions)
 admin.site.register(Entry, EntryOptions)
 admin.site.register(Link, LinkOptions)
+admin.site.register(ModerationTask, ModerationTaskOptions)
+admin.site.register(OutboundPost, OutboundPostOptions)
+admin.site.register(PopularItem, PopularItemOptions)
@@ -0,0 +1,261 @@
+"""
+Maintenance of the precomputed date-archive index.
+
+For every year, month and day in which Entries or Links were
+published, an ``ArchiveBucket`` stores how many there were -- for
+live Entries overall, for live Entries in each Category, and for
+Links. Archive views read their ``date_list`` from these buckets (see
+``coltrane.managers.ArchiveQuerySet``) rather than running a
+``DISTINCT`` date query over the whole table.
+
+Like the archive views, which don't show objects dated in the future,
+the buckets only count objects whose publication time has passed.
+
+Buckets are refreshed whenever an Entry or Link is saved or deleted,
+and an Entry's Category buckets additionally when its Categories
+change (see ``coltrane.signals``). Nothing is sent when a scheduled
+object's publication time arrives, so the ``publish_scheduled``
+management command, meant to be run periodically (e.g. hourly from
+cron), refreshes the buckets of objects published in the last few
+hours. The ``rebuild_archive_index`` management command rebuilds the
+whole index from scratch.
+
+"""
+
+import datetime
+
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import signals
+
+from coltrane.models import ArchiveBucket, Category, Entry, Link
+from coltrane.signals import entry_categories_changed, entry_categories_changing
+
+
+def get_buckets(model, category_id=None):
+    """
+    Returns a ``QuerySet`` of the buckets of ``model``, optionally
+    for a single Category.
+    
+    """
+    qs = ArchiveBucket.objects.filter(content_type__pk=ContentType.objects.get_for_model(model).id)
+    if category_id is None:
+        return qs.filter(category__isnull=True)
+    return qs.filter(category__pk=category_id)
+
+def _objects(model, category_id):
+    if model is Link:
+        return Link.objects.filter(pub_date__lte=datetime.datetime.now())
+    qs = Entry.live.filter(pub_date__lte=datetime.datetime.now())
+    if category_id is not None:
+        qs = qs.filter(categories__pk=category_id)
+    return qs
+
+def _set_count(model, category_id, year, month, day, count):
+    try:
+        bucket = get_buckets(model, category_id).get(year=year, month=month, day=day)
+    except ArchiveBucket.DoesNotExist:
+        if not count:
+            return
+        bucket = ArchiveBucket(content_type=ContentType.objects.get_for_model(model),
+                               category_id=category_id,
+                               year=year, month=month, day=day)
+    if not count:
+        bucket.delete()
+    elif bucket.count != count:
+        bucket.count = count
+        bucket.save()
+
+def refresh_day(model, category_id, date):
+    """
+    Recounts the objects of ``model`` published on ``date``, then
+    the month and year buckets containing it.
+    
+    Only the day is counted against the ``model`` table itself;
+    month and year totals are summed from the buckets below them.
+    
+    """
+    start = datetime.datetime.combine(date, datetime.time.min)
+    count = _objects(model, category_id).filter(pub_date__gte=start,
+                                                pub_date__lt=start + datetime.timedelta(days=1)).count()
+    _set_count(model, category_id, date.year, date.month, date.day, count)
+    buckets = get_buckets(model, category_id).filter(year=date.year)
+    month_count = sum([b.count for b in buckets.filter(month=date.month, day__gt=0)])
+    _set_count(model, category_id, date.year, date.month, 0, month_count)
+    year_count = sum([b.count for b in buckets.filter(month__gt=0, day=0)])
+    _set_count(model, category_id, date.year, 0, 0, year_count)
+
+def dates(model, category_id, lookups, kind, order='ASC'):
+    """
+    Returns the list of ``datetime`` objects which ``QuerySet.dates()``
+    would return for ``pub_date`` with the given ``kind`` and
+    ``order``, read from the index.
+    
+    ``lookups`` are the ``pub_date`` filters applied to the
+    ``QuerySet``; they are matched against each bucket's first day, so
+    a bound falling inside a bucket is only honored to the bucket's
+    granularity.
+    
+    """
+    buckets = get_buckets(model, category_id).filter(count__gt=0)
+    if kind == 'year':
+        buckets = buckets.filter(month=0)
+    elif kind == 'month':
+        buckets = buckets.filter(month__gt=0, day=0)
+    else:
+        buckets = buckets.filter(day__gt=0)
+    lower = upper = None
+    for lookup, value in lookups.items():
+        lookup_type = lookup.split('__', 1)[1]
+        if lookup_type == 'year':
+            buckets = buckets.filter(year=int(value))
+        elif lookup_type == 'month':
+            buckets = buckets.filter(month=int(value))
+        elif lookup_type == 'day':
+            buckets = buckets.filter(day=int(value))
+        elif lookup_type in ('gt', 'gte'):
+            lower = value
+        elif lookup_type in ('lt', 'lte'):
+            upper = value
+        elif lookup_type == 'range':
+            lower, upper = value
+    if order == 'DESC':
+        buckets = buckets.order_by('-year', '-month', '-day')
+    else:
+        buckets = buckets.order_by('year', 'month', 'day')
+    date_list = []
+    for bucket in buckets:
+        date = datetime.datetime(bucket.year, bucket.month or 1, bucket.day or 1)
+        if lower is not None and date.date() < _truncate(lower, kind):
+            continue
+        if upper is not None and date.date() > _as_date(upper):
+            continue
+        date_list.append(date)
+    return date_list
+
+def _as_date(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    return value
+
+def _truncate(value, kind):
+    value = _as_date(value)
+    if kind == 'year':
+        return value.replace(month=1, day=1)
+    if kind == 'month':
+        return value.replace(day=1)
+    return value
+
+def _entry_state(entry):
+    """
+    Returns the ``(date, is_live, category_ids)`` the index currently
+    holds for ``entry``, read from the database.
+    
+    """
+    try:
+        stored = Entry.objects.get(pk=entry.id)
+    except Entry.DoesNotExist:
+        return None
+    return (stored.pub_date.date(),
+            stored.status == Entry.LIVE_STATUS,
+            set(stored.categories.values_list('id', flat=True)))
+
+def capture_entry_state(sender, instance, **kwargs):
+    """
+    Remembers an Entry's stored date, status and Categories before it
+    is saved or deleted, so the buckets it is leaving can be
+    refreshed afterwards.
+    
+    """
+    instance._archive_state = instance.id and _entry_state(instance) or None
+
+def update_entry_buckets(sender, instance, **kwargs):
+    """
+    Refreshes the buckets an Entry was in before it was saved,
+    deleted or recategorized, and those it is in now.
+    
+    """
+    old = getattr(instance, '_archive_state', None)
+    new = instance.id and _entry_state(instance) or None
+    instance._archive_state = new
+    if old == new or not [state for state in (old, new) if state is not None and state[1]]:
+        return
+    days = set()
+    category_ids = set()
+    for state in (old, new):
+        if state is not None:
+            days.add(state[0])
+            category_ids.update(state[2])
+    for date in days:
+        refresh_day(Entry, None, date)
+        for category_id in category_ids:
+            refresh_day(Entry, category_id, date)
+
+def capture_link_date(sender, instance, **kwargs):
+    instance._archive_date = None
+    if instance.id:
+        try:
+            instance._archive_date = Link.objects.get(pk=instance.id).pub_date.date()
+        except Link.DoesNotExist:
+            pass
+
+def update_link_buckets(sender, instance, **kwargs):
+    days = set([instance.pub_date.date()])
+    if getattr(instance, '_archive_date', None) is not None:
+        days.add(instance._archive_date)
+    for date in days:
+        refresh_day(Link, None, date)
+
+def refresh_published(objects):
+    """
+    Refreshes the buckets of the days on which ``objects``, Entries
+    and Links whose publication time has just passed, were published.
+    
+    """
+    for obj in objects:
+        date = obj.pub_date.date()
+        if isinstance(obj, Entry):
+            refresh_day(Entry, None, date)
+            for category_id in obj.categories.values_list('id', flat=True):
+                refresh_day(Entry, category_id, date)
+        else:
+            refresh_day(Link, None, date)
+
+def rebuild(model, category_id=None):
+    """
+    Deletes and recreates every bucket of ``model`` (restricted to
+    one Category, if ``category_id`` is given).
+    
+    """
+    counts = {}
+    for pub_date in _objects(model, category_id).values_list('pub_date', flat=True).iterator():
+        for key in ((pub_date.year, pub_date.month, pub_date.day),
+                    (pub_date.year, pub_date.month, 0),
+                    (pub_date.year, 0, 0)):
+            counts[key] = counts.get(key, 0) + 1
+    get_buckets(model, category_id).delete()
+    content_type = ContentType.objects.get_for_model(model)
+    for (year, month, day), count in counts.items():
+        ArchiveBucket.objects.create(content_type=content_type, category_id=category_id,
+                                     year=year, month=month, day=day, count=count)
+
+def rebuild_all():
+    """
+    Rebuilds the whole archive index.
+    
+    """
+    rebuild(Entry)
+    rebuild(Link)
+    for category_id in Category.objects.values_list('id', flat=True):
+        rebuild(Entry, category_id)
+
+
+signals.pre_save.connect(capture_entry_state, sender=Entry)
+signals.post_save.connect(update_entry_buckets, sender=Entry)
+signals.pre_delete.connect(capture_entry_state, sender=Entry)
+signals.post_delete.connect(update_entry_buckets, sender=Entry)
+entry_categories_changing.connect(capture_entry_state, sender=Entry)
+entry_categories_changed.connect(update_entry_buckets, sender=Entry)
+signals.pre_save.connect(capture_link_date, sender=Link)
+signals.post_save.connect(update_link_buckets, sender=Link)
+signals.pre_delete.connect(capture_link_date, sender=Link)
+signals.post_delete.connect(update_link_buckets, sender=Link)
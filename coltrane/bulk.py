@@ -0,0 +1,711 @@
+"""
+Streaming bulk import and export of Categories, Entries and Links.
+
+Objects are exchanged as *records*, plain dictionaries with a
+``type`` of 'category', 'entry' or 'link' and the object's fields;
+an Entry's ``author`` and a Link's ``posted_by`` are usernames, and
+an Entry's ``categories`` a list of Category slugs. ``write_jsonl()``
+and ``read_jsonl()`` store records one JSON object per line, and
+``write_wxr()`` and ``read_wxr()`` convert them to and from
+WordPress's WXR export format, which has no equivalent of a Link, so
+only Categories and Entries go through it.
+
+Exports read the database a batch at a time, in order of id, and
+imports parse their input incrementally, so neither holds more than a
+batch of objects in memory however large the weblog is.
+
+An ``Importer`` inserts each batch of new objects with one
+``executemany`` per table inside a transaction, bypassing the models'
+``save()`` methods and signals: no markup is rendered, no Link is
+queued for posting elsewhere, and none of the indexes, counts and
+caches maintained by signal handlers are updated object by object.
+``Importer.finish()`` then renders the new objects' markup in
+parallel worker processes (see ``render_markup()``) and brings those
+indexes, counts and caches up to date in a single pass each.
+
+Objects which already exist (Categories by slug, Entries by slug and
+publication date, Links by URL) are skipped, so an interrupted import
+can simply be run again.
+
+"""
+
+import datetime
+from xml.etree import cElementTree as ElementTree
+from xml.sax.saxutils import escape, quoteattr
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Q
+from django.template.defaultfilters import slugify
+from django.utils import simplejson
+from django.utils.encoding import smart_str
+from django.utils.feedgenerator import rfc2822_date
+from tagging.models import Tag, TaggedItem
+from tagging.utils import parse_tag_input
+from template_utils.markup import formatter
+
+from coltrane import archive, category_counts, featured, feeds, neighbors
+from coltrane import page_cache, related, search, sitemaps, tag_counts
+from coltrane.models import Category, Entry, Link
+from coltrane.rendering import CACHE_TIMEOUT, cache_key
+
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+
+BATCH_SIZE = 500
+
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'
+WXR_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+STATUS_NAMES = {
+    Entry.LIVE_STATUS: 'live',
+    Entry.DRAFT_STATUS: 'draft',
+    Entry.HIDDEN_STATUS: 'hidden',
+    }
+STATUSES = dict([(name, status) for status, name in STATUS_NAMES.items()])
+
+# WordPress post statuses, and the closest equivalent of each Entry
+# status.
+WXR_STATUSES = {
+    'publish': Entry.LIVE_STATUS,
+    'draft': Entry.DRAFT_STATUS,
+    'pending': Entry.DRAFT_STATUS,
+    'future': Entry.DRAFT_STATUS,
+    'private': Entry.HIDDEN_STATUS,
+    }
+WXR_STATUS_NAMES = {
+    Entry.LIVE_STATUS: 'publish',
+    Entry.DRAFT_STATUS: 'draft',
+    Entry.HIDDEN_STATUS: 'private',
+    }
+
+WXR_NAMESPACE_PREFIX = 'http://wordpress.org/export/'
+CONTENT_NAMESPACE = 'http://purl.org/rss/1.0/modules/content/'
+
+WXR_HEADER = u"""<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"
+  xmlns:excerpt="http://wordpress.org/export/1.0/excerpt/"
+  xmlns:content="http://purl.org/rss/1.0/modules/content/"
+  xmlns:dc="http://purl.org/dc/elements/1.1/"
+  xmlns:wp="http://wordpress.org/export/1.0/">
+<channel>
+<title>%(title)s</title>
+<link>%(link)s</link>
+<wp:wxr_version>1.0</wp:wxr_version>
+"""
+WXR_FOOTER = u"""</channel>
+</rss>
+"""
+
+# (source field, HTML field) pairs rendered for each model. As in the
+# models' ``save()`` methods, an empty optional source leaves its HTML
+# untouched.
+MARKUP_FIELDS = (
+    (Category, (('description', 'description_html'),)),
+    (Entry, (('body', 'body_html'), ('excerpt', 'excerpt_html'))),
+    (Link, (('description', 'description_html'),)),
+    )
+
+
+def _keyset_batches(queryset, fields, batch_size):
+    """
+    Yields the ``values_list(*fields)`` rows of ``queryset`` in lists
+    of ``batch_size``, in order of id, which must be the first field.
+    
+    Each batch is a separate query starting after the last id of the
+    one before, so no more than one batch is ever held in memory.
+    
+    """
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(pk__gt=last_id).order_by('id').values_list(*fields)[:batch_size])
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+def _format_date(date):
+    return date.strftime(DATE_FORMAT)
+
+def _parse_date(value):
+    return datetime.datetime.strptime(value[:19], DATE_FORMAT)
+
+def _tag_names(tags):
+    names = parse_tag_input(tags or u'')
+    if getattr(settings, 'FORCE_LOWERCASE_TAGS', False):
+        names = [name.lower() for name in names]
+    return names
+
+def _tag_string(names):
+    """
+    Joins tag names into a string ``parse_tag_input()`` splits back
+    into the same names.
+    
+    """
+    if not [name for name in names if ' ' in name or ',' in name]:
+        return u' '.join(names)
+    return u', '.join([',' in name and u'"%s"' % name or name for name in names])
+
+
+# Rendering.
+
+def _render(text):
+    if not text:
+        return None
+    return cache_key(text), formatter(text)
+
+def render_batch(rows):
+    """
+    Renders the source fields of a batch of ``(id, source, ...)``
+    rows, returning ``(id, rendered, ...)`` rows in which each
+    rendered field is a ``(cache key, HTML)`` pair, or ``None`` for an
+    empty source.
+    
+    Runs in the worker processes, so it must not touch the database.
+    
+    """
+    return [(row[0],) + tuple([_render(text) for text in row[1:]]) for row in rows]
+
+def _write_markup(model, fields, rendered):
+    """
+    Writes a batch of rendered HTML back with one ``executemany``
+    per field, bypassing ``save()``, and primes the render cache
+    with it.
+    
+    """
+    qn = connection.ops.quote_name
+    cursor = connection.cursor()
+    for i, (source_field, html_field) in enumerate(fields):
+        results = [(row[0], row[i + 1]) for row in rendered if row[i + 1] is not None]
+        if not results:
+            continue
+        cursor.executemany('UPDATE %s SET %s = %%s WHERE %s = %%s' % \
+                           (qn(model._meta.db_table),
+                            qn(model._meta.get_field(html_field).column),
+                            qn(model._meta.pk.column)),
+                           [(html, id) for id, (key, html) in results])
+        for id, (key, html) in results:
+            cache.set(key, html, CACHE_TIMEOUT)
+_write_markup = transaction.commit_on_success(_write_markup)
+
+def get_pool(processes=None):
+    """
+    Returns a pool of ``processes`` worker processes (by default, one
+    per CPU) for ``render_markup()``, or ``None`` if
+    ``multiprocessing`` isn't available or only one process is asked
+    for. The caller closes it.
+    
+    """
+    if multiprocessing is None or processes == 1:
+        return None
+    return multiprocessing.Pool(processes)
+
+def render_markup(model, pool=None, batch_size=100, unrendered=False):
+    """
+    Regenerates the stored HTML of every object of ``model`` from its
+    source text, or only of those whose HTML is empty if
+    ``unrendered`` is ``True``, and returns how many were rendered.
+    
+    The text is rendered by the worker processes of ``pool``, if
+    given, a batch at a time, and written back without saving; since
+    no signal says the HTML changed, every cache which holds it (the
+    feed items, the featured Entries and the page cache) is dropped
+    afterwards.
+    
+    """
+    fields = dict(MARKUP_FIELDS)[model]
+    queryset = model._default_manager.all()
+    if unrendered:
+        html_field = fields[0][1]
+        queryset = queryset.filter(Q(**{ html_field: '' }) | Q(**{ '%s__isnull' % html_field: True }))
+    batches = _keyset_batches(queryset, ['id'] + [source for source, html in fields], batch_size)
+    if pool is None:
+        results = (render_batch(batch) for batch in batches)
+    else:
+        results = pool.imap(render_batch, batches)
+    count = 0
+    for rendered in results:
+        _write_markup(model, fields, rendered)
+        count += len(rendered)
+    if count:
+        feeds.invalidate_all()
+        featured.invalidate_all()
+        page_cache.purge_all()
+    return count
+
+
+# Export.
+
+def _entry_categories(entry_ids):
+    """
+    Returns a dictionary mapping each of ``entry_ids`` to the ids of
+    its Categories.
+    
+    """
+    result = {}
+    if not entry_ids:
+        return result
+    qn = connection.ops.quote_name
+    field = Entry._meta.get_field('categories')
+    cursor = connection.cursor()
+    cursor.execute('SELECT %s, %s FROM %s WHERE %s IN (%s)' % \
+                   (qn(field.m2m_column_name()), qn(field.m2m_reverse_name()),
+                    qn(field.m2m_db_table()), qn(field.m2m_column_name()),
+                    ', '.join(['%s'] * len(entry_ids))),
+                   entry_ids)
+    for entry_id, category_id in cursor.fetchall():
+        result.setdefault(entry_id, []).append(category_id)
+    return result
+
+def _usernames(user_ids, known):
+    """
+    Adds the usernames of any of ``user_ids`` missing from ``known``,
+    a dictionary from user id to username, to it.
+    
+    """
+    missing = [id for id in set(user_ids) if id not in known]
+    if missing:
+        known.update(dict(User.objects.filter(pk__in=missing).values_list('id', 'username')))
+    return known
+
+def export_records(batch_size=BATCH_SIZE):
+    """
+    Yields a record for every Category, then every Entry, then every
+    Link, reading ``batch_size`` objects at a time.
+    
+    """
+    category_slugs = {}
+    for batch in _keyset_batches(Category.objects.all(), ('id', 'title', 'slug', 'description'), batch_size):
+        for id, title, slug, description in batch:
+            category_slugs[id] = slug
+            yield { 'type': 'category', 'title': title, 'slug': slug, 'description': description }
+    usernames = {}
+    entry_fields = ('id', 'author', 'title', 'slug', 'pub_date', 'status', 'featured',
+                    'enable_comments', 'excerpt', 'body', 'tags')
+    for batch in _keyset_batches(Entry.objects.all(), entry_fields, batch_size):
+        categories = _entry_categories([row[0] for row in batch])
+        _usernames([row[1] for row in batch], usernames)
+        for id, author_id, title, slug, pub_date, status, is_featured, enable_comments, excerpt, body, tags in batch:
+            yield { 'type': 'entry', 'author': usernames.get(author_id), 'title': title, 'slug': slug,
+                    'pub_date': _format_date(pub_date), 'status': STATUS_NAMES.get(status, 'draft'),
+                    'featured': is_featured, 'enable_comments': enable_comments,
+                    'excerpt': excerpt, 'body': body, 'tags': tags,
+                    'categories': [category_slugs[category_id] for category_id in categories.get(id, [])
+                                   if category_id in category_slugs] }
+    link_fields = ('id', 'posted_by', 'title', 'slug', 'pub_date', 'url', 'description',
+                   'via_name', 'via_url', 'tags', 'enable_comments', 'post_elsewhere')
+    for batch in _keyset_batches(Link.objects.all(), link_fields, batch_size):
+        _usernames([row[1] for row in batch], usernames)
+        for id, posted_by_id, title, slug, pub_date, url, description, via_name, via_url, tags, enable_comments, post_elsewhere in batch:
+            yield { 'type': 'link', 'posted_by': usernames.get(posted_by_id), 'title': title, 'slug': slug,
+                    'pub_date': _format_date(pub_date), 'url': url, 'description': description,
+                    'via_name': via_name, 'via_url': via_url, 'tags': tags,
+                    'enable_comments': enable_comments, 'post_elsewhere': post_elsewhere }
+
+def write_jsonl(records, stream):
+    """
+    Writes ``records`` to ``stream``, one JSON object per line.
+    
+    """
+    for record in records:
+        stream.write(simplejson.dumps(record))
+        stream.write('\n')
+
+def read_jsonl(stream):
+    """
+    Yields the records read from ``stream``, one JSON object per line.
+    
+    """
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield simplejson.loads(line)
+
+def _element(name, text, attributes=u''):
+    return u'<%s%s>%s</%s>\n' % (name, attributes, escape(text or u''), name)
+
+def write_wxr(records, stream):
+    """
+    Writes the Category and Entry ``records`` to ``stream`` as a
+    WordPress WXR file; Link records are left out.
+    
+    Categories must come before the Entries in them, as they do from
+    ``export_records()``.
+    
+    """
+    site = Site.objects.get_current()
+    stream.write(smart_str(WXR_HEADER % { 'title': escape(site.name),
+                                          'link': escape('http://%s/' % site.domain) }))
+    category_titles = {}
+    for record in records:
+        if record['type'] == 'category':
+            category_titles[record['slug']] = record['title']
+            output = [u'<wp:category>\n',
+                      _element('wp:category_nicename', record['slug']),
+                      _element('wp:category_parent', u''),
+                      _element('wp:cat_name', record['title']),
+                      _element('wp:category_description', record['description']),
+                      u'</wp:category>\n']
+        elif record['type'] == 'entry':
+            pub_date = _parse_date(record['pub_date'])
+            status = STATUSES.get(record['status'], Entry.DRAFT_STATUS)
+            output = [u'<item>\n',
+                      _element('title', record['title']),
+                      _element('pubDate', rfc2822_date(pub_date)),
+                      _element('dc:creator', record['author'])]
+            for slug in record['categories']:
+                output.append(_element('category', category_titles.get(slug, slug),
+                                       u' domain="category" nicename=%s' % quoteattr(slug)))
+            for name in _tag_names(record['tags']):
+                output.append(_element('category', name,
+                                       u' domain="post_tag" nicename=%s' % quoteattr(slugify(name))))
+            output.extend([_element('content:encoded', record['body']),
+                           _element('excerpt:encoded', record['excerpt']),
+                           _element('wp:post_date', pub_date.strftime(WXR_DATE_FORMAT)),
+                           _element('wp:comment_status', record['enable_comments'] and u'open' or u'closed'),
+                           _element('wp:post_name', record['slug']),
+                           _element('wp:status', WXR_STATUS_NAMES[status]),
+                           _element('wp:post_type', u'post'),
+                           _element('wp:is_sticky', record['featured'] and u'1' or u'0'),
+                           u'</item>\n'])
+        else:
+            continue
+        stream.write(smart_str(u''.join(output)))
+    stream.write(smart_str(WXR_FOOTER))
+
+
+# Import.
+
+def _split_tag(tag):
+    """
+    Splits an ElementTree tag into its namespace and local name.
+    
+    """
+    if tag.startswith('{'):
+        return tuple(tag[1:].split('}', 1))
+    return '', tag
+
+def _wxr_values(element):
+    """
+    Returns a dictionary mapping the local names of ``element``'s
+    children to their text, calling the body 'content' and the
+    excerpt 'excerpt'.
+    
+    """
+    values = {}
+    for child in element:
+        namespace, name = _split_tag(child.tag)
+        if namespace.startswith(WXR_NAMESPACE_PREFIX) and namespace.endswith('/excerpt/'):
+            name = 'excerpt'
+        elif namespace == CONTENT_NAMESPACE:
+            name = 'content'
+        if name not in values:
+            values[name] = child.text or u''
+    return values
+
+def _wxr_entry(element):
+    """
+    Returns the record of the Entry an ``item`` element of a WXR file
+    describes, or ``None`` if it isn't a post.
+    
+    """
+    values = _wxr_values(element)
+    if values.get('post_type', 'post') != 'post':
+        return None
+    try:
+        pub_date = datetime.datetime.strptime(values.get('post_date', ''), WXR_DATE_FORMAT)
+    except ValueError:
+        # Drafts which were never published have no date.
+        pub_date = datetime.datetime.now()
+    categories, tags = [], []
+    for child in element.findall('category'):
+        domain = child.get('domain')
+        nicename = child.get('nicename') or slugify(child.text or u'')
+        if domain in ('post_tag', 'tag'):
+            if child.text and child.text not in tags:
+                tags.append(child.text)
+        elif domain in (None, 'category') and nicename and nicename not in categories:
+            categories.append(nicename)
+    title = values.get('title', u'')
+    return { 'type': 'entry', 'author': values.get('creator'), 'title': title[:250],
+             'slug': (values.get('post_name') or slugify(title))[:100],
+             'pub_date': _format_date(pub_date),
+             'status': STATUS_NAMES[WXR_STATUSES.get(values.get('status'), Entry.DRAFT_STATUS)],
+             'featured': values.get('is_sticky') == '1',
+             'enable_comments': values.get('comment_status', 'open') == 'open',
+             'excerpt': values.get('excerpt') or None, 'body': values.get('content', u''),
+             'tags': _tag_string(tags), 'categories': categories }
+
+def read_wxr(stream):
+    """
+    Yields the records of the Categories and posts in the WordPress
+    WXR file ``stream``, discarding each element once read.
+    
+    """
+    channel = None
+    for event, element in ElementTree.iterparse(stream, events=('start', 'end')):
+        namespace, name = _split_tag(element.tag)
+        if event == 'start':
+            if name == 'channel' and channel is None:
+                channel = element
+            continue
+        if name == 'category' and namespace.startswith(WXR_NAMESPACE_PREFIX):
+            values = _wxr_values(element)
+            title = values.get('cat_name', u'')
+            yield { 'type': 'category', 'title': title,
+                    'slug': values.get('category_nicename') or slugify(title),
+                    'description': values.get('category_description', u'') }
+        elif name == 'item' and not namespace:
+            record = _wxr_entry(element)
+            if record is not None:
+                yield record
+        else:
+            continue
+        if channel is not None:
+            channel.clear()
+
+def _insert(model, field_names, rows):
+    """
+    Inserts ``rows`` of values of the fields ``field_names`` into
+    ``model``'s table with one ``executemany``.
+    
+    """
+    if not rows:
+        return
+    qn = connection.ops.quote_name
+    fields = [model._meta.get_field(name) for name in field_names]
+    connection.cursor().executemany('INSERT INTO %s (%s) VALUES (%s)' % \
+                                    (qn(model._meta.db_table),
+                                     ', '.join([qn(field.column) for field in fields]),
+                                     ', '.join(['%s'] * len(fields))),
+                                    [[field.get_db_prep_save(value) for field, value in zip(fields, row)]
+                                     for row in rows])
+
+
+class Importer(object):
+    """
+    Imports records, inserting them ``batch_size`` at a time.
+    
+    Pass each record to ``add()`` in turn, then call ``finish()``.
+    Entries and Links whose user doesn't exist are credited to
+    ``default_user``, if given; otherwise they raise ``ValueError``,
+    as does a record of an unknown type.
+    
+    """
+    def __init__(self, default_user=None, batch_size=BATCH_SIZE):
+        self.default_user = default_user
+        self.batch_size = batch_size
+        self.pending = { 'category': [], 'entry': [], 'link': [] }
+        self.counts = { 'categories': 0, 'entries': 0, 'links': 0, 'skipped': 0 }
+        self.first_ids = {}
+        for model in (Entry, Link):
+            last_ids = list(model._default_manager.order_by('-id').values_list('id', flat=True)[:1])
+            self.first_ids[model] = (last_ids and last_ids[0] or 0) + 1
+        self.category_ids = dict(Category.objects.values_list('slug', 'id'))
+        self.user_ids = {}
+        self.tag_ids = {}
+        # What ``finish()`` needs to bring up to date.
+        self.tag_names = { Entry: set(), Link: set() }
+        self.months = { Entry: set(), Link: set() }
+        self.entry_category_ids = set()
+    
+    def add(self, record):
+        kind = record.get('type')
+        if kind not in self.pending:
+            raise ValueError("Unknown record type: %r" % kind)
+        self.pending[kind].append(record)
+        if len(self.pending[kind]) >= self.batch_size:
+            self.flush(kind)
+    
+    def flush(self, kind):
+        """
+        Inserts the pending records of type ``kind``.
+        
+        """
+        records, self.pending[kind] = self.pending[kind], []
+        if not records:
+            return
+        if kind == 'category':
+            self._insert_categories(records)
+        elif kind == 'entry':
+            # Entries may be in Categories which are still pending.
+            self.flush('category')
+            self._insert_entries(records)
+        else:
+            self._insert_links(records)
+    
+    def _user_id(self, username):
+        if username not in self.user_ids:
+            ids = list(User.objects.filter(username=username).values_list('id', flat=True))
+            if ids:
+                self.user_ids[username] = ids[0]
+            elif self.default_user is not None:
+                self.user_ids[username] = self.default_user.id
+            else:
+                raise ValueError("There is no user named %r." % username)
+        return self.user_ids[username]
+    
+    def _tag_id(self, name):
+        if name not in self.tag_ids:
+            self.tag_ids[name] = Tag.objects.get_or_create(name=name)[0].id
+        return self.tag_ids[name]
+    
+    def _insert_tags(self, model, tagged):
+        """
+        Tags the objects of ``model`` with the ids and tag strings in
+        the pairs ``tagged``.
+        
+        """
+        content_type_id = ContentType.objects.get_for_model(model).id
+        rows = []
+        for object_id, tags in tagged:
+            names = set(_tag_names(tags))
+            self.tag_names[model].update(names)
+            rows.extend([(self._tag_id(name), content_type_id, object_id) for name in names])
+        _insert(TaggedItem, ('tag', 'content_type', 'object_id'), rows)
+    
+    def _insert_categories(self, records):
+        rows = []
+        for record in records:
+            if record['slug'] in self.category_ids:
+                self.counts['skipped'] += 1
+                continue
+            self.category_ids[record['slug']] = None
+            rows.append((record.get('title') or record['slug'], record['slug'],
+                         record.get('description') or u'', u''))
+        _insert(Category, ('title', 'slug', 'description', 'description_html'), rows)
+        self.category_ids.update(dict(Category.objects.filter(slug__in=[row[1] for row in rows]).values_list('slug', 'id')))
+        self.counts['categories'] += len(rows)
+    _insert_categories = transaction.commit_on_success(_insert_categories)
+    
+    def _insert_entries(self, records):
+        slugs = list(set([record['slug'] for record in records]))
+        existing = set([(slug, pub_date.date()) for slug, pub_date in
+                        Entry.objects.filter(slug__in=slugs).values_list('slug', 'pub_date')])
+        new = []
+        for record in records:
+            pub_date = _parse_date(record['pub_date'])
+            if (record['slug'], pub_date.date()) in existing:
+                self.counts['skipped'] += 1
+                continue
+            existing.add((record['slug'], pub_date.date()))
+            new.append((record, pub_date))
+        missing = set()
+        for record, pub_date in new:
+            missing.update([slug for slug in record.get('categories', []) if slug not in self.category_ids])
+        if missing:
+            self._insert_categories([{ 'slug': slug } for slug in missing])
+        _insert(Entry,
+                ('author', 'title', 'slug', 'pub_date', 'status', 'featured', 'enable_comments',
+                 'excerpt', 'body', 'body_html', 'tags', 'comment_count'),
+                [(self._user_id(record.get('author')), record['title'], record['slug'], pub_date,
+                  STATUSES.get(record.get('status'), Entry.DRAFT_STATUS), record.get('featured', False),
+                  record.get('enable_comments', True), record.get('excerpt') or None,
+                  record.get('body') or u'', u'', record.get('tags') or u'', 0)
+                 for record, pub_date in new])
+        ids = {}
+        for id, slug, pub_date in Entry.objects.filter(slug__in=[record['slug'] for record, pub_date in new],
+                                                       pk__gte=self.first_ids[Entry]).values_list('id', 'slug', 'pub_date'):
+            ids[(slug, pub_date.date())] = id
+        category_rows = []
+        tagged = []
+        for record, pub_date in new:
+            id = ids[(record['slug'], pub_date.date())]
+            category_ids = set([self.category_ids[slug] for slug in record.get('categories', [])])
+            category_rows.extend([(id, category_id) for category_id in category_ids])
+            self.entry_category_ids.update(category_ids)
+            tagged.append((id, record.get('tags')))
+            self.months[Entry].add(pub_date.date().replace(day=1))
+        if category_rows:
+            qn = connection.ops.quote_name
+            field = Entry._meta.get_field('categories')
+            connection.cursor().executemany('INSERT INTO %s (%s, %s) VALUES (%%s, %%s)' % \
+                                            (qn(field.m2m_db_table()),
+                                             qn(field.m2m_column_name()),
+                                             qn(field.m2m_reverse_name())),
+                                            category_rows)
+        self._insert_tags(Entry, tagged)
+        self.counts['entries'] += len(new)
+    _insert_entries = transaction.commit_on_success(_insert_entries)
+    
+    def _insert_links(self, records):
+        existing = set(Link.objects.filter(url__in=[record['url'] for record in records]).values_list('url', flat=True))
+        new = []
+        for record in records:
+            if record['url'] in existing:
+                self.counts['skipped'] += 1
+                continue
+            existing.add(record['url'])
+            new.append((record, _parse_date(record['pub_date'])))
+        # ``post_elsewhere`` is stored as given, but nothing is queued
+        # for posting; that only happens in ``Link.save()``.
+        _insert(Link,
+                ('posted_by', 'title', 'slug', 'pub_date', 'url', 'description', 'via_name', 'via_url',
+                 'tags', 'enable_comments', 'post_elsewhere', 'comment_count'),
+                [(self._user_id(record.get('posted_by')), record['title'], record['slug'], pub_date,
+                  record['url'], record.get('description') or None, record.get('via_name') or None,
+                  record.get('via_url') or None, record.get('tags') or u'',
+                  record.get('enable_comments', True), record.get('post_elsewhere', False), 0)
+                 for record, pub_date in new])
+        ids = dict(Link.objects.filter(url__in=[record['url'] for record, pub_date in new]).values_list('url', 'id'))
+        self._insert_tags(Link, [(ids[record['url']], record.get('tags')) for record, pub_date in new])
+        for record, pub_date in new:
+            self.months[Link].add(pub_date.date().replace(day=1))
+        self.counts['links'] += len(new)
+    _insert_links = transaction.commit_on_success(_insert_links)
+    
+    def finish(self, processes=None, flush=True):
+        """
+        Inserts any records still pending (or drops them, if
+        ``flush`` is ``False``), renders the markup of the imported
+        objects using ``processes`` worker processes, brings
+        everything derived from them up to date, and returns the
+        number of objects imported and skipped.
+        
+        """
+        for kind in ('category', 'entry', 'link'):
+            if flush:
+                self.flush(kind)
+            else:
+                self.pending[kind] = []
+        pool = get_pool(processes)
+        try:
+            for model, fields in MARKUP_FIELDS:
+                render_markup(model, pool, unrendered=True)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        self._refresh()
+        return self.counts
+    
+    def _refresh(self):
+        """
+        Updates the indexes, counts and caches the imported objects'
+        signals would have.
+        
+        """
+        for model in (Entry, Link):
+            queryset = model._default_manager.filter(pk__gte=self.first_ids[model])
+            for batch in _keyset_batches(queryset, ('id',), self.batch_size):
+                for obj in model._default_manager.filter(pk__in=[row[0] for row in batch]):
+                    search.index(obj)
+            for name in self.tag_names[model]:
+                tag_counts.refresh(model, name)
+            sitemaps.bump_dates(model, self.months[model])
+        archive.rebuild_all()
+        if self.entry_category_ids:
+            category_counts.refresh(self.entry_category_ids)
+        if self.counts['entries']:
+            related.rebuild()
+            neighbors.invalidate_all()
+            featured.invalidate_all()
+        page_cache.purge_all()
+    _refresh = transaction.commit_on_success(_refresh)
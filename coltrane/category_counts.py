@@ -0,0 +1,84 @@
+"""
+Maintenance of the stored number of live Entries in each Category and
+the date of the latest one.
+
+A Category's ``live_entry_count`` and ``last_entry_date`` are
+recalculated whenever an Entry in it is saved or deleted, published or
+unpublished, re-dated, or moved into or out of it (see
+``coltrane.signals``), so that a list of Categories with those figures
+is a plain read of the Category table. Only Entries whose publication
+time has passed are counted, as only they are shown; the
+``publish_scheduled`` management command recalculates the Categories
+of Entries whose time came in the last few hours, and
+``rebuild_category_counts`` recalculates them all.
+
+"""
+
+from django.db.backends.util import typecast_timestamp
+from django.db.models import signals
+
+from coltrane.models import Category, Entry
+from coltrane.signals import entry_categories_changed, entry_categories_changing
+
+
+def refresh(category_ids=None):
+    """
+    Recalculates the stored figures of the Categories with the given
+    ids, or of every Category, in one query.
+    
+    """
+    qs = Category.objects.with_live_entry_stats()
+    if category_ids is not None:
+        qs = qs.filter(pk__in=list(category_ids))
+    for category in qs:
+        last_entry_date = category.current_last_entry_date
+        if isinstance(last_entry_date, basestring):
+            last_entry_date = typecast_timestamp(last_entry_date)
+        if category.live_entry_count != category.current_entry_count or \
+           category.last_entry_date != last_entry_date:
+            Category.objects.filter(pk=category.id).update(live_entry_count=category.current_entry_count,
+                                                           last_entry_date=last_entry_date)
+
+def _state(entry):
+    """
+    Returns the ``(pub_date, is_live, category_ids)`` stored for
+    ``entry``.
+    
+    """
+    try:
+        stored = Entry.objects.get(pk=entry.id)
+    except Entry.DoesNotExist:
+        return None
+    return (stored.pub_date,
+            stored.status == Entry.LIVE_STATUS,
+            set(stored.categories.values_list('id', flat=True)))
+
+def capture_state(sender, instance, **kwargs):
+    instance._category_count_state = instance.id and _state(instance) or None
+
+def update_counts(sender, instance, **kwargs):
+    """
+    Recalculates the Categories an Entry was in before it was saved,
+    deleted or recategorized, and those it is in now, if it was or is
+    live and anything about it changed.
+    
+    """
+    old = getattr(instance, '_category_count_state', None)
+    new = instance.id and _state(instance) or None
+    instance._category_count_state = new
+    if old == new or not [state for state in (old, new) if state is not None and state[1]]:
+        return
+    category_ids = set()
+    for state in (old, new):
+        if state is not None:
+            category_ids.update(state[2])
+    if category_ids:
+        refresh(category_ids)
+
+
+signals.pre_save.connect(capture_state, sender=Entry)
+signals.post_save.connect(update_counts, sender=Entry)
+signals.pre_delete.connect(capture_state, sender=Entry)
+signals.post_delete.connect(update_counts, sender=Entry)
+entry_categories_changing.connect(capture_state, sender=Entry)
+entry_categories_changed.connect(update_counts, sender=Entry)
@@ -0,0 +1,273 @@
+"""
+Export of the weblog's public pages as static files.
+
+``pages()`` lists the path of every page served by the URLconfs in
+``coltrane.urls.entries``, ``coltrane.urls.links`` and
+``coltrane.urls.categories`` (as far as they are included in the
+project's URLconf), together with the ``coltrane.page_cache`` tags the
+page depends on. ``export()`` renders them through the full request
+handler in a pool of worker processes and writes each to
+``<path>/index.html`` under the output directory.
+
+A manifest in the output directory records the version digest of
+every exported page (see ``page_cache.page_version``), so that a
+re-run only renders the pages whose tags have been purged since --
+that is, the pages affected by the Entries, Links, Categories and
+comments changed in between. This needs tag versions to be maintained
+(set ``COLTRANE_STATIC_EXPORT = True`` if neither the page cache nor
+conditional GET is enabled) in a cache shared with the processes that
+save the content, such as the file or memcached backends; when a
+version is missing, the page is simply rendered again. If tag versions
+aren't maintained at all, every export renders every page.
+
+A static file can't be chosen by a query string, so only the first
+page of each paged list is exported. The export's requests carry a
+header (``page_cache.STATIC_EXPORT_HEADER``) for which the views leave
+out their links to further pages, and the tag archives and offset-paged
+Category pages put all their objects on the one page; every Entry and
+Link is still reached through the date archives, which aren't paged.
+Responses to these requests are never put in the page cache.
+
+Pages whose URL can't be built are skipped and reported, rather than
+ending their whole section. So are the pages of tags whose names
+aren't plain words and hyphens: a name with '+' or ',' in its URL
+would be read as a query for several tags, and one with spaces, dots
+or other punctuation doesn't match the tag URL patterns at all.
+
+"""
+
+import datetime
+import os
+import re
+import sys
+
+from django.core.urlresolvers import NoReverseMatch, reverse
+from django.db import connection
+from django.test.client import Client
+from django.utils import simplejson
+
+from coltrane import page_cache
+from coltrane.archive import get_buckets
+from coltrane.models import Category, Entry, Link, TagCount
+
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+
+MANIFEST_NAME = '.coltrane-manifest.json'
+
+CATEGORY_KEYS = ('slug', 'year', 'month', 'day')
+
+# Tag names which stand for just that one tag in a tag page's URL.
+TAG_NAME_RE = re.compile(r'^[-\w]+$', re.UNICODE)
+
+
+def date_kwargs(year, month=0, day=0, slug=None):
+    """
+    Returns the URL keyword arguments of the date archive page of the
+    given year, month and day (as far as given), or of the detail page
+    of ``slug`` on that day.
+    
+    """
+    kwargs = { 'year': str(year) }
+    if month:
+        kwargs['month'] = datetime.date(year, month, 1).strftime('%b').lower()
+    if day:
+        kwargs['day'] = '%02d' % day
+    if slug is not None:
+        kwargs['slug'] = slug
+    return kwargs
+
+def _date_pages(model, queryset):
+    """
+    Yields the archive and detail pages of ``model``, whose URL names
+    and page tags are both derived from its name ('entry' or 'link').
+    
+    """
+    name = model._meta.module_name
+    yield 'coltrane_%s_archive_index' % name, {}, page_cache.page_tags(name, {})
+    for year, month, day in get_buckets(model).filter(count__gt=0).values_list('year', 'month', 'day').iterator():
+        kwargs = date_kwargs(year, month, day)
+        route = day and 'day' or month and 'month' or 'year'
+        yield 'coltrane_%s_archive_%s' % (name, route), kwargs, page_cache.page_tags(name, kwargs)
+    for pub_date, slug in queryset.values_list('pub_date', 'slug').iterator():
+        kwargs = date_kwargs(pub_date.year, pub_date.month, pub_date.day, slug)
+        yield 'coltrane_%s_detail' % name, kwargs, page_cache.page_tags(name, kwargs)
+
+def _tag_pages(model):
+    """
+    Yields the tag pages of ``model``, whose URL names and page tags
+    are both derived from its name ('entry' or 'link').
+    
+    """
+    name = model._meta.module_name
+    yield 'coltrane_%s_tag_archive' % name, {}, page_cache.page_tags('%s_tags' % name, {})
+    yield 'coltrane_%s_tag_cloud' % name, {}, page_cache.page_tags('%s_tags' % name, {})
+    for tag in TagCount.objects.for_model(model).values_list('name', flat=True).iterator():
+        kwargs = { 'tag': tag }
+        yield 'coltrane_%s_tag_detail' % name, kwargs, \
+              page_cache.page_tags('%s_tag' % name, kwargs, split_key='tag')
+
+def _category_pages():
+    yield 'coltrane_category_list', {}, page_cache.page_tags('categories', {})
+    for slug in Category.objects.values_list('slug', flat=True).iterator():
+        kwargs = { 'slug': slug }
+        yield 'coltrane_category_detail', kwargs, \
+              page_cache.page_tags('category', kwargs, CATEGORY_KEYS, ('slug',))
+
+def pages(skipped=None):
+    """
+    Yields a ``(path, tags)`` pair for every exportable page.
+    
+    Sections whose URLconf isn't included in the project's are left
+    out. The ``(URL name, keyword arguments)`` of any other page which
+    can't be exported is appended to ``skipped``, if given.
+    
+    """
+    for section in (_date_pages(Entry, Entry.live.all()),
+                    _date_pages(Link, Link.objects.all()),
+                    _tag_pages(Entry),
+                    _tag_pages(Link),
+                    _category_pages()):
+        first = True
+        for url_name, kwargs, tags in section:
+            if 'tag' in kwargs and not TAG_NAME_RE.match(kwargs['tag']):
+                path = None
+            else:
+                try:
+                    path = reverse(url_name, kwargs=kwargs)
+                except NoReverseMatch:
+                    path = None
+            if path is None:
+                # The first page of each section is its index, which
+                # can always be reversed if the section is included.
+                if first:
+                    break
+                if skipped is not None:
+                    skipped.append((url_name, kwargs))
+                continue
+            first = False
+            yield path, tags
+
+def _filename(output_dir, path):
+    return os.path.join(output_dir, *(path.strip('/').split('/') + ['index.html']))
+
+
+_client = None
+
+def _init_client():
+    global _client
+    _client = Client(**{ page_cache.STATIC_EXPORT_HEADER: '1' })
+
+def _init_worker():
+    """
+    Prepares a process for rendering pages, giving it its own database
+    connection rather than one inherited from the parent.
+    
+    """
+    connection.close()
+    _init_client()
+
+def render_page(task):
+    """
+    Renders the page at ``path`` and writes it under ``output_dir``,
+    returning the ``path``, the response's status code and, if the
+    page couldn't be rendered or written, a description of the error
+    (with ``None`` for the status code if there was no response).
+    
+    An error is returned rather than raised, so that one broken page
+    doesn't end the whole export.
+    
+    """
+    path, output_dir = task
+    status_code = None
+    try:
+        response = _client.get(path)
+        status_code = response.status_code
+        if status_code == 200:
+            filename = _filename(output_dir, path)
+            if not os.path.isdir(os.path.dirname(filename)):
+                os.makedirs(os.path.dirname(filename))
+            f = open(filename, 'wb')
+            try:
+                f.write(response.content)
+            finally:
+                f.close()
+    except Exception:
+        exc_type, exc_value = sys.exc_info()[:2]
+        return path, status_code, '%s: %s' % (exc_type.__name__, exc_value)
+    return path, status_code, None
+
+def export(output_dir, processes=None, force=False, skipped=None, failed=None):
+    """
+    Exports every page changed since the last export to
+    ``output_dir`` (or every page, if ``force`` is ``True`` or tag
+    versions aren't maintained), and deletes the files of pages which
+    no longer exist.
+    
+    Returns a dictionary counting the pages which were ``rendered``,
+    ``unchanged``, ``removed``, ``failed`` and ``skipped``; the
+    skipped pages are appended to ``skipped``, if given, as by
+    ``pages()``, and a ``(path, reason)`` pair for each failed page
+    to ``failed``. Failed pages are tried again by the next export.
+    
+    The manifest is written even if the export is cut short, so that
+    the pages exported by then aren't rendered again.
+    
+    """
+    if skipped is None:
+        skipped = []
+    if failed is None:
+        failed = []
+    # Without maintained tag versions, a page's digest never changes
+    # whatever happens to its content.
+    force = force or not page_cache.ENABLED
+    manifest_name = os.path.join(output_dir, MANIFEST_NAME)
+    manifest = {}
+    if os.path.exists(manifest_name):
+        manifest = simplejson.load(open(manifest_name))
+    digests = {}
+    for path, tags in pages(skipped):
+        digests[path] = page_cache.page_version(path, tags)[0]
+    # The old manifest is still read when forced, so that the files of
+    # pages which no longer exist are deleted.
+    new_manifest = dict([(path, digest) for path, digest in digests.items()
+                         if not force and manifest.get(path) == digest and os.path.exists(_filename(output_dir, path))])
+    tasks = [(path, output_dir) for path in digests if path not in new_manifest]
+    counts = { 'rendered': 0, 'unchanged': len(digests) - len(tasks), 'removed': 0, 'failed': 0,
+               'skipped': len(skipped) }
+    
+    try:
+        if multiprocessing is not None and processes != 1:
+            connection.close()
+            pool = multiprocessing.Pool(processes, _init_worker)
+            results = pool.imap_unordered(render_page, tasks, 10)
+        else:
+            pool = None
+            _init_client()
+            results = (render_page(task) for task in tasks)
+        try:
+            for path, status_code, error in results:
+                if status_code == 200 and error is None:
+                    new_manifest[path] = digests[path]
+                    counts['rendered'] += 1
+                else:
+                    counts['failed'] += 1
+                    failed.append((path, error or 'status %s' % status_code))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+    finally:
+        for path in manifest:
+            if path not in digests and os.path.exists(_filename(output_dir, path)):
+                os.remove(_filename(output_dir, path))
+                counts['removed'] += 1
+        f = open(manifest_name, 'w')
+        try:
+            simplejson.dump(new_manifest, f)
+        finally:
+            f.close()
+    return counts
@@ -0,0 +1,122 @@
+"""
+Cached lists of the latest featured Entries.
+
+Featured Entries are typically shown in a site's base template, so the
+list of them is kept in the cache rather than queried on every page,
+and remembered for the rest of the request once read, so that showing
+it several times on a page costs nothing more.
+
+The list is dropped whenever a featured Entry is saved or deleted, or
+an Entry's ``featured`` flag or status changes, and by
+``invalidate_all()`` when Entries change without sending signals. Only the latest
+``COLTRANE_FEATURED_CACHE_LIMIT`` featured Entries (20 by default) are
+cached; asking for more than that falls back to a query.
+
+"""
+
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_finished, request_started
+from django.db.models import signals
+
+from coltrane.models import Entry
+
+
+CACHE_KEY = 'coltrane.featured'
+CACHE_TIMEOUT = getattr(settings, 'COLTRANE_FEATURED_CACHE_TIMEOUT', 60 * 60 * 24)
+LIMIT = getattr(settings, 'COLTRANE_FEATURED_CACHE_LIMIT', 20)
+
+_local = threading.local()
+
+
+def _cached():
+    """
+    Returns a ``(entries, complete)`` pair of the latest live featured
+    Entries, newest first, and whether they are all of them.
+    
+    """
+    result = getattr(_local, 'result', None)
+    if result is None:
+        result = cache.get(CACHE_KEY)
+        if result is None:
+            entries = list(Entry.live.filter(featured__exact=True)[:LIMIT + 1])
+            result = (entries[:LIMIT], len(entries) <= LIMIT)
+            cache.set(CACHE_KEY, result, CACHE_TIMEOUT)
+        _local.result = result
+    return result
+
+def get_featured_entries(num=None):
+    """
+    Returns a list of the latest ``num`` live featured Entries (or of
+    all of them), newest first.
+    
+    """
+    entries, complete = _cached()
+    if complete or num is not None and num <= len(entries):
+        return entries[:num]
+    queryset = Entry.live.filter(featured__exact=True)
+    if num is not None:
+        queryset = queryset[:num]
+    return list(queryset)
+
+def all_cached():
+    """
+    Returns the list of every live featured Entry if it is cached in
+    full, or ``None`` if there are too many.
+    
+    """
+    entries, complete = _cached()
+    return complete and list(entries) or None
+
+def forget(**kwargs):
+    """
+    Forgets the copy of the list remembered for the current request.
+    
+    """
+    _local.result = None
+
+def invalidate_all():
+    """
+    Drops the cached list, and the copy remembered for the current
+    request.
+    
+    """
+    cache.delete(CACHE_KEY)
+    forget()
+
+def capture_state(sender, instance, **kwargs):
+    """
+    Remembers an Entry's stored ``featured`` flag and status before it
+    is saved or deleted.
+    
+    """
+    instance._featured_state = None
+    if instance.id:
+        stored = list(Entry.objects.filter(pk=instance.id).values_list('featured', 'status'))
+        if stored:
+            instance._featured_state = stored[0]
+
+def invalidate(sender, instance, **kwargs):
+    """
+    Drops the cached list if a save or delete may have changed it:
+    the Entry is or was featured, or its status changed.
+    
+    """
+    old = getattr(instance, '_featured_state', None)
+    new = (instance.featured, instance.status)
+    if kwargs.get('signal') is signals.post_delete:
+        new = None
+    if not [state for state in (old, new) if state is not None and state[0]] and \
+       (old is None or new is None or old[1] == new[1]):
+        return
+    invalidate_all()
+
+
+request_started.connect(forget)
+request_finished.connect(forget)
+signals.pre_save.connect(capture_state, sender=Entry)
+signals.post_save.connect(invalidate, sender=Entry)
+signals.pre_delete.connect(capture_state, sender=Entry)
+signals.post_delete.connect(invalidate, sender=Entry)
@@ -0,0 +1,199 @@
+"""
+Atom and RSS feeds of a weblog's latest Entries and Links.
+
+Feeds are generated directly with ``django.utils.feedgenerator``. The
+data of each feed item is cached per object (and dropped from the
+cache when the object is saved or deleted), so assembling a feed only
+queries the ids in its window and fetches the objects whose items
+aren't cached. Item keys include a generation, which
+``invalidate_all()`` replaces to drop every item at once when HTML is
+rewritten without saving (see ``coltrane.bulk.render_markup()``).
+
+The feed views are wrapped with ``coltrane.page_cache.cache_page`` in
+``coltrane.urls.feeds``, so when the page cache or conditional GET is
+enabled the whole document is cached, and answered with a 304, until
+an Entry or Link it could include changes.
+
+Like the archive views, feeds leave out objects dated in the future.
+Nothing is sent when such an object's publication time arrives; the
+``publish_scheduled`` management command purges the cached feeds it
+appears in then.
+
+"""
+
+import datetime
+import time
+
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.db.models import signals
+from django.http import Http404, HttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import feedgenerator
+from tagging.models import Tag, TaggedItem
+from tagging.utils import parse_tag_input
+
+from coltrane.models import Category, Entry, Link
+
+
+FEED_ITEMS = getattr(settings, 'COLTRANE_FEED_ITEMS', 15)
+ITEM_CACHE_TIMEOUT = getattr(settings, 'COLTRANE_FEED_ITEM_CACHE_TIMEOUT', 60 * 60 * 24 * 7)
+GENERATION_KEY = 'coltrane.feeds.generation'
+
+FEED_TYPES = {
+    'atom': feedgenerator.Atom1Feed,
+    'rss': feedgenerator.Rss201rev2Feed,
+    }
+
+
+def _generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        generation = repr(time.time())
+        cache.set(GENERATION_KEY, generation, ITEM_CACHE_TIMEOUT)
+    return generation
+
+def _item_key(generation, model, id):
+    return 'coltrane.feeds.item.%s.%s.%s' % (generation, model._meta.module_name, id)
+
+def _absolute(url):
+    return 'http://%s%s' % (Site.objects.get_current().domain, url)
+
+def _entry_item(entry):
+    return { 'title': entry.title,
+             'link': _absolute(entry.get_absolute_url()),
+             'unique_id': _absolute(entry.get_absolute_url()),
+             'description': entry.excerpt_html or entry.body_html,
+             'author_name': entry.author.get_full_name() or entry.author.username,
+             'pubdate': entry.pub_date,
+             'categories': parse_tag_input(entry.tags) }
+
+def _link_item(link):
+    return { 'title': link.title,
+             'link': link.url,
+             'unique_id': _absolute(link.get_absolute_url()),
+             'description': link.description_html or u'',
+             'author_name': link.posted_by.get_full_name() or link.posted_by.username,
+             'pubdate': link.pub_date,
+             'categories': parse_tag_input(link.tags) }
+
+ITEM_BUILDERS = { Entry: _entry_item, Link: _link_item }
+
+
+def get_items(model, ids):
+    """
+    Returns the feed item data of the objects of ``model`` with the
+    given ``ids``, in order, from the item cache where possible.
+    
+    """
+    generation = _generation()
+    cached = cache.get_many([_item_key(generation, model, id) for id in ids])
+    missing = [id for id in ids if _item_key(generation, model, id) not in cached]
+    if missing:
+        related = model is Entry and 'author' or 'posted_by'
+        for obj in model._default_manager.select_related(related).filter(pk__in=missing):
+            item = ITEM_BUILDERS[model](obj)
+            cache.set(_item_key(generation, model, obj.id), item, ITEM_CACHE_TIMEOUT)
+            cached[_item_key(generation, model, obj.id)] = item
+    return [cached[_item_key(generation, model, id)] for id in ids if _item_key(generation, model, id) in cached]
+
+def _window(queryset):
+    """
+    Returns the ids of the latest ``FEED_ITEMS`` objects in
+    ``queryset`` whose publication time has passed.
+    
+    """
+    queryset = queryset.filter(pub_date__lte=datetime.datetime.now())
+    return list(queryset.order_by('-pub_date').values_list('id', flat=True)[:FEED_ITEMS])
+
+def render_feed(request, format, title, link, description, items):
+    """
+    Returns an ``HttpResponse`` containing a feed of the given
+    ``format`` ('atom' or 'rss') with the given item data.
+    
+    """
+    try:
+        feed_type = FEED_TYPES[format]
+    except KeyError:
+        raise Http404
+    feed = feed_type(title=title,
+                     link=_absolute(link),
+                     description=description,
+                     feed_url=_absolute(request.path),
+                     language=settings.LANGUAGE_CODE)
+    for item in items:
+        feed.add_item(**item)
+    response = HttpResponse(mimetype=feed.mime_type)
+    feed.write(response, 'utf-8')
+    return response
+
+
+def latest_entries(request, format):
+    """
+    Feed of the latest live Entries.
+    
+    """
+    site = Site.objects.get_current()
+    return render_feed(request, format,
+                       site.name,
+                       '/',
+                       u'Latest entries on %s' % site.name,
+                       get_items(Entry, _window(Entry.live.all())))
+
+def latest_links(request, format):
+    """
+    Feed of the latest Links.
+    
+    """
+    site = Site.objects.get_current()
+    return render_feed(request, format,
+                       u'%s: links' % site.name,
+                       '/',
+                       u'Latest links on %s' % site.name,
+                       get_items(Link, _window(Link.objects.all())))
+
+def category_entries(request, slug, format):
+    """
+    Feed of the latest live Entries in a Category.
+    
+    """
+    category = get_object_or_404(Category, slug__exact=slug)
+    site = Site.objects.get_current()
+    return render_feed(request, format,
+                       u'%s: %s' % (site.name, category.title),
+                       category.get_absolute_url(),
+                       category.description,
+                       get_items(Entry, _window(category.live_entry_set)))
+
+def tagged_items(request, tag, format):
+    """
+    Feed of the latest live Entries and Links carrying a tag.
+    
+    """
+    tag_instance = get_object_or_404(Tag, name__exact=tag)
+    site = Site.objects.get_current()
+    items = get_items(Entry, _window(TaggedItem.objects.get_by_model(Entry.live.all(), tag_instance)))
+    items.extend(get_items(Link, _window(TaggedItem.objects.get_by_model(Link.objects.all(), tag_instance))))
+    items.sort(key=lambda item: item['pubdate'], reverse=True)
+    return render_feed(request, format,
+                       u'%s: %s' % (site.name, tag_instance.name),
+                       '/',
+                       u'Latest items tagged "%s" on %s' % (tag_instance.name, site.name),
+                       items[:FEED_ITEMS])
+
+
+def invalidate_all():
+    """
+    Drops every cached feed item, by starting a new generation.
+    
+    """
+    cache.set(GENERATION_KEY, repr(time.time()), ITEM_CACHE_TIMEOUT)
+
+
+def drop_item(sender, instance, **kwargs):
+    cache.delete(_item_key(_generation(), sender, instance.id))
+
+for model in (Entry, Link):
+    signals.post_save.connect(drop_item, sender=model)
+    signals.post_delete.connect(drop_item, sender=model)
@@ -0,0 +1,290 @@
+"""
+Write-behind counts of how often Entries and Links are viewed, and a
+precomputed ranking of the most viewed ones.
+
+Counting a view must not cost a write on every request, so views are
+added up in memory by each process (see ``count_views()``) and written
+out together, at most once every ``COLTRANE_HIT_FLUSH_INTERVAL``
+seconds (60 by default), by the first counted request which finds
+the interval has passed. Each write adds to an hourly ``HitBucket``
+per object, however many times it was viewed. A flush runs a fixed
+handful of statements whatever the number of objects viewed since the
+last one (up to ``CHUNK_SIZE`` of each model): one query per model to
+find the objects from their URLs, one to find which of their buckets
+exist already, and one ``executemany`` each to update those and
+insert the rest. Views still held in memory when a process exits are
+lost.
+
+The ``rollup_hits`` management command, meant to be run periodically
+(e.g. hourly from cron), folds hourly buckets older than two days into
+daily ones and ranks the Entries and Links viewed most in the last
+``COLTRANE_POPULAR_DAYS`` days (7 by default), storing the top
+``COLTRANE_POPULAR_LIMIT`` (20 by default) of each as
+``PopularItem``s, which ``popular()`` reads.
+
+"""
+
+import datetime
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import connection, transaction, IntegrityError
+from django.db.models import signals
+
+from coltrane.models import Entry, HitBucket, Link, PopularItem
+
+
+FLUSH_INTERVAL = getattr(settings, 'COLTRANE_HIT_FLUSH_INTERVAL', 60)
+POPULAR_DAYS = getattr(settings, 'COLTRANE_POPULAR_DAYS', 7)
+LIMIT = getattr(settings, 'COLTRANE_POPULAR_LIMIT', 20)
+ROLLUP_AFTER = datetime.timedelta(days=2)
+
+# The most ids or slugs put in one ``IN`` list, well under SQLite's
+# limit of 999 parameters per statement.
+CHUNK_SIZE = 500
+
+CACHE_KEY = 'coltrane.hits.popular.%s'
+CACHE_TIMEOUT = getattr(settings, 'COLTRANE_POPULAR_CACHE_TIMEOUT', 60 * 60 * 24)
+
+# Views not yet written out, keyed by (model, year, month, day, slug),
+# since the object itself isn't known when its page comes from the
+# page cache.
+_pending = {}
+_lock = threading.Lock()
+_last_flush = [time.time()]
+
+
+def count_views(view_func, model):
+    """
+    Wraps the detail view ``view_func`` of ``model`` so that each
+    ``GET`` request it answers with a 200 counts as a view of the
+    object, whether or not the response came from the page cache.
+    
+    Requests without a ``User-Agent`` header, such as the static
+    export's, are not counted.
+    
+    """
+    def _wrapped(request, *args, **kwargs):
+        response = view_func(request, *args, **kwargs)
+        if request.method == 'GET' and response.status_code == 200 and \
+           request.META.get('HTTP_USER_AGENT'):
+            record(model, kwargs['year'], kwargs['month'], kwargs['day'], kwargs['slug'])
+            flush_if_due()
+        return response
+    _wrapped.__doc__ = view_func.__doc__
+    _wrapped.__name__ = view_func.__name__
+    return _wrapped
+
+def record(model, year, month, day, slug, count=1):
+    """
+    Counts ``count`` views of the ``model`` object with the given date
+    and slug, as found in the URL of its detail page.
+    
+    """
+    key = (model, year, month.lower(), day, slug)
+    _lock.acquire()
+    try:
+        _pending[key] = _pending.get(key, 0) + count
+    finally:
+        _lock.release()
+
+def _take_pending():
+    """
+    Removes and returns the views not yet written out.
+    
+    """
+    _lock.acquire()
+    try:
+        pending = dict(_pending)
+        _pending.clear()
+        _last_flush[0] = time.time()
+    finally:
+        _lock.release()
+    return pending
+
+def _chunks(items):
+    items = list(items)
+    for start in range(0, len(items), CHUNK_SIZE):
+        yield items[start:start + CHUNK_SIZE]
+
+def _resolve(pending):
+    """
+    Turns the keys of ``pending`` into ``(model, object id)`` pairs,
+    dropping any which no longer match an object, with one query per
+    model for each ``CHUNK_SIZE`` slugs.
+    
+    """
+    by_model = {}
+    for (model, year, month, day, slug), count in pending.items():
+        try:
+            date = datetime.datetime.strptime('%s-%s-%s' % (year, month, day), '%Y-%b-%d').date()
+        except ValueError:
+            continue
+        by_model.setdefault(model, {}).setdefault(slug, {})[date] = count
+    counts = {}
+    for model, slugs in by_model.items():
+        for chunk in _chunks(slugs):
+            rows = model._default_manager.filter(slug__in=chunk).values_list('id', 'slug', 'pub_date')
+            for object_id, slug, pub_date in rows.order_by('id'):
+                # Only the first object with a slug on a day is
+                # counted, as the detail view would show only one.
+                count = slugs[slug].pop(pub_date.date(), None)
+                if count is not None:
+                    counts[(model, object_id)] = counts.get((model, object_id), 0) + count
+    return counts
+
+def _add(counts):
+    """
+    Adds views to buckets, creating any which don't exist yet.
+    ``counts`` maps ``(content type id, object id, period, start)`` to
+    the number of views to add.
+    
+    Which buckets exist is found with one query per content type,
+    period and start for each ``CHUNK_SIZE`` objects; they are then
+    updated, and the rest inserted, with one ``executemany`` each.
+    
+    """
+    groups = {}
+    for (content_type_id, object_id, period, start), count in counts.items():
+        groups.setdefault((content_type_id, period, start), {})[object_id] = count
+    updates = []
+    inserts = []
+    for (content_type_id, period, start), by_object in groups.items():
+        for chunk in _chunks(by_object):
+            existing = set(HitBucket.objects.filter(content_type__pk=content_type_id, period__exact=period,
+                                                    start__exact=start, object_id__in=chunk).values_list('object_id', flat=True))
+            for object_id in chunk:
+                params = [content_type_id, object_id, period, connection.ops.value_to_db_datetime(start)]
+                if object_id in existing:
+                    updates.append([by_object[object_id]] + params)
+                else:
+                    inserts.append(params + [by_object[object_id]])
+    qn = connection.ops.quote_name
+    opts = HitBucket._meta
+    columns = [qn(opts.get_field(name).column) for name in ('content_type', 'object_id', 'period', 'start', 'count')]
+    cursor = connection.cursor()
+    if updates:
+        cursor.executemany('UPDATE %s SET %s = %s + %%s WHERE %s = %%s AND %s = %%s AND %s = %%s AND %s = %%s' % \
+                           tuple([qn(opts.db_table), columns[4], columns[4]] + columns[:4]),
+                           updates)
+    if inserts:
+        cursor.executemany('INSERT INTO %s (%s) VALUES (%%s, %%s, %%s, %%s, %%s)' % \
+                           (qn(opts.db_table), ', '.join(columns)),
+                           inserts)
+
+def _write(counts, start):
+    """
+    Adds ``counts`` to the hourly buckets starting at ``start``.
+    
+    """
+    _add(dict([((ContentType.objects.get_for_model(model).id, object_id, HitBucket.HOUR_PERIOD, start), count)
+               for (model, object_id), count in counts.items()]))
+_write = transaction.commit_on_success(_write)
+
+def flush():
+    """
+    Writes out the views counted by this process so far.
+    
+    If another process creates one of the same buckets first, the
+    views are put back to be written out by the next flush.
+    
+    """
+    pending = _take_pending()
+    if not pending:
+        return
+    now = datetime.datetime.now()
+    try:
+        _write(_resolve(pending), now.replace(minute=0, second=0, microsecond=0))
+    except IntegrityError:
+        for (model, year, month, day, slug), count in pending.items():
+            record(model, year, month, day, slug, count)
+
+def flush_if_due():
+    """
+    Writes out the views counted by this process if
+    ``FLUSH_INTERVAL`` seconds have passed since the last time.
+    
+    """
+    if _pending and time.time() - _last_flush[0] >= FLUSH_INTERVAL:
+        flush()
+
+def rollup(now=None):
+    """
+    Folds the hourly buckets older than two days into daily ones.
+    
+    """
+    now = now or datetime.datetime.now()
+    cutoff = (now - ROLLUP_AFTER).replace(hour=0, minute=0, second=0, microsecond=0)
+    hours = HitBucket.objects.filter(period__exact=HitBucket.HOUR_PERIOD, start__lt=cutoff)
+    days = {}
+    for content_type_id, object_id, start, count in hours.values_list('content_type', 'object_id',
+                                                                      'start', 'count').iterator():
+        key = (content_type_id, object_id, HitBucket.DAY_PERIOD, start.replace(hour=0))
+        days[key] = days.get(key, 0) + count
+    _add(days)
+    hours.delete()
+
+def rank(now=None, days=POPULAR_DAYS):
+    """
+    Stores the ``LIMIT`` Entries (live ones only) and Links viewed
+    most in the last ``days`` days as ``PopularItem``s.
+    
+    """
+    now = now or datetime.datetime.now()
+    since = (now - datetime.timedelta(days=days)).replace(minute=0, second=0, microsecond=0)
+    qn = connection.ops.quote_name
+    opts = HitBucket._meta
+    cursor = connection.cursor()
+    for queryset in (Entry.live.all(), Link.objects.all()):
+        ctype = ContentType.objects.get_for_model(queryset.model)
+        cursor.execute('SELECT %s, SUM(%s) FROM %s WHERE %s = %%s AND %s >= %%s GROUP BY %s ORDER BY 2 DESC' % \
+                       (qn(opts.get_field('object_id').column), qn(opts.get_field('count').column),
+                        qn(opts.db_table), qn(opts.get_field('content_type').column),
+                        qn(opts.get_field('start').column), qn(opts.get_field('object_id').column)),
+                       [ctype.id, connection.ops.value_to_db_datetime(since)])
+        rows = cursor.fetchall()
+        ranked = []
+        for start in range(0, len(rows), LIMIT):
+            chunk = rows[start:start + LIMIT]
+            existing = set(queryset.filter(pk__in=[row[0] for row in chunk]).values_list('id', flat=True))
+            ranked.extend([row for row in chunk if row[0] in existing])
+            if len(ranked) >= LIMIT:
+                break
+        PopularItem.objects.filter(content_type=ctype).delete()
+        for position, (object_id, count) in enumerate(ranked[:LIMIT]):
+            PopularItem.objects.create(content_type=ctype, object_id=object_id,
+                                       rank=position, count=int(count))
+        cache.delete(CACHE_KEY % queryset.model._meta.object_name.lower())
+
+def popular(queryset, num=None):
+    """
+    Returns a list of the ``num`` (or, at most, ``LIMIT``) most viewed
+    objects in ``queryset``, most viewed first, as last ranked.
+    
+    The ranked ids are cached, so this costs one query.
+    
+    """
+    key = CACHE_KEY % queryset.model._meta.object_name.lower()
+    ids = cache.get(key)
+    if ids is None:
+        ids = list(PopularItem.objects.filter(content_type=ContentType.objects.get_for_model(queryset.model)).values_list('object_id', flat=True))
+        cache.set(key, ids, CACHE_TIMEOUT)
+    objects = queryset.in_bulk(ids)
+    return [objects[object_id] for object_id in ids if object_id in objects][:num]
+
+def forget_object(sender, instance, **kwargs):
+    """
+    Deletes the view counts and ranking of a deleted Entry or Link.
+    
+    """
+    ctype = ContentType.objects.get_for_model(sender)
+    HitBucket.objects.filter(content_type=ctype, object_id=instance.id).delete()
+    PopularItem.objects.filter(content_type=ctype, object_id=instance.id).delete()
+    cache.delete(CACHE_KEY % sender._meta.object_name.lower())
+
+
+signals.post_delete.connect(forget_object, sender=Entry)
+signals.post_delete.connect(forget_object, sender=Link)
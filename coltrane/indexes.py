@@ -0,0 +1,175 @@
+"""
+Composite indexes for the hot access paths of Entries and Links.
+
+Django can only declare single-column indexes, so the multi-column
+indexes coltrane's queries rely on are listed here:
+
+* live Entries newest first, as every Entry list and archive reads
+  them: ``(status, pub_date)``;
+* featured live Entries newest first: ``(status, featured,
+  pub_date)``;
+* an Entry or Link by slug within a day, as the detail views look
+  them up: ``(slug, pub_date)``;
+* Links newest first: ``(pub_date)``.
+
+They are created along with the tables by ``syncdb``; for a database
+created before they were added, the ``create_indexes`` management
+command adds whichever are missing. Existing indexes are looked up in
+the catalog of each database Django ships a backend for (SQLite,
+PostgreSQL, MySQL and Oracle); on any other, every index is attempted
+and one which fails, as it will if it already exists, is reported and
+skipped. The ``check_query_plans`` command
+reports queries which still fall back to a full table scan.
+
+"""
+
+import re
+import sys
+
+from django.conf import settings
+from django.db import connection, transaction, DatabaseError
+from django.db.models import signals
+
+from coltrane import models as coltrane_models
+from coltrane.models import Entry, Link
+
+
+INDEXES = (
+    (Entry, ('status', 'pub_date')),
+    (Entry, ('status', 'featured', 'pub_date')),
+    (Entry, ('slug', 'pub_date')),
+    (Link, ('slug', 'pub_date')),
+    (Link, ('pub_date',)),
+    )
+
+# The plan lines reporting a table read without an index.
+SQLITE_SCAN_RE = re.compile(r'^(?:SCAN (?:TABLE )?|TABLE )"?(\w+)')
+POSTGRESQL_SCAN_RE = re.compile(r'Seq Scan on "?(\w+)')
+
+
+def index_name(model, field_names):
+    return '%s_%s' % (model._meta.db_table, '_'.join(field_names))
+
+def index_sql(model, field_names):
+    """
+    Returns the ``CREATE INDEX`` statement for an index of ``model``
+    over ``field_names``.
+    
+    """
+    qn = connection.ops.quote_name
+    columns = [qn(model._meta.get_field(name).column) for name in field_names]
+    return 'CREATE INDEX %s ON %s (%s);' % (qn(index_name(model, field_names)),
+                                           qn(model._meta.db_table),
+                                           ', '.join(columns))
+
+def _unquoted(name):
+    """
+    Returns ``name`` as the database stores it, e.g. upper-cased and
+    truncated by Oracle.
+    
+    """
+    return connection.ops.quote_name(name)[1:-1]
+
+def existing_index_names(cursor, table):
+    """
+    Returns the set of the names of the indexes on ``table``, as the
+    database stores them, or ``None`` if the database backend can't
+    tell.
+    
+    """
+    engine = settings.DATABASE_ENGINE
+    if engine == 'sqlite3':
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = %s", [table])
+        return set([row[0] for row in cursor.fetchall()])
+    if engine.startswith('postgresql'):
+        cursor.execute("SELECT indexname FROM pg_indexes WHERE tablename = %s", [table])
+        return set([row[0] for row in cursor.fetchall()])
+    if engine == 'mysql':
+        cursor.execute('SHOW INDEX FROM %s' % connection.ops.quote_name(table))
+        return set([row[2] for row in cursor.fetchall()])
+    if engine == 'oracle':
+        cursor.execute("SELECT index_name FROM user_indexes WHERE table_name = %s", [_unquoted(table)])
+        return set([row[0] for row in cursor.fetchall()])
+    return None
+
+def create_indexes(models=None, verbosity=1):
+    """
+    Creates whichever of the indexes on ``models`` (by default, on
+    Entry and Link) don't exist yet, returning their names.
+    
+    Where ``existing_index_names()`` can't tell which exist, a
+    statement which fails is reported on standard error and skipped.
+    
+    """
+    cursor = connection.cursor()
+    created = []
+    existing = {}
+    for model, field_names in INDEXES:
+        if models is not None and model not in models:
+            continue
+        table = model._meta.db_table
+        if table not in existing:
+            existing[table] = existing_index_names(cursor, table)
+        name = index_name(model, field_names)
+        if existing[table] is not None and _unquoted(name) in existing[table]:
+            continue
+        if verbosity > 1:
+            sys.stdout.write("Creating index %s\n" % name)
+        if existing[table] is not None:
+            cursor.execute(index_sql(model, field_names))
+        else:
+            try:
+                cursor.execute(index_sql(model, field_names))
+            except DatabaseError:
+                transaction.rollback_unless_managed()
+                if verbosity > 0:
+                    sys.stderr.write("Skipped index %s, which may already exist: %s\n" % (name, sys.exc_info()[1]))
+                continue
+        created.append(name)
+    return created
+
+def full_scans(sql, params):
+    """
+    Returns the list of coltrane tables which the database plans to
+    read in full to run the ``SELECT`` statement ``sql`` with
+    ``params``, as reported by its ``EXPLAIN``.
+    
+    Statements without a ``WHERE`` clause are expected to read whole
+    tables and aren't examined. Only the SQLite, PostgreSQL and MySQL
+    backends are supported; for others the list is always empty.
+    
+    """
+    if ' WHERE ' not in sql.upper():
+        return []
+    engine = settings.DATABASE_ENGINE
+    cursor = connection.cursor()
+    tables = []
+    if engine == 'sqlite3':
+        cursor.execute('EXPLAIN QUERY PLAN %s' % sql, params)
+        for row in cursor.fetchall():
+            match = SQLITE_SCAN_RE.match(row[-1])
+            if match and 'INDEX' not in row[-1] and 'PRIMARY KEY' not in row[-1]:
+                tables.append(match.group(1))
+    elif engine.startswith('postgresql'):
+        cursor.execute('EXPLAIN %s' % sql, params)
+        for row in cursor.fetchall():
+            tables.extend(POSTGRESQL_SCAN_RE.findall(row[0]))
+    elif engine == 'mysql':
+        cursor.execute('EXPLAIN %s' % sql, params)
+        for row in cursor.fetchall():
+            if row[3] == 'ALL':
+                tables.append(row[2])
+    return [table for table in tables if table.startswith('coltrane_')]
+
+def create_indexes_on_syncdb(sender, created_models, verbosity=1, **kwargs):
+    """
+    Creates the indexes on the Entry and Link tables when ``syncdb``
+    creates them.
+    
+    """
+    models = [model for model in (Entry, Link) if model in created_models]
+    if models:
+        create_indexes(models, int(verbosity))
+
+
+signals.post_syncdb.connect(create_indexes_on_syncdb, sender=coltrane_models)
@@ -0,0 +1,372 @@
+"""
+Per-view performance figures and query budgets.
+
+Views and other callables wrapped by ``instrument()`` are measured
+each time they're called: their wall time, the number of SQL queries
+they run and the time spent in them, and the time spent rendering
+templates. Each figure is added to an in-memory ``Histogram`` kept
+under the callable's name, per process, which the staff-only
+``report_view`` (see ``coltrane.urls.instrumentation``) shows.
+
+Every route in ``coltrane.urls`` is instrumented under its URL name
+by this module's ``url()``, which takes the place of Django's, as are
+the Category views and the featured Entry template tags under their
+own names; a view which is already instrumented, as the Category
+views are, keeps its own name rather than being measured twice.
+
+Measuring only happens if the ``COLTRANE_INSTRUMENTATION`` setting is
+``True``, or budgets are enforced (see below). Only then are the
+database connection class's ``cursor()`` and ``Template.render``
+patched to take the figures, in every thread; otherwise nothing is
+patched, and the wrappers call straight through. ``set_enabled()``
+and ``set_enforce_budgets()`` turn either on or off at run time,
+patching or restoring as needed.
+
+Each of coltrane's routes declares a *query budget*, the most queries
+it should ever run, with the ``budget`` argument to ``url()``; the
+``COLTRANE_QUERY_BUDGETS`` setting, a dictionary from names to
+budgets, overrides or adds to those. If budgets are enforced (the
+``COLTRANE_ENFORCE_QUERY_BUDGETS`` setting, or
+``set_enforce_budgets(True)`` in a test's ``setUp()``), a call running
+more queries than its budget raises ``QueryBudgetExceeded``, failing
+the test which made it; ``coltrane.tests.budgets`` does so for every
+route. The ``check_query_budgets`` management command does the same
+for a sample of coltrane's pages.
+
+"""
+
+import bisect
+import threading
+import time
+
+from django.conf import settings
+from django.conf.urls import defaults
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import connection
+from django.http import HttpResponse
+from django.template import Template
+
+
+ENABLED = getattr(settings, 'COLTRANE_INSTRUMENTATION', False)
+ENFORCE_BUDGETS = getattr(settings, 'COLTRANE_ENFORCE_QUERY_BUDGETS', False)
+BUDGETS = getattr(settings, 'COLTRANE_QUERY_BUDGETS', {})
+
+# Bucket bounds of the histograms: milliseconds for times, and a
+# number of queries for query counts.
+TIME_BOUNDS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+COUNT_BOUNDS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+# The figures kept for each name, with the bounds of their buckets.
+METRICS = (
+    ('wall_ms', TIME_BOUNDS),
+    ('sql_count', COUNT_BOUNDS),
+    ('sql_ms', TIME_BOUNDS),
+    ('template_ms', TIME_BOUNDS),
+    )
+
+_local = threading.local()
+_lock = threading.Lock()
+_histograms = {}
+_budgets = {}
+_originals = {}
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class Histogram(object):
+    """
+    Counts of values in buckets with the given upper ``bounds``, plus
+    one for anything larger, and their count, total and maximum.
+    
+    """
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+    
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+    
+    def mean(self):
+        return self.count and float(self.total) / self.count or 0
+    
+    def percentile(self, fraction):
+        """
+        Returns the upper bound of the bucket holding the value
+        ``fraction`` of the way through the values added, or the
+        maximum if that is smaller.
+        
+        """
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= fraction * self.count:
+                if i < len(self.bounds):
+                    return min(self.bounds[i], self.max)
+                break
+        return self.max
+
+
+class _Measurement(object):
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+
+
+class TimingCursor(object):
+    """
+    A database cursor which adds each query it runs, and the time
+    taken, to every measurement in progress.
+    
+    """
+    def __init__(self, cursor):
+        self.cursor = cursor
+    
+    def _timed(self, method, *args):
+        start = time.time()
+        try:
+            return method(*args)
+        finally:
+            elapsed = time.time() - start
+            for measurement in getattr(_local, 'active', ()):
+                measurement.sql_count += 1
+                measurement.sql_time += elapsed
+    
+    def execute(self, sql, params=()):
+        return self._timed(self.cursor.execute, sql, params)
+    
+    def executemany(self, sql, param_list):
+        return self._timed(self.cursor.executemany, sql, param_list)
+    
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+def _install():
+    """
+    Routes the database connection's cursors through ``TimingCursor``
+    and times ``Template.render``, unless that's already done.
+    
+    The connection is thread-local, so ``cursor()`` is replaced on its
+    class rather than on the connection object itself, which would
+    only affect the thread which installed it.
+    
+    """
+    if _originals:
+        return
+    wrapper_class = connection.__class__
+    # ``None`` if ``cursor()`` is inherited, in which case uninstalling
+    # removes the replacement again.
+    _originals['cursor'] = wrapper_class.__dict__.get('cursor')
+    real_cursor = wrapper_class.cursor
+    def cursor(self):
+        return TimingCursor(real_cursor(self))
+    wrapper_class.cursor = cursor
+    real_render = _originals['render'] = Template.render
+    def render(self, context):
+        active = getattr(_local, 'active', ())
+        if not active:
+            return real_render(self, context)
+        # Templates rendered by other templates (through ``include``
+        # or ``extends``) are only timed as part of the outermost one.
+        outermost = [measurement for measurement in active if not measurement.template_depth]
+        for measurement in active:
+            measurement.template_depth += 1
+        start = time.time()
+        try:
+            return real_render(self, context)
+        finally:
+            elapsed = time.time() - start
+            for measurement in active:
+                measurement.template_depth -= 1
+            for measurement in outermost:
+                measurement.template_time += elapsed
+    Template.render = render
+
+def _uninstall():
+    """
+    Restores what ``_install()`` patched.
+    
+    """
+    if not _originals:
+        return
+    original_cursor = _originals.pop('cursor')
+    if original_cursor is None:
+        del connection.__class__.cursor
+    else:
+        connection.__class__.cursor = original_cursor
+    Template.render = _originals.pop('render')
+
+def _update():
+    if ENABLED or ENFORCE_BUDGETS:
+        _install()
+    else:
+        _uninstall()
+
+def set_enabled(enabled):
+    """
+    Turns the recording of measurements on or off.
+    
+    """
+    global ENABLED
+    ENABLED = enabled
+    _update()
+
+def set_enforce_budgets(enforce):
+    """
+    Turns the enforcement of query budgets on or off.
+    
+    """
+    global ENFORCE_BUDGETS
+    ENFORCE_BUDGETS = enforce
+    _update()
+
+def _record(name, wall_time, measurement):
+    _lock.acquire()
+    try:
+        histograms = _histograms.get(name)
+        if histograms is None:
+            histograms = _histograms[name] = dict([(metric, Histogram(bounds)) for metric, bounds in METRICS])
+        histograms['wall_ms'].add(wall_time * 1000)
+        histograms['sql_count'].add(measurement.sql_count)
+        histograms['sql_ms'].add(measurement.sql_time * 1000)
+        histograms['template_ms'].add(measurement.template_time * 1000)
+    finally:
+        _lock.release()
+
+def get_budget(name):
+    """
+    Returns the query budget of ``name``, or ``None`` if it has none.
+    
+    """
+    return BUDGETS.get(name, _budgets.get(name))
+
+def instrument(func, name, budget=None):
+    """
+    Wraps ``func`` so each call is measured under ``name``, and held
+    to the query budget ``budget`` if given.
+    
+    """
+    if budget is not None:
+        _budgets[name] = budget
+    def _wrapped(*args, **kwargs):
+        if not _originals:
+            return func(*args, **kwargs)
+        measurement = _Measurement()
+        if not hasattr(_local, 'active'):
+            _local.active = []
+        _local.active.append(measurement)
+        start = time.time()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            _local.active.remove(measurement)
+        if ENABLED:
+            _record(name, time.time() - start, measurement)
+        limit = get_budget(name)
+        if ENFORCE_BUDGETS and limit is not None and measurement.sql_count > limit:
+            raise QueryBudgetExceeded("%s ran %s queries, over its budget of %s." % \
+                                      (name, measurement.sql_count, limit))
+        return result
+    _wrapped.__doc__ = func.__doc__
+    _wrapped.__name__ = func.__name__
+    _wrapped.instrumented_as = name
+    return _wrapped
+
+def url(regex, view, kwargs=None, name=None, prefix='', budget=None):
+    """
+    Django's ``url()``, with the view instrumented under the URL's
+    name (or the view's, for an unnamed URL) and held to ``budget``.
+    
+    A view which is already instrumented keeps its name, and is held
+    to ``budget`` under it. Views given by their import path, and
+    ``include()``d URLconfs, are passed through as they are.
+    
+    """
+    instrumented_as = getattr(view, 'instrumented_as', None)
+    if instrumented_as is not None:
+        if budget is not None:
+            _budgets[instrumented_as] = budget
+    elif callable(view):
+        view = instrument(view, name or view.__name__, budget)
+    return defaults.url(regex, view, kwargs, name, prefix)
+
+def snapshot():
+    """
+    Returns a dictionary mapping each name measured so far to a
+    dictionary of its ``Histogram``s, by metric.
+    
+    """
+    _lock.acquire()
+    try:
+        return dict(_histograms)
+    finally:
+        _lock.release()
+
+def reset():
+    """
+    Forgets every measurement taken so far.
+    
+    """
+    _lock.acquire()
+    try:
+        _histograms.clear()
+    finally:
+        _lock.release()
+
+def over_budget():
+    """
+    Returns a list of ``(name, most queries, budget)`` for each name
+    whose measurements ever ran more queries than its budget.
+    
+    """
+    result = []
+    for name, histograms in sorted(snapshot().items()):
+        limit = get_budget(name)
+        if limit is not None and histograms['sql_count'].max > limit:
+            result.append((name, histograms['sql_count'].max, limit))
+    return result
+
+def report():
+    """
+    Returns a plain-text table of every name measured so far, with its
+    number of calls and the mean, 95th percentile and maximum of each
+    figure, slowest in total first.
+    
+    """
+    rows = [('name', 'calls', 'wall ms', 'queries', 'budget', 'sql ms', 'template ms')]
+    ranked = sorted(snapshot().items(), key=lambda item: -item[1]['wall_ms'].total)
+    for name, histograms in ranked:
+        row = [name, str(histograms['wall_ms'].count)]
+        for metric in ('wall_ms', 'sql_count', 'sql_ms', 'template_ms'):
+            histogram = histograms[metric]
+            row.append('%.1f/%s/%s' % (histogram.mean(), histogram.percentile(0.95), int(histogram.max)))
+            if metric == 'sql_count':
+                limit = get_budget(name)
+                row.append(limit is not None and str(limit) or '-')
+        rows.append(tuple(row))
+    widths = [max([len(row[i]) for row in rows]) for i in range(len(rows[0]))]
+    lines = ['  '.join([value.ljust(width) for value, width in zip(row, widths)]).rstrip() for row in rows]
+    lines.append('')
+    lines.append('Figures are mean/95th percentile/maximum, per process since it started or was reset.')
+    return '\n'.join(lines) + '\n'
+
+def report_view(request):
+    """
+    Shows ``report()`` to staff members, as plain text.
+    
+    """
+    return HttpResponse(report(), mimetype='text/plain')
+report_view = staff_member_required(report_view)
+
+
+_update()
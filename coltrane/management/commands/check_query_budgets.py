@@ -0,0 +1,50 @@
+"""
+A management command which requests a sample of coltrane's public
+pages and fails if any view or template tag runs more queries than
+its budget (see ``coltrane.instrumentation``).
+
+As with ``check_query_plans``, the page cache is bypassed but
+coltrane's other caches are not, so pages are measured as they would
+be served by a warm site; run it with ``CACHE_BACKEND = 'dummy://'``
+to hold the views to their budgets with every cache cold.
+
+"""
+
+import sys
+
+from django.core.management.base import NoArgsCommand, CommandError
+from django.test.client import Client
+
+from coltrane import export, instrumentation, page_cache
+
+
+class Command(NoArgsCommand):
+    help = "Fails if a sample of coltrane's public pages runs more queries than their budgets allow."
+    
+    def handle_noargs(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        # One page of each kind, as in ``check_query_plans``.
+        sample = {}
+        for path, tags in export.pages():
+            kind = (tags[0].split('.')[0], tags[0].count('.'))
+            if kind not in sample:
+                sample[kind] = path
+        
+        # Measure everything, and compare with the budgets afterwards
+        # rather than failing at the first page over budget.
+        page_cache.ENABLED = False
+        instrumentation.set_enabled(True)
+        instrumentation.set_enforce_budgets(False)
+        instrumentation.reset()
+        client = Client()
+        for path in sample.values():
+            client.get(path)
+        
+        if verbosity > 1:
+            sys.stdout.write(instrumentation.report())
+        if verbosity > 0:
+            sys.stdout.write("Requested %s pages.\n" % len(sample))
+        failures = instrumentation.over_budget()
+        if failures:
+            raise CommandError("Over their query budgets:\n%s" %
+                               '\n'.join(['%s: %s queries, budget %s' % failure for failure in failures]))
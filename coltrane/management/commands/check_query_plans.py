@@ -0,0 +1,74 @@
+"""
+A management command which requests a sample of coltrane's public
+pages and fails if any query they run reads a coltrane table in full.
+
+The page cache is bypassed, but coltrane's other caches still hide the
+queries they answer, so run this with ``CACHE_BACKEND = 'dummy://'``
+to see every query. Run it against a database of realistic size, too:
+on a small table a scan may well be the plan of choice.
+
+"""
+
+import sys
+
+from django.core.management.base import NoArgsCommand, CommandError
+from django.db import connection
+from django.test.client import Client
+
+from coltrane import export, indexes, page_cache
+
+
+class RecordingCursor(object):
+    """
+    A database cursor which remembers every ``SELECT`` statement it
+    runs, with its parameters.
+    
+    """
+    def __init__(self, cursor, statements):
+        self.cursor = cursor
+        self.statements = statements
+    
+    def execute(self, sql, params=()):
+        if sql.lstrip().upper().startswith('SELECT'):
+            self.statements.append((sql, tuple(params or ())))
+        return self.cursor.execute(sql, params)
+    
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+class Command(NoArgsCommand):
+    help = "Fails if a sample of coltrane's public pages runs queries which scan a whole table."
+    
+    def handle_noargs(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        # One page of each kind: the first with a given number of
+        # components in its leading page-cache tag, e.g. one entry
+        # archive year and one entry detail page.
+        sample = {}
+        for path, tags in export.pages():
+            kind = (tags[0].split('.')[0], tags[0].count('.'))
+            if kind not in sample:
+                sample[kind] = path
+        
+        statements = []
+        client = Client()
+        real_cursor = connection.cursor
+        page_cache.ENABLED = False
+        connection.cursor = lambda: RecordingCursor(real_cursor(), statements)
+        try:
+            for path in sample.values():
+                client.get(path)
+        finally:
+            connection.cursor = real_cursor
+        
+        failures = {}
+        for sql, params in statements:
+            for table in indexes.full_scans(sql, params):
+                failures.setdefault(sql, set()).add(table)
+        if verbosity > 0:
+            sys.stdout.write("Checked %s queries from %s pages.\n" % (len(statements), len(sample)))
+        if failures:
+            raise CommandError("Queries scanning a whole table:\n%s" %
+                               '\n'.join(['%s: %s' % (', '.join(sorted(tables)), sql)
+                                          for sql, tables in failures.items()]))
@@ -0,0 +1,22 @@
+"""
+A management command which adds the composite indexes in
+``coltrane.indexes`` to a database created before they were.
+
+"""
+
+import sys
+
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+
+from coltrane import indexes
+
+
+class Command(NoArgsCommand):
+    help = "Creates whichever of coltrane's composite indexes on Entries and Links are missing."
+    
+    def handle_noargs(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        created = transaction.commit_on_success(indexes.create_indexes)(verbosity=verbosity)
+        if verbosity > 0:
+            sys.stdout.write("Created %s indexes.\n" % len(created))
@@ -0,0 +1,54 @@
+"""
+A management command which exports the weblog's public pages as
+static files.
+
+"""
+
+import os
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from coltrane import export, page_cache
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--processes', dest='processes', type='int', default=None,
+                    help='Number of worker processes; defaults to the number of CPUs.'),
+        make_option('--force', action='store_true', dest='force', default=False,
+                    help='Render every page, not just those changed since the last export.'),
+        )
+    help = "Renders every public coltrane page changed since the last export into a directory."
+    args = '<output directory>'
+    
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError("Expected one argument, the output directory.")
+        output_dir = os.path.abspath(args[0])
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+        force = options.get('force', False)
+        verbosity = int(options.get('verbosity', 1))
+        if not page_cache.ENABLED and not force:
+            force = True
+            if verbosity > 0:
+                sys.stderr.write("Rendering every page: set COLTRANE_STATIC_EXPORT = True to "
+                                 "only render the pages changed since the last export.\n")
+        skipped = []
+        failed = []
+        counts = export.export(output_dir,
+                               processes=options.get('processes'),
+                               force=force,
+                               skipped=skipped,
+                               failed=failed)
+        if verbosity > 0:
+            for path, reason in failed:
+                sys.stderr.write("Failed %s: %s\n" % (path, reason))
+        if verbosity > 1:
+            for url_name, kwargs in skipped:
+                sys.stderr.write("Skipped %s %r: its URL can't be built safely.\n" % (url_name, kwargs))
+        if verbosity > 0:
+            sys.stdout.write("%(rendered)s rendered, %(unchanged)s unchanged, "
+                             "%(removed)s removed, %(failed)s failed, %(skipped)s skipped.\n" % counts)
@@ -0,0 +1,45 @@
+"""
+A management command which writes every Category, Entry and Link to
+a file as line-delimited JSON, or as a WordPress WXR file.
+
+"""
+
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from coltrane import bulk
+
+
+WRITERS = {
+    'jsonl': bulk.write_jsonl,
+    'wxr': bulk.write_wxr,
+    }
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--format', dest='format', default='jsonl',
+                    help="'jsonl' (the default) or 'wxr'; WXR files leave out links."),
+        make_option('--batch-size', dest='batch_size', type='int', default=bulk.BATCH_SIZE,
+                    help='Number of objects read from the database at a time.'),
+        )
+    help = "Writes every category, entry and link to a file, or to standard output."
+    args = '[output file]'
+    
+    def handle(self, *args, **options):
+        if len(args) > 1:
+            raise CommandError("Expected at most one argument, the output file.")
+        writer = WRITERS.get(options.get('format', 'jsonl'))
+        if writer is None:
+            raise CommandError("Unknown format: %s" % options.get('format'))
+        if args:
+            stream = open(args[0], 'w')
+        else:
+            stream = sys.stdout
+        try:
+            writer(bulk.export_records(options.get('batch_size', bulk.BATCH_SIZE)), stream)
+        finally:
+            if args:
+                stream.close()
@@ -0,0 +1,72 @@
+"""
+A management command which imports Categories, Entries and Links
+from line-delimited JSON, or Categories and Entries from a WordPress
+WXR file.
+
+"""
+
+import sys
+from optparse import make_option
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from coltrane import bulk
+
+
+READERS = {
+    'jsonl': bulk.read_jsonl,
+    'wxr': bulk.read_wxr,
+    }
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--format', dest='format', default='jsonl',
+                    help="'jsonl' (the default) or 'wxr'."),
+        make_option('--user', dest='username', default=None,
+                    help='Username to credit entries and links by unknown users to.'),
+        make_option('--batch-size', dest='batch_size', type='int', default=bulk.BATCH_SIZE,
+                    help='Number of objects inserted per query and transaction.'),
+        make_option('--processes', dest='processes', type='int', default=None,
+                    help='Number of worker processes rendering markup; defaults to the number of CPUs.'),
+        )
+    help = "Imports categories, entries and links from a file, or from standard input, skipping those which already exist."
+    args = '[input file]'
+    
+    def handle(self, *args, **options):
+        if len(args) > 1:
+            raise CommandError("Expected at most one argument, the input file.")
+        reader = READERS.get(options.get('format', 'jsonl'))
+        if reader is None:
+            raise CommandError("Unknown format: %s" % options.get('format'))
+        default_user = None
+        if options.get('username'):
+            try:
+                default_user = User.objects.get(username=options['username'])
+            except User.DoesNotExist:
+                raise CommandError("There is no user named %r." % options['username'])
+        if args:
+            stream = open(args[0])
+        else:
+            stream = sys.stdin
+        importer = bulk.Importer(default_user, options.get('batch_size', bulk.BATCH_SIZE))
+        error = None
+        try:
+            try:
+                for record in reader(stream):
+                    importer.add(record)
+            except ValueError:
+                error = sys.exc_info()[1]
+        finally:
+            if args:
+                stream.close()
+        # Whatever was inserted before an error still needs its markup
+        # rendered and its indexes updated.
+        counts = importer.finish(options.get('processes'), flush=error is None)
+        if error is not None:
+            raise CommandError("%s (%s categories, %s entries and %s links were imported first.)" % \
+                               (error, counts['categories'], counts['entries'], counts['links']))
+        if int(options.get('verbosity', 1)) > 0:
+            sys.stdout.write("Imported %(categories)s categories, %(entries)s entries and "
+                             "%(links)s links; skipped %(skipped)s existing.\n" % counts)
@@ -0,0 +1,31 @@
+"""
+A management command which reports the throughput and latency of
+comment moderation for each Entry and Link.
+
+"""
+
+import datetime
+import sys
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+from django.utils.encoding import smart_str
+
+from coltrane import moderation
+
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--hours', dest='hours', type='int', default=24,
+                    help='Number of past hours of queued comments to report on.'),
+        )
+    help = "Reports comment moderation throughput and queue latency per Entry and Link."
+    
+    def handle_noargs(self, **options):
+        since = datetime.datetime.now() - datetime.timedelta(hours=options.get('hours', 24))
+        for stat in moderation.metrics(since):
+            latency = stat['mean_latency'] is not None and \
+                      '%.1fs mean, %.1fs max' % (stat['mean_latency'], stat['max_latency']) or 'none checked'
+            sys.stdout.write("%s: %s queued, %s pending, %s spam, %.1f/hour, %s\n" % \
+                             (smart_str(stat['object']), stat['queued'], stat['pending'], stat['spam'],
+                              stat['per_hour'], latency))
@@ -0,0 +1,29 @@
+"""
+A management command which checks queued comments for spam and mails
+a digest of the new ones.
+
+"""
+
+import sys
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand, CommandError
+
+from coltrane import moderation
+
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--batch-size', dest='batch_size', type='int', default=50,
+                    help='Number of queued comments to check at a time.'),
+        )
+    help = "Checks every queued comment with the configured spam backend and mails a digest of the rest."
+    
+    def handle_noargs(self, **options):
+        try:
+            counts = moderation.process(batch_size=options.get('batch_size', 50))
+        except moderation.SpamBackendError:
+            raise CommandError("The spam backend failed, so the remaining comments are still queued: %s" % \
+                               sys.exc_info()[1])
+        if int(options.get('verbosity', 1)) > 0:
+            sys.stdout.write("%(checked)s checked, %(spam)s spam.\n" % counts)
@@ -0,0 +1,25 @@
+"""
+A management command which sends the queued posts of Links to
+external services.
+
+"""
+
+import sys
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from coltrane import outbound
+
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--batch-size', dest='batch_size', type='int', default=50,
+                    help='Number of queued posts to fetch at a time.'),
+        )
+    help = "Sends every due queued post of a Link to the configured external service."
+    
+    def handle_noargs(self, **options):
+        counts = outbound.process(batch_size=options.get('batch_size', 50))
+        if int(options.get('verbosity', 1)) > 0:
+            sys.stdout.write("%(posted)s posted, %(retrying)s to be retried, %(failed)s failed.\n" % counts)
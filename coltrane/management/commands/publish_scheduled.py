@@ -0,0 +1,51 @@
+"""
+A management command which brings the archive index, Category
+counts, tag posting lists, sitemaps and cached pages up to date with the Entries and
+Links whose publication time passed in the last few hours.
+
+Saving an object dated in the future sends its signals straight away,
+while it is still left out of the archive; nothing is sent when its
+date arrives. Run this periodically, e.g. hourly from cron, with an
+``--hours`` a little longer than the interval between runs.
+
+"""
+
+import datetime
+import sys
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+
+from coltrane import archive, category_counts, page_cache, sitemaps, tag_index
+from coltrane.models import Entry, Link
+
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--hours', dest='hours', type='int', default=2,
+                    help='Number of past hours of publication times to catch up on.'),
+        )
+    help = "Updates the archive index, Category counts, tag posting lists, sitemaps and cached pages for Entries and Links published in the last few hours."
+    
+    def handle_noargs(self, **options):
+        now = datetime.datetime.now()
+        since = now - datetime.timedelta(hours=options.get('hours', 2))
+        objects = list(Entry.live.filter(pub_date__gt=since, pub_date__lte=now)) + \
+                  list(Link.objects.filter(pub_date__gt=since, pub_date__lte=now))
+        transaction.commit_on_success(archive.refresh_published)(objects)
+        category_ids = set()
+        for obj in objects:
+            if isinstance(obj, Entry):
+                category_ids.update(obj.categories.values_list('id', flat=True))
+        if category_ids:
+            transaction.commit_on_success(category_counts.refresh)(category_ids)
+        tag_index.invalidate_objects(objects)
+        for model in (Entry, Link):
+            dates = [obj.pub_date for obj in objects if isinstance(obj, model)]
+            if dates:
+                sitemaps.bump_dates(model, dates)
+        for obj in objects:
+            page_cache.purge_object(obj)
+        if int(options.get('verbosity', 1)) > 0:
+            sys.stdout.write("Caught up on %s entries and links published since %s.\n" % (len(objects), since.strftime('%Y-%m-%d %H:%M')))
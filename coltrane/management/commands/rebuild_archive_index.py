@@ -0,0 +1,21 @@
+"""
+A management command which rebuilds the date-archive index from
+scratch.
+
+"""
+
+import sys
+
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+
+from coltrane import archive
+
+
+class Command(NoArgsCommand):
+    help = "Rebuilds the precomputed year/month/day archive index of Entries and Links."
+    
+    def handle_noargs(self, **options):
+        transaction.commit_on_success(archive.rebuild_all)()
+        if int(options.get('verbosity', 1)) > 0:
+            sys.stdout.write("Rebuilt the archive index.\n")
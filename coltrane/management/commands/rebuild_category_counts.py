@@ -0,0 +1,21 @@
+"""
+A management command which recalculates the stored number of live
+Entries in every Category and the date of the latest one.
+
+"""
+
+import sys
+
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+
+from coltrane import category_counts
+
+
+class Command(NoArgsCommand):
+    help = "Recalculates the stored number of live Entries and latest Entry date of every Category."
+    
+    def handle_noargs(self, **options):
+        transaction.commit_on_success(category_counts.refresh)()
+        if int(options.get('verbosity', 1)) > 0:
+            sys.stdout.write("Recounted live Entries in every Category.\n")
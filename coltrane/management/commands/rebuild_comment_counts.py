@@ -0,0 +1,57 @@
+"""
+A management command which recalculates the stored
+``comment_count`` of every Entry and Link.
+
+Run it once after adding the ``comment_count`` columns to an existing
+database, which ``syncdb`` won't do; on PostgreSQL, SQLite and MySQL::
+
+    ALTER TABLE coltrane_entry ADD COLUMN comment_count integer NOT NULL DEFAULT 0;
+    ALTER TABLE coltrane_link ADD COLUMN comment_count integer NOT NULL DEFAULT 0;
+
+(``manage.py sqlall coltrane`` shows the exact column definition for
+other databases.)
+
+"""
+
+import sys
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+
+from coltrane.models import Entry, Link, public_comments
+
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--batch-size', dest='batch_size', type='int', default=500,
+                    help='Number of objects to recount per query and transaction.'),
+        )
+    help = "Recalculates the stored comment count of every Entry and Link."
+    
+    def handle_noargs(self, **options):
+        batch_size = options.get('batch_size', 500)
+        verbosity = int(options.get('verbosity', 1))
+        for model in (Entry, Link):
+            ids = list(model._default_manager.values_list('id', flat=True).order_by('id'))
+            for start in range(0, len(ids), batch_size):
+                self._update_batch(model, ids[start:start + batch_size])
+            if verbosity > 0:
+                sys.stdout.write("Recounted comments for %s %s.\n" % (len(ids), model._meta.verbose_name_plural))
+    
+    def _update_batch(self, model, ids):
+        """
+        Counts the comments for one batch of ``ids`` with a single
+        query, and writes the counts back with one ``UPDATE`` per
+        distinct count.
+        
+        """
+        counts = dict.fromkeys(ids, 0)
+        for object_id in public_comments(model).filter(object_id__in=ids).values_list('object_id', flat=True):
+            counts[int(object_id)] += 1
+        by_count = {}
+        for object_id, count in counts.items():
+            by_count.setdefault(count, []).append(object_id)
+        for count, object_ids in by_count.items():
+            model._default_manager.filter(pk__in=object_ids).update(comment_count=count)
+    _update_batch = transaction.commit_on_success(_update_batch)
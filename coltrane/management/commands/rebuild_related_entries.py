@@ -0,0 +1,32 @@
+"""
+A management command which recomputes the related Entries of every
+live Entry, or only of those affected by queued changes.
+
+"""
+
+import sys
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+
+from coltrane import related
+
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--queued', action='store_true', dest='queued', default=False,
+                    help='Only recompute the Entries affected by changes queued since the last run.'),
+        )
+    help = "Recomputes the most similar live Entries of every live Entry."
+    
+    def handle_noargs(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        if options.get('queued'):
+            count = transaction.commit_on_success(related.process_queued)()
+            if verbosity > 0:
+                sys.stdout.write("Recomputed the related entries of %s entries.\n" % count)
+            return
+        transaction.commit_on_success(related.rebuild)()
+        if verbosity > 0:
+            sys.stdout.write("Recomputed related entries.\n")
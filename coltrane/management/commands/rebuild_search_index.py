@@ -0,0 +1,20 @@
+"""
+A management command which rebuilds the full-text search index from
+scratch.
+
+"""
+
+import sys
+
+from django.core.management.base import NoArgsCommand
+
+from coltrane import search
+
+
+class Command(NoArgsCommand):
+    help = "Rebuilds the full-text search index of Entries and Links."
+    
+    def handle_noargs(self, **options):
+        search.rebuild()
+        if int(options.get('verbosity', 1)) > 0:
+            sys.stdout.write("Rebuilt the search index.\n")
@@ -0,0 +1,23 @@
+"""
+A management command which recounts the usage of every Tag by
+Entries and Links.
+
+"""
+
+import sys
+
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+
+from coltrane import tag_counts
+from coltrane.models import Entry, Link
+
+
+class Command(NoArgsCommand):
+    help = "Recounts the number of live Entries and of Links carrying each Tag."
+    
+    def handle_noargs(self, **options):
+        for model in (Entry, Link):
+            transaction.commit_on_success(tag_counts.rebuild)(model)
+        if int(options.get('verbosity', 1)) > 0:
+            sys.stdout.write("Recounted tag usage.\n")
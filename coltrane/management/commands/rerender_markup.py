@@ -0,0 +1,37 @@
+"""
+A management command which regenerates the stored HTML of every
+Category, Entry and Link from its source text, e.g. after changing
+the ``MARKUP_FILTER`` setting.
+
+"""
+
+import sys
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from coltrane import bulk
+
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--processes', dest='processes', type='int', default=None,
+                    help='Number of worker processes; defaults to the number of CPUs.'),
+        make_option('--batch-size', dest='batch_size', type='int', default=100,
+                    help='Number of objects sent to a worker, and written back, at a time.'),
+        )
+    help = "Re-renders the HTML of every Category, Entry and Link from its source text."
+    
+    def handle_noargs(self, **options):
+        batch_size = options.get('batch_size', 100)
+        verbosity = int(options.get('verbosity', 1))
+        pool = bulk.get_pool(options.get('processes'))
+        try:
+            for model, fields in bulk.MARKUP_FIELDS:
+                count = bulk.render_markup(model, pool, batch_size)
+                if verbosity > 0:
+                    sys.stdout.write("Re-rendered %s %s.\n" % (count, model._meta.verbose_name_plural))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
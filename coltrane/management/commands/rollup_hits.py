@@ -0,0 +1,22 @@
+"""
+A management command which folds old hourly view counts into daily
+ones and ranks the most viewed Entries and Links.
+
+"""
+
+import sys
+
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+
+from coltrane import hits
+
+
+class Command(NoArgsCommand):
+    help = "Rolls up the view counts of Entries and Links and ranks the most viewed ones."
+    
+    def handle_noargs(self, **options):
+        transaction.commit_on_success(hits.rollup)()
+        transaction.commit_on_success(hits.rank)()
+        if int(options.get('verbosity', 1)) > 0:
+            sys.stdout.write("Ranked the most viewed entries and links.\n")
@@ -1,5 +1,169 @@
+import datetime
+
 from comment_utils.managers import CommentedObjectManager
 from django.db import models
+from django.db.models.query import QuerySet
+
+
+class DeferredAttribute(object):
+    """
+    Stands in on a model class for a field which may have been left
+    out of a query by ``ArchiveQuerySet.defer()``.
+    
+    Objects which loaded the field hold its value in their own
+    ``__dict__``, which takes precedence, so this is only consulted
+    for objects which didn't; the first such access loads every field
+    deferred for the object in a single query.
+    
+    """
+    def __init__(self, attname):
+        self.attname = attname
+    
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        if self.attname not in instance.__dict__:
+            attnames = [attname for attname in getattr(instance, '_deferred_fields', [self.attname])
+                        if attname not in instance.__dict__]
+            values = owner._default_manager.filter(pk=instance.pk).values_list(*attnames)[0]
+            instance.__dict__.update(zip(attnames, values))
+        return instance.__dict__[self.attname]
+
+
+class ArchiveQuerySet(QuerySet):
+    """
+    ``QuerySet`` which answers ``dates()`` from the precomputed
+    archive index in ``coltrane.archive`` instead of running a
+    ``DISTINCT`` query over the whole table.
+    
+    The index can only answer for the set of objects it was built
+    from, so this is only done while ``archive_scope`` is set (see
+    ``archive()``) and the ``QuerySet`` has since been filtered on
+    nothing but ``pub_date``; any other filter falls back to the
+    normal query.
+    
+    """
+    archive_scope = None
+    deferred_fields = ()
+    
+    def archive(self, category_id=None):
+        """
+        Returns a copy of this ``QuerySet`` marked as covered by the
+        archive index, optionally for the index of a single Category.
+        
+        """
+        return self._clone(archive_scope=(category_id, {}))
+    
+    def defer(self, *field_names):
+        """
+        Returns a copy of this ``QuerySet`` which leaves the fields
+        ``field_names`` out of the query.
+        
+        The objects it returns load those fields from the database
+        only if and when one of them is accessed.
+        
+        """
+        for field_name in field_names:
+            attname = self.model._meta.get_field(field_name).attname
+            if not isinstance(self.model.__dict__.get(attname), DeferredAttribute):
+                setattr(self.model, attname, DeferredAttribute(attname))
+        return self._clone(deferred_fields=tuple(self.deferred_fields) + field_names)
+    
+    def listing(self):
+        """
+        Returns a copy of this ``QuerySet`` for list pages, deferring
+        the model's ``LISTING_DEFERRED_FIELDS`` -- the long text which
+        lists don't show.
+        
+        """
+        return self.defer(*getattr(self.model, 'LISTING_DEFERRED_FIELDS', ()))
+    
+    def iterator(self):
+        if not self.deferred_fields:
+            for obj in super(ArchiveQuerySet, self).iterator():
+                yield obj
+            return
+        fields = [f for f in self.model._meta.fields if f.name not in self.deferred_fields]
+        deferred = [f.attname for f in self.model._meta.fields if f.name in self.deferred_fields]
+        extra_names = self.query.extra_select.keys()
+        values = self._clone(deferred_fields=()).values_list(*([f.name for f in fields] + extra_names))
+        for row in values.iterator():
+            obj = self.model(**dict(zip([f.attname for f in fields], row[:len(fields)])))
+            for attname in deferred:
+                del obj.__dict__[attname]
+            obj._deferred_fields = deferred
+            for name, value in zip(extra_names, row[len(fields):]):
+                setattr(obj, name, value)
+            yield obj
+    
+    def dates(self, field_name, kind, order='ASC'):
+        if self.archive_scope is None or field_name != 'pub_date':
+            return super(ArchiveQuerySet, self).dates(field_name, kind, order)
+        from coltrane import archive
+        category_id, lookups = self.archive_scope
+        return archive.dates(self.model, category_id, lookups, kind, order)
+    
+    def extra(self, *args, **kwargs):
+        clone = super(ArchiveQuerySet, self).extra(*args, **kwargs)
+        clone.archive_scope = None
+        return clone
+    
+    def _clone(self, klass=None, setup=False, **kwargs):
+        kwargs.setdefault('archive_scope', self.archive_scope)
+        kwargs.setdefault('deferred_fields', self.deferred_fields)
+        return super(ArchiveQuerySet, self)._clone(klass, setup, **kwargs)
+    
+    def _filter_or_exclude(self, negate, *args, **kwargs):
+        clone = super(ArchiveQuerySet, self)._filter_or_exclude(negate, *args, **kwargs)
+        if self.archive_scope is not None:
+            if negate or args or [key for key in kwargs if not key.startswith('pub_date__')]:
+                clone.archive_scope = None
+            else:
+                category_id, lookups = self.archive_scope
+                lookups = dict(lookups)
+                lookups.update(kwargs)
+                clone.archive_scope = (category_id, lookups)
+        return clone
+
+
+class CategoryManager(models.Manager):
+    """
+    Custom manager for the Category model, providing the number of
+    live Entries in each Category and the date of the latest one.
+    
+    """
+    def with_live_entry_stats(self):
+        """
+        Returns a ``QuerySet`` of Categories in which each one also
+        has a ``current_entry_count`` of its live Entries published
+        by now and a ``current_last_entry_date`` of the latest of
+        them, computed within the same query.
+        
+        These are counted from the Entries themselves; the stored
+        ``live_entry_count`` and ``last_entry_date`` fields hold the
+        same figures without the extra work.
+        
+        """
+        from django.db import connection
+        qn = connection.ops.quote_name
+        entry_model = models.get_model('coltrane', 'entry')
+        categories_field = entry_model._meta.get_field('categories')
+        m2m_table = qn(categories_field.m2m_db_table())
+        entry_table = qn(entry_model._meta.db_table)
+        pub_date_column = qn(entry_model._meta.get_field('pub_date').column)
+        from_sql = 'FROM %s INNER JOIN %s ON %s.%s = %s.%s WHERE %s.%s = %s.%s AND %s.%s = %%s AND %s.%s <= %%s' % \
+                   (m2m_table, entry_table,
+                    m2m_table, qn(categories_field.m2m_column_name()),
+                    entry_table, qn(entry_model._meta.pk.column),
+                    m2m_table, qn(categories_field.m2m_reverse_name()),
+                    qn(self.model._meta.db_table), qn(self.model._meta.pk.column),
+                    entry_table, qn(entry_model._meta.get_field('status').column),
+                    entry_table, pub_date_column)
+        last_sql = 'SELECT MAX(%s.%s) %s' % (entry_table, pub_date_column, from_sql)
+        now = connection.ops.value_to_db_datetime(datetime.datetime.now())
+        return self.extra(select={ 'current_entry_count': 'SELECT COUNT(*) %s' % from_sql,
+                                   'current_last_entry_date': last_sql },
+                          select_params=(entry_model.LIVE_STATUS, now, entry_model.LIVE_STATUS, now))
 
 
 class LiveEntryManager(CommentedObjectManager):
@@ -12,16 +176,41 @@ class LiveEntryManager(CommentedObjectManager):
         """
         Returns a ``QuerySet`` of featured Entries.
         
+        Its results are read from the cached list in
+        ``coltrane.featured`` where possible; filtering it further
+        runs a normal query.
+        
+        """
+        from coltrane import featured
+        qs = self.filter(featured__exact=True)
+        qs._result_cache = featured.all_cached()
+        return qs
+    
+    def popular(self, num=5):
+        """
+        Returns a list of the ``num`` most viewed live Entries, most
+        viewed first, from the ranking kept by ``coltrane.hits``.
+        
+        """
+        from coltrane import hits
+        return hits.popular(self.get_query_set(), num)
+    
+    def listing(self):
         """
-        return self.filter(featured__exact=True)
+        Returns a ``QuerySet`` of live Entries for list pages, without
+        their body and source text (see ``ArchiveQuerySet.listing()``).
         
+        """
+        return self.get_query_set().listing()
+    
     def get_query_set(self):
         """
         Overrides the default ``QuerySet`` to only include Entries
         with a status of 'live'.
         
         """
-        return super(LiveEntryManager, self).get_query_set().filter(status__exact=self.model.LIVE_STATUS)
+        qs = super(LiveEntryManager, self).get_query_set().filter(status__exact=self.model.LIVE_STATUS)
+        return qs._clone(klass=ArchiveQuerySet).archive()
 
     def latest_featured(self):
         """
@@ -29,7 +218,63 @@ class LiveEntryManager(CommentedObjectManager):
         if there isn't.
         
         """
-        try:
-            return self.featured()[0]
-        except IndexError:
-            return None
+        from coltrane import featured
+        entries = featured.get_featured_entries(1)
+        return entries and entries[0] or None
+
+
+class LinkManager(CommentedObjectManager):
+    """
+    Custom manager for the Link model, whose ``QuerySet`` uses the
+    archive index for ``dates()``.
+    
+    """
+    def listing(self):
+        """
+        Returns a ``QuerySet`` of Links for list pages, without their
+        source text (see ``ArchiveQuerySet.listing()``).
+        
+        """
+        return self.get_query_set().listing()
+    
+    def popular(self, num=5):
+        """
+        Returns a list of the ``num`` most viewed Links, most viewed
+        first, from the ranking kept by ``coltrane.hits``.
+        
+        """
+        from coltrane import hits
+        return hits.popular(self.get_query_set(), num)
+    
+    def get_query_set(self):
+        return super(LinkManager, self).get_query_set()._clone(klass=ArchiveQuerySet).archive()
+
+
+class TagCountManager(models.Manager):
+    """
+    Custom manager for the TagCount model, providing tag archives and
+    clouds for Entries and Links.
+    
+    """
+    def for_model(self, model):
+        """
+        Returns a ``QuerySet`` of the counts of the Tags used by
+        ``model``, in alphabetical order.
+        
+        """
+        return self.filter(content_type__app_label=model._meta.app_label,
+                           content_type__model=model._meta.object_name.lower(),
+                           count__gt=0)
+    
+    def cloud(self, model, steps=4, distribution=None):
+        """
+        Returns a list of the counts of the Tags used by ``model``, in
+        alphabetical order, each with a ``font_size`` attribute from 1
+        to ``steps`` computed by ``tagging.utils.calculate_cloud``.
+        
+        """
+        from tagging.utils import LOGARITHMIC, calculate_cloud
+        tag_counts = list(self.for_model(model))
+        if tag_counts:
+            calculate_cloud(tag_counts, steps, distribution or LOGARITHMIC)
+        return tag_counts
@@ -6,11 +6,10 @@ Models for a weblog application.
 
 import datetime
 
-from comment_utils.managers import CommentedObjectManager
 from comment_utils.moderation import CommentModerator, moderator
 from django.conf import settings
 from django.db import models
-from django.utils.encoding import smart_str
+from django.db.models import signals
 from django.utils.translation import ugettext_lazy as _
 from django.core.exceptions import ImproperlyConfigured
 from django.contrib.auth.models import User
@@ -18,9 +17,11 @@ from django.contrib.contenttypes.models import ContentType
 from django.contrib.comments import models as comment_models
 import tagging
 from tagging.fields import TagField
-from template_utils.markup import formatter
+from tagging.models import Tag
 
 from coltrane import managers
+from coltrane.rendering import render
+from coltrane.signals import entry_categories_changed, entry_categories_changing
 
 # Uses the optional COLTRANE_COMMENT_MODULE setting to load the appropriate
 # comment model, falls back to django.contrib.comments
@@ -55,6 +56,12 @@ class Category(models.Model):
     description = models.TextField(_('description'), help_text=_('A short description of the category, to be used in list pages.'))
     description_html = models.TextField(_('description HTML'), editable=False, blank=True)
     
+    # Denormalized from the live Entries; see ``coltrane.category_counts``.
+    live_entry_count = models.PositiveIntegerField(_('number of live entries'), default=0, editable=False)
+    last_entry_date = models.DateTimeField(_('date of latest entry'), blank=True, null=True, editable=False)
+    
+    objects = managers.CategoryManager()
+    
     class Meta:
         verbose_name = _('category')
         verbose_name_plural = _('categories')
@@ -64,7 +71,7 @@ class Category(models.Model):
         return self.title
     
     def save(self):
-        self.description_html = formatter(self.description)
+        self.description_html = render(self.description)
         super(Category, self).save()
     
     def get_absolute_url(self):
@@ -79,7 +86,7 @@ class Category(models.Model):
         
         """
         from coltrane.models import Entry
-        return self.entry_set.filter(status__exact=Entry.LIVE_STATUS)
+        return Entry.live.filter(categories__pk=self.id).archive(category_id=self.id)
     
     live_entry_set = property(_get_live_entries)
 
@@ -108,6 +115,9 @@ class Entry(models.Model):
         (HIDDEN_STATUS, _('Hidden')),
         )
     
+    # Left out of list pages' queries; see ``Entry.live.listing()``.
+    LISTING_DEFERRED_FIELDS = ('body', 'body_html', 'excerpt')
+    
     # Metadata.
     author = models.ForeignKey(User, verbose_name=_('author'))
     enable_comments = models.BooleanField(_('enable comments'), default=True)
@@ -129,6 +139,10 @@ class Entry(models.Model):
     categories = models.ManyToManyField(Category, blank=True, verbose_name=_('categories'))
     tags = TagField()
     
+    # Denormalized from the public comments; see ``update_comment_count``
+    # and the ``rebuild_comment_counts`` command.
+    comment_count = models.PositiveIntegerField(_('number of comments'), default=0, editable=False)
+    
     # Managers.
     objects = models.Manager()
     live = managers.LiveEntryManager()
@@ -144,8 +158,8 @@ class Entry(models.Model):
     
     def save(self):
         if self.excerpt:
-            self.excerpt_html = formatter(self.excerpt)
-        self.body_html = formatter(self.body)
+            self.excerpt_html = render(self.excerpt)
+        self.body_html = render(self.body)
         super(Entry, self).save()
         
     def get_absolute_url(self):
@@ -156,7 +170,8 @@ class Entry(models.Model):
     get_absolute_url = models.permalink(get_absolute_url)
     
     def _next_previous_helper(self, direction):
-        return getattr(self, 'get_%s_by_pub_date' % direction)(status__exact=self.LIVE_STATUS)
+        from coltrane import neighbors
+        return neighbors.get_neighbor(self, direction)
     
     def get_next(self):
         """
@@ -182,11 +197,23 @@ class Entry(models.Model):
         
         """
         return self._next_previous_helper('previous')
+    
+    def get_related_entries(self, num=None):
+        """
+        Returns a list of the live Entries most similar to this one by
+        their Tags and Categories, most similar first, as precomputed
+        by ``coltrane.related``.
+        
+        """
+        ids = RelatedEntry.objects.filter(entry__pk=self.id).values_list('related', flat=True)
+        if num is not None:
+            ids = ids[:num]
+        ids = list(ids)
+        entries = Entry.live.listing().in_bulk(ids)
+        return [entries[id] for id in ids if id in entries]
 
     def _get_comment_count(self):
-        model = comment_model
-        ctype = ContentType.objects.get_for_model(self)
-        return model.objects.filter(content_type__pk=ctype.id, object_id__exact=self.id).count()
+        return self.comment_count
     _get_comment_count.short_description = _('number of comments')
 
     def _get_category_count(self):
@@ -194,6 +221,40 @@ class Entry(models.Model):
     _get_category_count.short_description = _('number of categories')
 
 
+def _notifying(entry, method):
+    def _wrapped(*args, **kwargs):
+        entry_categories_changing.send(sender=Entry, instance=entry)
+        result = method(*args, **kwargs)
+        entry_categories_changed.send(sender=Entry, instance=entry)
+        return result
+    return _wrapped
+
+class CategoriesDescriptor(object):
+    """
+    Wraps the descriptor Django gives ``Entry.categories``, so that
+    assigning to it, or calling the ``add()``, ``remove()`` or
+    ``clear()`` of the manager it returns, sends
+    ``entry_categories_changing`` before the change and
+    ``entry_categories_changed`` after it.
+    
+    """
+    def __init__(self, descriptor):
+        self.descriptor = descriptor
+    
+    def __get__(self, instance, owner=None):
+        manager = self.descriptor.__get__(instance, owner)
+        if instance is None:
+            return manager
+        for name in ('add', 'remove', 'clear'):
+            setattr(manager, name, _notifying(instance, getattr(manager, name)))
+        return manager
+    
+    def __set__(self, instance, value):
+        _notifying(instance, self.descriptor.__set__)(instance, value)
+
+Entry.categories = CategoriesDescriptor(Entry.__dict__['categories'])
+
+
 class Link(models.Model):
     """
     A link posted to the weblog.
@@ -203,6 +264,9 @@ class Link(models.Model):
     ``description`` field.
     
     """
+    # Left out of list pages' queries; see ``Link.objects.listing()``.
+    LISTING_DEFERRED_FIELDS = ('description',)
+    
     # Metadata.
     enable_comments = models.BooleanField(_('enable comments'), default=True)
     post_elsewhere = models.BooleanField(_('post to del.icio.us'),
@@ -224,7 +288,11 @@ class Link(models.Model):
     tags = TagField()
     url = models.URLField(_('URL'), unique=True, verify_exists=False)
     
-    objects = CommentedObjectManager()
+    # Denormalized from the public comments; see ``update_comment_count``
+    # and the ``rebuild_comment_counts`` command.
+    comment_count = models.PositiveIntegerField(_('number of comments'), default=0, editable=False)
+    
+    objects = managers.LinkManager()
     
     class Meta:
         get_latest_by = 'pub_date'
@@ -236,15 +304,12 @@ class Link(models.Model):
         return self.title
     
     def save(self):
-        if not self.id and self.post_elsewhere:
-            import pydelicious
-            try:
-                pydelicious.add(settings.DELICIOUS_USER, settings.DELICIOUS_PASSWORD, smart_str(self.url), smart_str(self.title), smart_str(self.tags))
-            except:
-                pass # TODO: don't just silently quash a bad del.icio.us post
+        new = not self.id
         if self.description:
-            self.description_html = formatter(self.description)
+            self.description_html = render(self.description)
         super(Link, self).save()
+        if new and self.post_elsewhere:
+            OutboundPost.objects.create(link=self)
     
     def get_absolute_url(self):
         return ('coltrane_link_detail', (), { 'year': self.pub_date.strftime('%Y'),
@@ -254,14 +319,309 @@ class Link(models.Model):
     get_absolute_url = models.permalink(get_absolute_url)
 
 
+class OutboundPost(models.Model):
+    """
+    A Link queued for posting to an external service (del.icio.us, by
+    default).
+    
+    Links are queued when they're first saved with ``post_elsewhere``
+    checked, and the queue is drained by the
+    ``process_outbound_posts`` management command; see
+    ``coltrane.outbound``.
+    
+    """
+    PENDING_STATUS = 1
+    POSTED_STATUS = 2
+    FAILED_STATUS = 3
+    STATUS_CHOICES = (
+        (PENDING_STATUS, _('Pending')),
+        (POSTED_STATUS, _('Posted')),
+        (FAILED_STATUS, _('Failed')),
+        )
+    
+    link = models.ForeignKey(Link, verbose_name=_('link'))
+    status = models.IntegerField(_('status'), choices=STATUS_CHOICES, default=PENDING_STATUS)
+    attempts = models.PositiveIntegerField(_('attempts'), default=0)
+    queued = models.DateTimeField(_('queued'), default=datetime.datetime.now)
+    next_attempt = models.DateTimeField(_('next attempt'), default=datetime.datetime.now, db_index=True)
+    posted = models.DateTimeField(_('posted'), blank=True, null=True)
+    last_error = models.TextField(_('last error'), blank=True)
+    
+    class Meta:
+        ordering = ['next_attempt']
+        verbose_name = _('outbound post')
+        verbose_name_plural = _('outbound posts')
+    
+    def __unicode__(self):
+        return unicode(self.link)
+
+
+class ArchiveBucket(models.Model):
+    """
+    The number of live Entries or Links published in a year, month or
+    day, optionally within a single Category.
+    
+    A ``month`` or ``day`` of 0 marks a year or month bucket. The
+    buckets are maintained by ``coltrane.archive`` and back the
+    ``date_list`` of the archive views.
+    
+    """
+    content_type = models.ForeignKey(ContentType)
+    category = models.ForeignKey(Category, blank=True, null=True)
+    year = models.PositiveIntegerField()
+    month = models.PositiveSmallIntegerField(default=0)
+    day = models.PositiveSmallIntegerField(default=0)
+    count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['year', 'month', 'day']
+        unique_together = (('content_type', 'category', 'year', 'month', 'day'),)
+    
+    def __unicode__(self):
+        return u'%s-%02d-%02d: %s' % (self.year, self.month, self.day, self.count)
+
+
+class SearchPosting(models.Model):
+    """
+    An entry in the full-text search index: the weighted frequency of
+    a term in an Entry or Link.
+    
+    Maintained by ``coltrane.search``.
+    
+    """
+    term = models.CharField(max_length=100, db_index=True)
+    content_type = models.ForeignKey(ContentType)
+    object_id = models.PositiveIntegerField()
+    weight = models.PositiveIntegerField()
+    # Whether the object is shown publicly (a live Entry, or any Link),
+    # so public searches never have to look the objects up to check.
+    public = models.BooleanField(default=True)
+    
+    class Meta:
+        unique_together = (('term', 'content_type', 'object_id'),)
+    
+    def __unicode__(self):
+        return u'%s: %s' % (self.term, self.weight)
+
+
+class TagCount(models.Model):
+    """
+    The number of live Entries, or of Links, carrying a Tag.
+    
+    The Tag's name is copied here so that tag archives and clouds can
+    be listed without a join. Maintained by ``coltrane.tag_counts``.
+    
+    """
+    tag = models.ForeignKey(Tag)
+    content_type = models.ForeignKey(ContentType)
+    name = models.CharField(max_length=50)
+    count = models.PositiveIntegerField(default=0)
+    
+    objects = managers.TagCountManager()
+    
+    class Meta:
+        ordering = ['name']
+        unique_together = (('tag', 'content_type'),)
+    
+    def __unicode__(self):
+        return u'%s: %s' % (self.name, self.count)
+
+
+class RelatedEntry(models.Model):
+    """
+    One of the live Entries most similar to a live Entry by their Tags
+    and Categories, with its similarity score and rank (0 being the
+    most similar).
+    
+    Maintained by ``coltrane.related``.
+    
+    """
+    entry = models.ForeignKey(Entry, related_name='related_entry_set')
+    related = models.ForeignKey(Entry, related_name='related_to_set')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+    
+    class Meta:
+        ordering = ['entry', 'rank']
+        unique_together = (('entry', 'rank'),)
+    
+    def __unicode__(self):
+        return u'%s: %s' % (self.related_id, self.score)
+
+
+class RelatedEntryUpdate(models.Model):
+    """
+    A change to the Tags, Categories or status of an Entry, queued for
+    ``coltrane.related`` to recompute the related Entries it affects.
+    
+    ``features`` holds the features which changed, one per line.
+    
+    """
+    entry_id = models.PositiveIntegerField()
+    features = models.TextField(blank=True)
+    queued = models.DateTimeField(default=datetime.datetime.now)
+    
+    class Meta:
+        ordering = ['id']
+    
+    def __unicode__(self):
+        return u'%s: %s' % (self.entry_id, self.queued)
+
+
+class ModerationTask(models.Model):
+    """
+    A comment on an Entry or Link waiting to be checked for spam, or
+    the outcome of the check.
+    
+    Queued when the comment is posted and processed in batches by
+    ``coltrane.moderation``; the comment model is configurable, so it
+    is referred to by id.
+    
+    """
+    PENDING_STATUS = 1
+    HAM_STATUS = 2
+    SPAM_STATUS = 3
+    STATUS_CHOICES = (
+        (PENDING_STATUS, _('Pending')),
+        (HAM_STATUS, _('Not spam')),
+        (SPAM_STATUS, _('Spam')),
+        )
+    
+    comment_id = models.PositiveIntegerField(_('comment id'))
+    content_type = models.ForeignKey(ContentType, verbose_name=_('content type'))
+    object_id = models.PositiveIntegerField(_('object id'))
+    status = models.IntegerField(_('status'), choices=STATUS_CHOICES, default=PENDING_STATUS, db_index=True)
+    queued = models.DateTimeField(_('queued'), default=datetime.datetime.now)
+    processed = models.DateTimeField(_('processed'), blank=True, null=True)
+    # When the comment was listed in a digest, if it isn't spam.
+    mailed = models.DateTimeField(_('mailed'), blank=True, null=True)
+    
+    class Meta:
+        ordering = ['queued']
+        verbose_name = _('moderation task')
+        verbose_name_plural = _('moderation tasks')
+    
+    def __unicode__(self):
+        return u'%s: %s' % (self.comment_id, self.get_status_display())
+
+
+class HitBucket(models.Model):
+    """
+    The number of times an Entry or Link was viewed in an hour, or in
+    a day once its hours are rolled up.
+    
+    Maintained by ``coltrane.hits``.
+    
+    """
+    HOUR_PERIOD = 1
+    DAY_PERIOD = 2
+    PERIOD_CHOICES = (
+        (HOUR_PERIOD, _('Hour')),
+        (DAY_PERIOD, _('Day')),
+        )
+    
+    content_type = models.ForeignKey(ContentType)
+    object_id = models.PositiveIntegerField()
+    period = models.PositiveSmallIntegerField(choices=PERIOD_CHOICES, default=HOUR_PERIOD)
+    start = models.DateTimeField(db_index=True)
+    count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['start']
+        unique_together = (('content_type', 'object_id', 'period', 'start'),)
+    
+    def __unicode__(self):
+        return u'%s: %s' % (self.start, self.count)
+
+
+class PopularItem(models.Model):
+    """
+    One of the most viewed Entries or Links of the last few days, with
+    its rank (0 being the most viewed) and number of views.
+    
+    Maintained by ``coltrane.hits``.
+    
+    """
+    content_type = models.ForeignKey(ContentType)
+    object_id = models.PositiveIntegerField()
+    rank = models.PositiveIntegerField()
+    count = models.PositiveIntegerField()
+    
+    class Meta:
+        ordering = ['rank']
+        unique_together = (('content_type', 'rank'),)
+    
+    def __unicode__(self):
+        return u'%s: %s' % (self.object_id, self.count)
+
+
 class ColtraneModerator(CommentModerator):
-    akismet = True
+    # Spam checks and notification emails are done outside the request
+    # by ``coltrane.moderation``; see the ``process_comment_moderation``
+    # management command.
+    akismet = False
     auto_close_field = 'pub_date'
-    email_notification = True
+    email_notification = False
     enable_field = 'enable_comments'
     close_after = settings.COMMENTS_MODERATE_AFTER
 
 moderator.register([Entry, Link], ColtraneModerator)
 
+
+def public_comments(model):
+    """
+    Returns a ``QuerySet`` of the publicly-visible comments attached
+    to objects of ``model``.
+    
+    Comment models without an ``is_public`` field are assumed to have
+    all of their comments visible.
+    
+    """
+    ctype = ContentType.objects.get_for_model(model)
+    qs = comment_model.objects.filter(content_type__pk=ctype.id)
+    if 'is_public' in [f.name for f in comment_model._meta.fields]:
+        qs = qs.filter(is_public__exact=True)
+    return qs
+
+def update_comment_count(sender, instance, **kwargs):
+    """
+    Signal handler which recounts the public comments on the Entry
+    or Link a comment is attached to, and stores the result in its
+    ``comment_count`` field.
+    
+    Since moderation (e.g. by ``ColtraneModerator``) works by
+    changing ``is_public`` before the comment is saved, this also
+    keeps the count current when comments are moderated.
+    
+    """
+    for model in (Entry, Link):
+        if instance.content_type_id == ContentType.objects.get_for_model(model).id:
+            count = public_comments(model).filter(object_id__exact=instance.object_id).count()
+            model._default_manager.filter(pk=instance.object_id).update(comment_count=count)
+            return
+
+signals.post_save.connect(update_comment_count, sender=comment_model)
+signals.post_delete.connect(update_comment_count, sender=comment_model)
+
 tagging.register(Entry, 'tag_set')
 tagging.register(Link, 'tag_set')
+
+# Connects the signal handlers which create the composite indexes,
+# queue comments for moderation and changes for the related Entries,
+# maintain the archive and search indexes and category and tag
+# counts, drop the view counts of deleted objects, and invalidate the
+# cached navigation between Entries, featured Entries, feed items,
+# sitemap shards and cached pages.
+import coltrane.archive
+import coltrane.category_counts
+import coltrane.featured
+import coltrane.feeds
+import coltrane.hits
+import coltrane.indexes
+import coltrane.moderation
+import coltrane.neighbors
+import coltrane.page_cache
+import coltrane.related
+import coltrane.search
+import coltrane.sitemaps
+import coltrane.tag_counts
@@ -0,0 +1,288 @@
+"""
+Spam checks and notification emails for comments, outside the request
+which posted them.
+
+``ColtraneModerator`` leaves out its own Akismet check and email, so
+posting a comment only applies the cheap, local rules (comments
+closing or being moderated after a while) and queues a
+``ModerationTask``. ``process()`` -- run by the
+``process_comment_moderation`` management command -- later hands the
+queued comments to the spam backend a batch at a time, withdraws the
+spam from public view, and mails the site's managers a single digest
+of the rest.
+
+Each batch's verdicts are committed in one transaction, and a task
+records when its comment was mailed, so the digest lists every
+comment checked but not yet mailed: if sending it fails, the next run
+sends those comments again rather than losing them.
+
+The backend is the class named by the ``COLTRANE_SPAM_BACKEND``
+setting (``AkismetBackend`` by default). A backend is any class with
+a ``check(comments)`` method returning, for each comment, whether it
+is spam, and raising ``SpamBackendError`` if it can't tell, which
+leaves the batch queued; ``LocalBackend`` decides by a list of words
+instead, for testing.
+
+``metrics()`` reports, per Entry or Link, how many comments were
+checked and how long they waited in the queue.
+
+"""
+
+import datetime
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sites.models import Site
+from django.core.exceptions import ImproperlyConfigured
+from django.core.mail import mail_managers
+from django.db import transaction
+from django.db.models import signals
+from django.utils.encoding import smart_str
+
+from coltrane import page_cache
+from coltrane.models import Entry, Link, ModerationTask, comment_model, update_comment_count
+
+
+BACKEND = getattr(settings, 'COLTRANE_SPAM_BACKEND', 'coltrane.moderation.AkismetBackend')
+DIGEST = getattr(settings, 'COLTRANE_MODERATION_DIGEST', True)
+
+# The most comments fetched by one ``in_bulk()`` for the digest.
+CHUNK_SIZE = 500
+
+
+class SpamBackendError(Exception):
+    pass
+
+
+class AkismetBackend(object):
+    """
+    Checks comments with the Akismet service, using the key in the
+    ``AKISMET_API_KEY`` setting.
+    
+    """
+    def check(self, comments):
+        from akismet import Akismet
+        api = Akismet(key=settings.AKISMET_API_KEY,
+                      blog_url='http://%s/' % Site.objects.get_current().domain)
+        if not api.verify_key():
+            raise SpamBackendError('Akismet rejected the key in the AKISMET_API_KEY setting.')
+        return [bool(api.comment_check(smart_str(comment.comment),
+                                       data={ 'comment_type': 'comment',
+                                              'referrer': '',
+                                              'user_ip': comment.ip_address,
+                                              'user_agent': '' },
+                                       build_data=True))
+                for comment in comments]
+
+
+class LocalBackend(object):
+    """
+    Treats as spam the comments containing any of the words in the
+    class attribute ``spam_words``, and appends every comment checked
+    to the class attribute ``checked``.
+    
+    """
+    spam_words = ['viagra', 'casino']
+    checked = []
+    
+    def check(self, comments):
+        self.checked.extend(comments)
+        return [bool([word for word in self.spam_words if word in comment.comment.lower()])
+                for comment in comments]
+
+
+def get_backend():
+    """
+    Returns an instance of the backend named by the
+    ``COLTRANE_SPAM_BACKEND`` setting.
+    
+    """
+    module_name, class_name = BACKEND.rsplit('.', 1)
+    try:
+        backend_class = getattr(__import__(module_name, {}, {}, [class_name]), class_name)
+    except (ImportError, AttributeError):
+        raise ImproperlyConfigured('Could not load the spam backend %r.' % BACKEND)
+    return backend_class()
+
+def _content_types():
+    return dict([(ContentType.objects.get_for_model(model).id, model) for model in (Entry, Link)])
+
+def enqueue(sender, instance, created=False, **kwargs):
+    """
+    Queues a newly posted comment on an Entry or Link for moderation.
+    
+    """
+    if created and instance.content_type_id in _content_types():
+        ModerationTask.objects.create(comment_id=instance.id,
+                                      content_type_id=instance.content_type_id,
+                                      object_id=instance.object_id)
+
+def _withdraw(comments):
+    """
+    Hides spam comments from public view, recounts the comments of
+    the objects they were on and purges their cached pages.
+    
+    """
+    if 'is_public' not in [f.name for f in comment_model._meta.fields]:
+        return
+    comment_model._default_manager.filter(pk__in=[comment.id for comment in comments]).update(is_public=False)
+    for comment in comments:
+        update_comment_count(comment_model, comment)
+        page_cache.purge_commented(comment.content_type_id, comment.object_id)
+
+def _process_batch(backend, batch):
+    """
+    Checks one batch of ``ModerationTask`` objects, returning the
+    comments which aren't spam and the number which are.
+    
+    """
+    comments = comment_model._default_manager.in_bulk([task.comment_id for task in batch])
+    tasks = [task for task in batch if task.comment_id in comments]
+    ModerationTask.objects.filter(pk__in=[task.id for task in batch if task.comment_id not in comments]).delete()
+    verdicts = backend.check([comments[task.comment_id] for task in tasks])
+    now = datetime.datetime.now()
+    ham, spam = [], []
+    for task, is_spam in zip(tasks, verdicts):
+        task.status = is_spam and ModerationTask.SPAM_STATUS or ModerationTask.HAM_STATUS
+        task.processed = now
+        task.save()
+        if is_spam:
+            spam.append(comments[task.comment_id])
+        else:
+            ham.append(comments[task.comment_id])
+    _withdraw(spam)
+    return ham, len(spam)
+_process_batch = transaction.commit_on_success(_process_batch)
+
+def _author(comment):
+    for attname in ('person_name', 'user_name', 'name'):
+        if getattr(comment, attname, None):
+            return getattr(comment, attname)
+    return unicode(getattr(comment, 'user', u''))
+
+def send_pending_digest():
+    """
+    Mails a digest of the comments found not to be spam which haven't
+    been mailed yet, and records that they have been once it is sent.
+    
+    """
+    cutoff = datetime.datetime.now()
+    tasks = ModerationTask.objects.filter(status=ModerationTask.HAM_STATUS, mailed__isnull=True,
+                                          processed__lte=cutoff)
+    comment_ids = list(tasks.values_list('comment_id', flat=True))
+    if not comment_ids:
+        return
+    comments = []
+    for start in range(0, len(comment_ids), CHUNK_SIZE):
+        comments.extend(comment_model._default_manager.in_bulk(comment_ids[start:start + CHUNK_SIZE]).values())
+    send_digest(comments)
+    tasks.update(mailed=cutoff)
+
+def send_digest(comments):
+    """
+    Mails the site's managers a single message listing ``comments``,
+    grouped by the Entry or Link they were posted on.
+    
+    """
+    content_types = _content_types()
+    by_object = {}
+    for comment in comments:
+        by_object.setdefault((content_types[comment.content_type_id], comment.object_id), []).append(comment)
+    sections = []
+    for (model, object_id), object_comments in by_object.items():
+        try:
+            obj = model._default_manager.get(pk=object_id)
+        except model.DoesNotExist:
+            continue
+        lines = [u'%s (http://%s%s)' % (obj, Site.objects.get_current().domain, obj.get_absolute_url())]
+        for comment in object_comments:
+            lines.append(u'  %s: %s' % (_author(comment), comment.comment[:200]))
+        sections.append(u'\n'.join(lines))
+    if sections:
+        mail_managers(u'%s new comments' % len(comments), u'\n\n'.join(sections))
+
+def process(batch_size=50, backend=None):
+    """
+    Checks every queued comment, fetching them ``batch_size`` at a
+    time, mails a digest of those which aren't spam (see
+    ``send_pending_digest()``) if the ``COLTRANE_MODERATION_DIGEST``
+    setting is ``True`` (the default), and returns a dictionary
+    counting the comments which were ``checked`` and which were
+    ``spam``.
+    
+    Raises ``SpamBackendError`` if the backend does, leaving the
+    batch it was checking, and those after it, queued.
+    
+    """
+    if backend is None:
+        backend = get_backend()
+    ham_count = 0
+    spam_count = 0
+    while True:
+        batch = list(ModerationTask.objects.filter(status=ModerationTask.PENDING_STATUS)[:batch_size])
+        if not batch:
+            break
+        batch_ham, batch_spam_count = _process_batch(backend, batch)
+        ham_count += len(batch_ham)
+        spam_count += batch_spam_count
+    if DIGEST:
+        send_pending_digest()
+    return { 'checked': ham_count + spam_count, 'spam': spam_count }
+
+def metrics(since=None):
+    """
+    Returns a list of dictionaries describing the moderation of the
+    comments queued since ``since`` (by default, in the last day) for
+    each Entry or Link, busiest first, with these keys:
+    
+        object
+            The Entry or Link.
+        
+        queued, pending, spam
+            How many comments were queued, are still waiting and
+            were found to be spam.
+        
+        per_hour
+            How many were checked per hour since ``since``.
+        
+        mean_latency, max_latency
+            The mean and longest wait, in seconds, between a checked
+            comment being queued and processed.
+    
+    """
+    now = datetime.datetime.now()
+    if since is None:
+        since = now - datetime.timedelta(days=1)
+    hours = max((now - since).days * 24 + (now - since).seconds / 3600.0, 1.0 / 60)
+    stats = {}
+    tasks = ModerationTask.objects.filter(queued__gte=since).values_list('content_type', 'object_id', 'status',
+                                                                         'queued', 'processed')
+    for content_type_id, object_id, status, queued, processed in tasks.iterator():
+        stat = stats.setdefault((content_type_id, object_id), { 'queued': 0, 'pending': 0, 'spam': 0,
+                                                               'latencies': [] })
+        stat['queued'] += 1
+        if status == ModerationTask.PENDING_STATUS:
+            stat['pending'] += 1
+        if status == ModerationTask.SPAM_STATUS:
+            stat['spam'] += 1
+        if processed is not None:
+            delta = processed - queued
+            stat['latencies'].append(delta.days * 86400 + delta.seconds + delta.microseconds / 1000000.0)
+    content_types = _content_types()
+    result = []
+    for (content_type_id, object_id), stat in stats.items():
+        model = content_types[content_type_id]
+        try:
+            obj = model._default_manager.get(pk=object_id)
+        except model.DoesNotExist:
+            continue
+        latencies = stat.pop('latencies')
+        stat.update(object=obj, per_hour=len(latencies) / hours, mean_latency=None, max_latency=None)
+        if latencies:
+            stat.update(mean_latency=sum(latencies) / len(latencies), max_latency=max(latencies))
+        result.append(stat)
+    result.sort(key=lambda stat: stat['queued'], reverse=True)
+    return result
+
+
+signals.post_save.connect(enqueue, sender=comment_model)
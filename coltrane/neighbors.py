@@ -0,0 +1,130 @@
+"""
+Cached navigation between live Entries.
+
+The ids of an Entry's previous and next live Entries are cached, so
+that ``Entry.get_previous()`` and ``Entry.get_next()`` cost one cache
+read and at most one query (for both neighbors at once) instead of
+two ordered range queries.
+
+Every cached pair is keyed by a generation, which is replaced
+whenever an Entry is published, unpublished, re-dated or deleted;
+since any of those can change the neighbors of Entries anywhere in
+the archive, a new generation invalidates all of them at once. A
+generation is the time it was started, rather than a counter, so that
+one which is evicted from the cache and started again can't reuse the
+keys of pairs cached under an earlier one.
+
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q, signals
+
+from coltrane.models import Entry
+
+
+CACHE_TIMEOUT = getattr(settings, 'COLTRANE_NEIGHBORS_CACHE_TIMEOUT', 60 * 60 * 24)
+GENERATION_KEY = 'coltrane.neighbors.generation'
+
+
+def _generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        generation = repr(time.time())
+        cache.set(GENERATION_KEY, generation, CACHE_TIMEOUT)
+    return generation
+
+def neighbor_queryset(entry, direction):
+    """
+    Returns a ``QuerySet`` of the live Entries after (``direction``
+    'next') or before (``direction`` 'previous') ``entry``, nearest
+    first, using the same ordering as ``get_next_by_pub_date`` and
+    ``get_previous_by_pub_date``.
+    
+    """
+    if direction == 'next':
+        return Entry.live.filter(Q(pub_date__gt=entry.pub_date) |
+                                 Q(pub_date=entry.pub_date, id__gt=entry.id)).order_by('pub_date', 'id')
+    return Entry.live.filter(Q(pub_date__lt=entry.pub_date) |
+                             Q(pub_date=entry.pub_date, id__lt=entry.id)).order_by('-pub_date', '-id')
+
+def _neighbor_id(entry, direction):
+    ids = list(neighbor_queryset(entry, direction).values_list('id', flat=True)[:1])
+    return ids and ids[0] or None
+
+def neighbor_ids(entry):
+    """
+    Returns a dictionary mapping 'previous' and 'next' to the ids of
+    the live Entries on either side of ``entry`` (or ``None``).
+    
+    """
+    key = 'coltrane.neighbors.%s.%s' % (_generation(), entry.id)
+    ids = cache.get(key)
+    if ids is None:
+        ids = { 'previous': _neighbor_id(entry, 'previous'),
+                'next': _neighbor_id(entry, 'next') }
+        cache.set(key, ids, CACHE_TIMEOUT)
+    return ids
+
+def get_neighbor(entry, direction):
+    """
+    Returns the live Entry before (``direction`` 'previous') or after
+    (``direction`` 'next') ``entry``, raising ``Entry.DoesNotExist``
+    if there isn't one.
+    
+    Both neighbors are fetched together the first time either is
+    asked for, and remembered on ``entry``.
+    
+    """
+    if not hasattr(entry, '_neighbors_cache'):
+        ids = neighbor_ids(entry)
+        entries = Entry.live.in_bulk([id for id in ids.values() if id is not None])
+        entry._neighbors_cache = dict([(key, entries.get(id)) for key, id in ids.items()])
+    neighbor = entry._neighbors_cache[direction]
+    if neighbor is None:
+        raise Entry.DoesNotExist("%s matching query does not exist." % Entry._meta.object_name)
+    return neighbor
+
+def capture_position(sender, instance, **kwargs):
+    """
+    Remembers an Entry's stored ``pub_date`` and status before it is
+    saved or deleted.
+    
+    """
+    instance._neighbors_position = None
+    if instance.id:
+        stored = list(Entry.objects.filter(pk=instance.id).values_list('pub_date', 'status'))
+        if stored:
+            instance._neighbors_position = stored[0]
+
+def invalidate(sender, instance, **kwargs):
+    """
+    Starts a new generation if a save or delete may have changed which
+    live Entries neighbor each other.
+    
+    """
+    old = getattr(instance, '_neighbors_position', None)
+    if kwargs.get('signal') is signals.post_delete:
+        new = None
+    else:
+        new = (instance.pub_date, instance.status)
+    if old == new or not [position for position in (old, new)
+                          if position is not None and position[1] == Entry.LIVE_STATUS]:
+        return
+    invalidate_all()
+
+def invalidate_all():
+    """
+    Starts a new generation, for changes made without sending the
+    signals which start one selectively.
+    
+    """
+    cache.set(GENERATION_KEY, repr(time.time()), CACHE_TIMEOUT)
+
+
+signals.pre_save.connect(capture_position, sender=Entry)
+signals.post_save.connect(invalidate, sender=Entry)
+signals.pre_delete.connect(capture_position, sender=Entry)
+signals.post_delete.connect(invalidate, sender=Entry)
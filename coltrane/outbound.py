@@ -0,0 +1,117 @@
+"""
+Posting Links to external services, outside the request which saved
+them.
+
+Saving a new Link with ``post_elsewhere`` checked only queues an
+``OutboundPost``; ``process()`` -- run by the
+``process_outbound_posts`` management command -- later hands the due
+posts to the posting backend in batches, retrying failures with
+exponential backoff and recording the error of each attempt.
+
+The backend is the class named by the ``COLTRANE_OUTBOUND_BACKEND``
+setting (``DeliciousBackend`` by default). A backend is any class
+with a ``post(link)`` method which raises an exception on failure;
+``LocalBackend`` records posts in memory instead, for testing.
+
+"""
+
+import datetime
+import traceback
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils.encoding import smart_str
+
+from coltrane.models import OutboundPost
+
+
+BACKEND = getattr(settings, 'COLTRANE_OUTBOUND_BACKEND', 'coltrane.outbound.DeliciousBackend')
+MAX_ATTEMPTS = getattr(settings, 'COLTRANE_OUTBOUND_MAX_ATTEMPTS', 8)
+RETRY_DELAY = getattr(settings, 'COLTRANE_OUTBOUND_RETRY_DELAY', 60)
+
+
+class DeliciousBackend(object):
+    """
+    Posts Links to the del.icio.us account given by the
+    ``DELICIOUS_USER`` and ``DELICIOUS_PASSWORD`` settings.
+    
+    """
+    def post(self, link):
+        import pydelicious
+        pydelicious.add(settings.DELICIOUS_USER, settings.DELICIOUS_PASSWORD,
+                        smart_str(link.url), smart_str(link.title), smart_str(link.tags))
+
+
+class LocalBackend(object):
+    """
+    Appends posted Links to the class attribute ``posted`` instead of
+    sending them anywhere.
+    
+    """
+    posted = []
+    
+    def post(self, link):
+        self.posted.append(link)
+
+
+def get_backend():
+    """
+    Returns an instance of the backend named by the
+    ``COLTRANE_OUTBOUND_BACKEND`` setting.
+    
+    """
+    module_name, class_name = BACKEND.rsplit('.', 1)
+    try:
+        backend_class = getattr(__import__(module_name, {}, {}, [class_name]), class_name)
+    except (ImportError, AttributeError):
+        raise ImproperlyConfigured('Could not load the outbound posting backend %r.' % BACKEND)
+    return backend_class()
+
+def _attempt(backend, outbound_post):
+    """
+    Makes one attempt at an ``OutboundPost`` and records its outcome.
+    
+    """
+    now = datetime.datetime.now()
+    outbound_post.attempts += 1
+    try:
+        backend.post(outbound_post.link)
+    except Exception:
+        outbound_post.last_error = traceback.format_exc()
+        if outbound_post.attempts >= MAX_ATTEMPTS:
+            outbound_post.status = OutboundPost.FAILED_STATUS
+        else:
+            delay = RETRY_DELAY * 2 ** (outbound_post.attempts - 1)
+            outbound_post.next_attempt = now + datetime.timedelta(seconds=delay)
+    else:
+        outbound_post.status = OutboundPost.POSTED_STATUS
+        outbound_post.posted = now
+    outbound_post.save()
+    return outbound_post.status
+_attempt = transaction.commit_on_success(_attempt)
+
+def process(batch_size=50, backend=None):
+    """
+    Attempts every pending ``OutboundPost`` which is due, fetching
+    them ``batch_size`` at a time, and returns a dictionary counting
+    the posts which were posted, which were rescheduled and which
+    failed for good.
+    
+    """
+    if backend is None:
+        backend = get_backend()
+    counts = { OutboundPost.POSTED_STATUS: 0,
+               OutboundPost.PENDING_STATUS: 0,
+               OutboundPost.FAILED_STATUS: 0 }
+    started = datetime.datetime.now()
+    while True:
+        batch = list(OutboundPost.objects.select_related('link').filter(status=OutboundPost.PENDING_STATUS,
+                                                                        next_attempt__lte=started)[:batch_size])
+        if not batch:
+            break
+        for outbound_post in batch:
+            counts[_attempt(backend, outbound_post)] += 1
+    return { 'posted': counts[OutboundPost.POSTED_STATUS],
+             'retrying': counts[OutboundPost.PENDING_STATUS],
+             'failed': counts[OutboundPost.FAILED_STATUS] }
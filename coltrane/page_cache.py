@@ -0,0 +1,335 @@
+"""
+An opt-in cache of the rendered responses of coltrane's public views,
+invalidated precisely when the content they show changes.
+
+Every cached page depends on a few *tags* derived from its URL, such
+as 'entry.2008.aug' for the entry archive of August 2008 or
+'category.django' for the Category 'django'. Each tag has a version
+number kept in the cache, and a page is stored under a key built from
+its request method (a ``HEAD`` response has no body to serve a
+``GET`` with), its full path (query string included, so each page of
+a paginated list is cached separately) and the current versions of
+its tags. Saving or deleting an Entry, Link or Category, or a comment
+on an Entry or Link, bumps the versions of exactly the tags it
+affects, which makes the pages stored under the old versions
+unreachable; nothing else is purged.
+
+The same versions serve as HTTP validators: if the
+``COLTRANE_CONDITIONAL_GET`` setting is ``True``, responses carry an
+``ETag`` hashed from the path and tag versions, and a
+``Last-Modified`` of the time the newest of those versions was set,
+and requests whose ``If-None-Match`` or ``If-Modified-Since`` still
+match are answered with a 304 before the view runs at all.
+
+Only anonymous ``GET`` and ``HEAD`` requests answered with a 200 are
+cached, and only if the ``COLTRANE_PAGE_CACHE_TIMEOUT`` setting is set
+to a number of seconds. Any Django cache backend which supports
+``get``, ``get_many`` and ``set`` will do, including the local-memory
+and file backends.
+
+"""
+
+import re
+import time
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db.models import signals
+from django.http import HttpResponseNotModified
+from django.utils.encoding import smart_str
+from django.utils.hashcompat import md5_constructor
+from django.utils.http import http_date
+from tagging.utils import parse_tag_input
+
+from coltrane.models import Category, Entry, Link, comment_model
+from coltrane.neighbors import neighbor_queryset
+from coltrane.signals import entry_categories_changed, entry_categories_changing
+
+
+CACHE_TIMEOUT = getattr(settings, 'COLTRANE_PAGE_CACHE_TIMEOUT', 0)
+CONDITIONAL_GET = getattr(settings, 'COLTRANE_CONDITIONAL_GET', False)
+KEY_PREFIX = getattr(settings, 'COLTRANE_PAGE_CACHE_PREFIX', 'coltrane.page_cache')
+TAG_TIMEOUT = getattr(settings, 'COLTRANE_PAGE_CACHE_TAG_TIMEOUT', 60 * 60 * 24 * 30)
+
+# Tag versions only need maintaining if something reads them: the
+# page cache, conditional GET, or incremental static exports (see the
+# ``export_static`` management command).
+ENABLED = bool(CACHE_TIMEOUT or CONDITIONAL_GET or getattr(settings, 'COLTRANE_STATIC_EXPORT', False))
+
+DATE_KEYS = ('year', 'month', 'day', 'slug')
+
+# Every page depends on this tag. It is bumped when a featured Entry
+# changes, since featured Entries are typically shown on every page of
+# the site, and by ``purge_all()``.
+SITE_TAG = 'site'
+
+SPLIT_RE = re.compile(r'[+,]')
+
+# Sent with the requests of the static export (see ``coltrane.export``),
+# whose pages are rendered without links to further pages.
+STATIC_EXPORT_HEADER = 'HTTP_X_COLTRANE_STATIC_EXPORT'
+
+
+def _tag_key(tag):
+    return '%s.tag.%s' % (KEY_PREFIX, md5_constructor(smart_str(tag)).hexdigest())
+
+def _tag(prefix, keys, kwargs):
+    return u'.'.join([prefix] + [kwargs[key].lower() for key in keys if key in kwargs])
+
+def _versions(tags):
+    """
+    Returns the current versions of ``tags``, in order, creating any
+    which are missing.
+    
+    A version is the ``time.time()`` at which it was set, so a
+    missing one (never set, or evicted) becomes the current time,
+    which can only make pages look newer than they are.
+    
+    """
+    versions = cache.get_many([_tag_key(tag) for tag in tags])
+    missing = [tag for tag in tags if _tag_key(tag) not in versions]
+    if missing:
+        version = repr(time.time())
+        for tag in missing:
+            cache.set(_tag_key(tag), version, TAG_TIMEOUT)
+            versions[_tag_key(tag)] = version
+    return [versions[_tag_key(tag)] for tag in tags]
+
+def page_tags(prefix, kwargs, keys=DATE_KEYS, owner_keys=(), split_key=None):
+    """
+    Returns the tags of the page served with the URL keyword
+    arguments ``kwargs`` by a view wrapped with ``cache_page`` (which
+    see for the other arguments).
+    
+    """
+    if split_key in kwargs:
+        tags = [u'%s.%s' % (prefix, value.lower())
+                for value in SPLIT_RE.split(kwargs[split_key]) if value]
+    else:
+        tags = [_tag(prefix, keys, kwargs)]
+    tags.append(SITE_TAG)
+    if owner_keys:
+        tags.append(_tag(prefix, owner_keys, kwargs))
+    return tags
+
+def page_version(path, tags):
+    """
+    Returns a ``(digest, timestamp)`` pair for the current version of
+    the page at ``path`` depending on ``tags``: the digest changes
+    whenever any of the tags is purged, and the timestamp is when the
+    newest of them was last purged.
+    
+    """
+    versions = _versions(tags)
+    digest = md5_constructor(smart_str('%s:%s' % (path, ':'.join(versions)))).hexdigest()
+    return digest, max([float(version) for version in versions])
+
+def is_static_export(request):
+    """
+    Returns whether ``request`` was made by the static export.
+    
+    """
+    return bool(request.META.get(STATIC_EXPORT_HEADER))
+
+def _cacheable(request):
+    # The static export's pages differ from the ones served at the
+    # same path, so they are never cached.
+    if not ENABLED or request.method not in ('GET', 'HEAD') or is_static_export(request):
+        return False
+    user = getattr(request, 'user', None)
+    return user is None or not user.is_authenticated()
+
+def _not_modified(request, etag, last_modified):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        return if_none_match.strip() == '*' or \
+               etag in [value.strip() for value in if_none_match.split(',')]
+    return request.META.get('HTTP_IF_MODIFIED_SINCE', '').split(';')[0].strip() == last_modified
+
+def cache_page(view_func, prefix, keys=DATE_KEYS, owner_keys=(), split_key=None):
+    """
+    Wraps ``view_func`` so its responses are cached and, if enabled,
+    answer conditional ``GET`` requests.
+    
+    The page's tag is ``prefix`` followed by whichever of the URL
+    keyword arguments named in ``keys`` the view received, e.g.
+    'entry.2008.aug.21' for an entry archive day. If ``owner_keys``
+    is given, the page also depends on the tag built from just those
+    arguments, so that e.g. every archive page of a Category can be
+    purged when the Category itself changes.
+    
+    If ``split_key`` is given, the URL keyword argument of that name
+    may hold several values joined by '+' or ',', as in a tag query,
+    and the page depends on the tag of each of them in turn instead.
+    
+    """
+    def _wrapped(request, *args, **kwargs):
+        if not _cacheable(request):
+            return view_func(request, *args, **kwargs)
+        digest, timestamp = page_version(request.get_full_path(),
+                                         page_tags(prefix, kwargs, keys, owner_keys, split_key))
+        etag = '"%s"' % digest
+        last_modified = http_date(timestamp)
+        if CONDITIONAL_GET and _not_modified(request, etag, last_modified):
+            return HttpResponseNotModified()
+        key = '%s.page.%s.%s' % (KEY_PREFIX, request.method, digest)
+        response = CACHE_TIMEOUT and cache.get(key) or None
+        if response is None:
+            response = view_func(request, *args, **kwargs)
+            if CACHE_TIMEOUT and response.status_code == 200:
+                cache.set(key, response, CACHE_TIMEOUT)
+        if CONDITIONAL_GET and response.status_code == 200:
+            response['ETag'] = etag
+            response['Last-Modified'] = last_modified
+        return response
+    _wrapped.__doc__ = view_func.__doc__
+    _wrapped.__name__ = view_func.__name__
+    return _wrapped
+
+def purge(tags):
+    """
+    Invalidates every cached page depending on any of ``tags``.
+    
+    """
+    version = repr(time.time())
+    for tag in set(tags):
+        cache.set(_tag_key(tag), version, TAG_TIMEOUT)
+
+def purge_all():
+    """
+    Invalidates every cached page, for changes made without sending
+    the signals which purge them selectively.
+    
+    """
+    purge([SITE_TAG])
+
+def date_tags(prefix, date, slug=None):
+    """
+    Returns the tags of the index, year, month and day archive pages
+    under ``prefix`` which include ``date``, plus the detail page of
+    ``slug`` if given.
+    
+    """
+    tags = [prefix]
+    for key in ('%Y', '%b', '%d'):
+        tags.append('%s.%s' % (tags[-1], date.strftime(key).lower()))
+    if slug is not None:
+        tags.append('%s.%s' % (tags[-1], slug))
+    return tags
+
+
+def _entry_tags(entry):
+    tags = date_tags('entry', entry.pub_date, entry.slug) + date_tags('stream', entry.pub_date)
+    # The Category list shows each Category's live entry count and
+    # latest entry date.
+    tags.append('categories')
+    for slug in entry.categories.values_list('slug', flat=True):
+        tags.extend(date_tags('category.%s' % slug, entry.pub_date))
+    for direction in ('previous', 'next'):
+        for pub_date, slug in neighbor_queryset(entry, direction).values_list('pub_date', 'slug')[:1]:
+            tags.append(date_tags('entry', pub_date, slug)[-1])
+    tags.append('entry_tags')
+    for tag in parse_tag_input(entry.tags):
+        tags.extend(['entry_tag.%s' % tag.lower(), 'tag.%s' % tag.lower()])
+    if entry.featured:
+        tags.append(SITE_TAG)
+    return tags
+
+def _stored_entry_tags(entry):
+    try:
+        stored = Entry.objects.get(pk=entry.id)
+    except Entry.DoesNotExist:
+        return []
+    if stored.status != Entry.LIVE_STATUS:
+        return []
+    return _entry_tags(stored)
+
+def _link_tags(link):
+    tags = date_tags('link', link.pub_date, link.slug) + date_tags('stream', link.pub_date) + ['link_tags']
+    for tag in parse_tag_input(link.tags):
+        tags.extend(['link_tag.%s' % tag.lower(), 'tag.%s' % tag.lower()])
+    return tags
+
+def capture_tags(sender, instance, **kwargs):
+    """
+    Remembers the tags of the pages an object appeared on before it
+    is saved or deleted.
+    
+    """
+    instance._page_cache_tags = []
+    if not ENABLED or not instance.id:
+        return
+    if sender is Entry:
+        instance._page_cache_tags = _stored_entry_tags(instance)
+    elif sender is Link:
+        try:
+            instance._page_cache_tags = _link_tags(Link.objects.get(pk=instance.id))
+        except Link.DoesNotExist:
+            pass
+    else:
+        try:
+            instance._page_cache_tags = ['categories', 'category.%s' % Category.objects.get(pk=instance.id).slug]
+        except Category.DoesNotExist:
+            pass
+
+def purge_pages(sender, instance, **kwargs):
+    """
+    Purges the pages an object appeared on before it was saved,
+    deleted or recategorized, and those it appears on now.
+    
+    """
+    if not ENABLED:
+        return
+    tags = getattr(instance, '_page_cache_tags', [])
+    if kwargs.get('signal') is not signals.post_delete:
+        if sender is Entry:
+            tags = tags + _stored_entry_tags(instance)
+        elif sender is Link:
+            tags = tags + _link_tags(instance)
+        else:
+            tags = tags + ['categories', 'category.%s' % instance.slug]
+    purge(tags)
+
+def purge_object(obj):
+    """
+    Purges the pages showing the Entry or Link ``obj``, after a change
+    which sent no signal, such as its publication time passing.
+    
+    """
+    if not ENABLED:
+        return
+    if isinstance(obj, Entry):
+        purge(_stored_entry_tags(obj))
+    else:
+        purge(_link_tags(obj))
+
+def purge_commented(content_type_id, object_id):
+    """
+    Purges the pages showing the Entry or Link with the given content
+    type and id, after its comments or comment count changed.
+    
+    """
+    if not ENABLED:
+        return
+    if content_type_id == ContentType.objects.get_for_model(Entry).id:
+        purge(_stored_entry_tags(Entry(pk=object_id)))
+    elif content_type_id == ContentType.objects.get_for_model(Link).id:
+        try:
+            purge(_link_tags(Link.objects.get(pk=object_id)))
+        except Link.DoesNotExist:
+            pass
+
+def purge_comment_pages(sender, instance, **kwargs):
+    purge_commented(instance.content_type_id, instance.object_id)
+
+
+for model in (Category, Entry, Link):
+    signals.pre_save.connect(capture_tags, sender=model)
+    signals.post_save.connect(purge_pages, sender=model)
+    signals.pre_delete.connect(capture_tags, sender=model)
+    signals.post_delete.connect(purge_pages, sender=model)
+entry_categories_changing.connect(capture_tags, sender=Entry)
+entry_categories_changed.connect(purge_pages, sender=Entry)
+signals.post_save.connect(purge_comment_pages, sender=comment_model)
+signals.post_delete.connect(purge_comment_pages, sender=comment_model)
@@ -0,0 +1,100 @@
+"""
+Keyset ("seek") pagination of Entries and Links by ``(pub_date, id)``.
+
+Unlike ``OFFSET`` pagination, which has the database walk past every
+row of the earlier pages, each page here is fetched by seeking to the
+position of a cursor, so page 300 costs the same as page 1.
+
+A cursor is an opaque string naming the ``pub_date`` and ``id`` of
+the object at the edge of a page; pages run newest first, and are
+requested with ``after=<cursor>`` for the next (older) page or
+``before=<cursor>`` for the previous (newer) one.
+
+"""
+
+import datetime
+
+from django.db.models import Q
+from django.http import Http404
+
+
+CURSOR_DATE_FORMAT = '%Y%m%d%H%M%S'
+
+
+def encode_cursor(obj, date_field='pub_date'):
+    """
+    Returns the cursor identifying the position of ``obj``.
+    
+    """
+    date = getattr(obj, date_field)
+    return '%s.%06d-%s' % (date.strftime(CURSOR_DATE_FORMAT), date.microsecond, obj.id)
+
+def decode_cursor(cursor):
+    """
+    Returns the ``(datetime, id)`` pair a cursor identifies, raising
+    ``Http404`` if it is malformed.
+    
+    """
+    try:
+        date, id = cursor.split('-')
+        date, microsecond = date.split('.')
+        date = datetime.datetime.strptime(date, CURSOR_DATE_FORMAT)
+        return date.replace(microsecond=int(microsecond)), int(id)
+    except ValueError:
+        raise Http404
+
+
+class KeysetPage(object):
+    """
+    A page of objects fetched by keyset pagination.
+    
+    ``next_cursor`` and ``previous_cursor`` are ``None`` when there is
+    no next or previous page. They are made by ``encode_cursor``,
+    unless another function is given as ``encode``.
+    
+    """
+    def __init__(self, object_list, has_next, has_previous, date_field='pub_date', encode=None):
+        self.object_list = object_list
+        self.next_cursor = self.previous_cursor = None
+        if encode is None:
+            encode = lambda obj: encode_cursor(obj, date_field)
+        if object_list and has_next:
+            self.next_cursor = encode(object_list[-1])
+        if object_list and has_previous:
+            self.previous_cursor = encode(object_list[0])
+    
+    def has_next(self):
+        return self.next_cursor is not None
+    
+    def has_previous(self):
+        return self.previous_cursor is not None
+    
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def get_page(queryset, per_page, after=None, before=None, date_field='pub_date'):
+    """
+    Returns the ``KeysetPage`` of at most ``per_page`` objects from
+    ``queryset`` which follows the cursor ``after`` or precedes the
+    cursor ``before``; with neither, returns the first page.
+    
+    Each page is a single query for ``per_page + 1`` rows, the extra
+    row only telling whether there is a further page.
+    
+    """
+    if before is not None:
+        date, id = decode_cursor(before)
+        queryset = queryset.filter(Q(**{ '%s__gt' % date_field: date }) |
+                                   Q(**{ date_field: date, 'id__gt': id }))
+        object_list = list(queryset.order_by(date_field, 'id')[:per_page + 1])
+        has_previous = len(object_list) > per_page
+        object_list = object_list[:per_page]
+        object_list.reverse()
+        return KeysetPage(object_list, True, has_previous, date_field)
+    if after is not None:
+        date, id = decode_cursor(after)
+        queryset = queryset.filter(Q(**{ '%s__lt' % date_field: date }) |
+                                   Q(**{ date_field: date, 'id__lt': id }))
+    object_list = list(queryset.order_by('-%s' % date_field, '-id')[:per_page + 1])
+    return KeysetPage(object_list[:per_page], len(object_list) > per_page, after is not None, date_field)
@@ -0,0 +1,278 @@
+"""
+Precomputed related Entries.
+
+Every live Entry is described by a sparse vector over its Tags and
+Categories, each weighted by its inverse document frequency -- so
+that sharing a rare Tag counts for more than sharing a common one --
+and scaled to unit length. The ``COLTRANE_RELATED_ENTRIES`` (5 by
+default) Entries with the highest cosine similarity to it are stored
+as ``RelatedEntry`` rows, which ``Entry.get_related_entries()`` and
+the ``get_related_entries`` template tag read.
+
+Similarities are computed for a batch of Entries at a time. If SciPy
+is installed, each batch is a product of a slice of the sparse
+Entry/feature matrix with the whole of it; otherwise each Entry's
+scores are summed along an inverted index from each feature to the
+Entries carrying it. Either way only Entries sharing at least one
+feature are touched, and nothing is stored densely.
+
+Recomputing needs the features of every live Entry, so it isn't done
+while an Entry is saved: a change to an Entry's Tags, Categories or
+status only queues a ``RelatedEntryUpdate``. Running the
+``rebuild_related_entries`` management command with ``--queued``
+(e.g. every few minutes from cron) recomputes the Entries sharing a
+Tag or Category with the queued changes, before or after them, and
+purges their cached detail pages. The weights of the features
+themselves drift a little as Entries come and go; running the command
+without ``--queued`` recomputes every Entry from scratch.
+
+"""
+
+import heapq
+import math
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import signals
+from tagging.utils import parse_tag_input
+
+from coltrane import page_cache
+from coltrane.models import Entry, RelatedEntry, RelatedEntryUpdate
+from coltrane.signals import entry_categories_changed, entry_categories_changing
+
+try:
+    import numpy
+    from scipy import sparse
+except ImportError:
+    sparse = None
+
+
+NUM_RELATED = getattr(settings, 'COLTRANE_RELATED_ENTRIES', 5)
+BATCH_SIZE = getattr(settings, 'COLTRANE_RELATED_BATCH_SIZE', 500)
+
+# The most ids put in one ``IN`` list; SQLite allows 999 parameters.
+CHUNK_SIZE = 500
+
+
+def _tag_features(tags):
+    return set(['tag:%s' % name.lower() for name in parse_tag_input(tags)])
+
+def features():
+    """
+    Returns a dictionary mapping the id of every live Entry to the set
+    of its features: 'tag:<name>' for each of its Tags and
+    'category:<id>' for each of its Categories.
+    
+    """
+    result = {}
+    for id, tags in Entry.live.values_list('id', 'tags').iterator():
+        result[id] = _tag_features(tags)
+    qn = connection.ops.quote_name
+    field = Entry._meta.get_field('categories')
+    cursor = connection.cursor()
+    cursor.execute('SELECT %s, %s FROM %s' % (qn(field.m2m_column_name()),
+                                              qn(field.m2m_reverse_name()),
+                                              qn(field.m2m_db_table())))
+    for entry_id, category_id in cursor.fetchall():
+        if entry_id in result:
+            result[entry_id].add('category:%s' % category_id)
+    return result
+
+def vectors(entry_features):
+    """
+    Returns a dictionary mapping each Entry id in ``entry_features``
+    to its unit-length vector, as a dictionary from feature to weight.
+    
+    """
+    frequencies = {}
+    for entry_id, feature_set in entry_features.items():
+        for feature in feature_set:
+            frequencies[feature] = frequencies.get(feature, 0) + 1
+    total = float(len(entry_features))
+    result = {}
+    for entry_id, feature_set in entry_features.items():
+        vector = dict([(feature, 1 + math.log(total / frequencies[feature])) for feature in feature_set])
+        norm = math.sqrt(sum([weight * weight for weight in vector.values()])) or 1.0
+        result[entry_id] = dict([(feature, weight / norm) for feature, weight in vector.items()])
+    return result
+
+def _compute_sparse(ids, entry_vectors):
+    entry_ids = sorted(entry_vectors)
+    rows = dict([(entry_id, i) for i, entry_id in enumerate(entry_ids)])
+    columns = {}
+    data, row_indexes, column_indexes = [], [], []
+    for entry_id, vector in entry_vectors.items():
+        for feature, weight in vector.items():
+            data.append(weight)
+            row_indexes.append(rows[entry_id])
+            column_indexes.append(columns.setdefault(feature, len(columns)))
+    matrix = sparse.csr_matrix((numpy.array(data, dtype=numpy.float32), (row_indexes, column_indexes)),
+                               shape=(len(entry_ids), max(1, len(columns))))
+    transposed = matrix.T.tocsr()
+    results = {}
+    for start in range(0, len(ids), BATCH_SIZE):
+        batch = ids[start:start + BATCH_SIZE]
+        scores = (matrix[[rows[entry_id] for entry_id in batch]] * transposed).tocsr()
+        for i, entry_id in enumerate(batch):
+            row = scores.getrow(i)
+            candidates = [(entry_ids[j], float(score)) for j, score in zip(row.indices, row.data)
+                          if j != rows[entry_id] and score > 0]
+            results[entry_id] = heapq.nlargest(NUM_RELATED, candidates, key=lambda item: item[1])
+    return results
+
+def _compute_python(ids, entry_vectors):
+    postings = {}
+    for entry_id, vector in entry_vectors.items():
+        for feature, weight in vector.items():
+            postings.setdefault(feature, []).append((entry_id, weight))
+    results = {}
+    for entry_id in ids:
+        scores = {}
+        for feature, weight in entry_vectors[entry_id].items():
+            for other_id, other_weight in postings[feature]:
+                if other_id != entry_id:
+                    scores[other_id] = scores.get(other_id, 0) + weight * other_weight
+        best = heapq.nlargest(NUM_RELATED, scores.items(), key=lambda item: item[1])
+        results[entry_id] = [(other_id, score) for other_id, score in best if score > 0]
+    return results
+
+def compute(ids, entry_features=None):
+    """
+    Returns a dictionary mapping each of ``ids`` to a list of the
+    ``(id, score)`` of its most similar live Entries, best first; ids
+    which aren't of live Entries map to an empty list.
+    
+    """
+    if entry_features is None:
+        entry_features = features()
+    entry_vectors = vectors(entry_features)
+    live_ids = [entry_id for entry_id in ids if entry_id in entry_vectors]
+    if sparse is not None:
+        results = _compute_sparse(live_ids, entry_vectors)
+    else:
+        results = _compute_python(live_ids, entry_vectors)
+    for entry_id in ids:
+        results.setdefault(entry_id, [])
+    return results
+
+def _chunks(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), CHUNK_SIZE):
+        yield ids[start:start + CHUNK_SIZE]
+
+def store(results):
+    """
+    Replaces the stored related Entries of each Entry in ``results``
+    (as returned by ``compute()``).
+    
+    """
+    for chunk in _chunks(results):
+        RelatedEntry.objects.filter(entry__pk__in=chunk).delete()
+    rows = []
+    for entry_id, related in results.items():
+        for rank, (related_id, score) in enumerate(related):
+            rows.append((entry_id, related_id, score, rank))
+    if rows:
+        qn = connection.ops.quote_name
+        opts = RelatedEntry._meta
+        columns = [qn(opts.get_field(name).column) for name in ('entry', 'related', 'score', 'rank')]
+        connection.cursor().executemany('INSERT INTO %s (%s) VALUES (%%s, %%s, %%s, %%s)' % \
+                                        (qn(opts.db_table), ', '.join(columns)),
+                                        rows)
+
+def _purge_details(ids):
+    """
+    Purges the cached detail pages of the live Entries with ``ids``.
+    
+    """
+    if not page_cache.ENABLED:
+        return
+    for chunk in _chunks(ids):
+        details = Entry.live.filter(pk__in=chunk).values_list('pub_date', 'slug')
+        page_cache.purge([page_cache.date_tags('entry', pub_date, slug)[-1] for pub_date, slug in details])
+
+def rebuild():
+    """
+    Recomputes the related Entries of every Entry, and forgets any
+    queued changes.
+    
+    """
+    RelatedEntryUpdate.objects.all().delete()
+    entry_features = features()
+    ids = sorted(entry_features)
+    RelatedEntry.objects.exclude(entry__status=Entry.LIVE_STATUS).delete()
+    for start in range(0, len(ids), BATCH_SIZE):
+        store(compute(ids[start:start + BATCH_SIZE], entry_features))
+
+def process_queued():
+    """
+    Recomputes the related Entries of the Entries whose Tags,
+    Categories or status changed since the last run, and of the live
+    Entries sharing a Tag or Category with them before or after the
+    change, purges their cached detail pages, and returns how many
+    were recomputed.
+    
+    """
+    updates = list(RelatedEntryUpdate.objects.values_list('id', 'entry_id', 'features'))
+    if not updates:
+        return 0
+    changed = set()
+    changed_ids = set()
+    for update_id, entry_id, feature_lines in updates:
+        changed_ids.add(entry_id)
+        changed.update([feature for feature in feature_lines.split('\n') if feature])
+    entry_features = features()
+    affected = set(changed_ids)
+    for entry_id, feature_set in entry_features.items():
+        if feature_set & changed:
+            affected.add(entry_id)
+    affected = sorted(affected)
+    for start in range(0, len(affected), BATCH_SIZE):
+        store(compute(affected[start:start + BATCH_SIZE], entry_features))
+    _purge_details(affected)
+    RelatedEntryUpdate.objects.filter(pk__lte=max([update[0] for update in updates])).delete()
+    return len(affected)
+
+def _state(entry):
+    """
+    Returns the ``(is_live, features)`` stored for ``entry``.
+    
+    """
+    try:
+        stored = Entry.objects.get(pk=entry.id)
+    except Entry.DoesNotExist:
+        return None
+    feature_set = _tag_features(stored.tags)
+    feature_set.update(['category:%s' % category_id
+                        for category_id in stored.categories.values_list('id', flat=True)])
+    return (stored.status == Entry.LIVE_STATUS, feature_set)
+
+def capture_state(sender, instance, **kwargs):
+    instance._related_state = instance.id and _state(instance) or None
+
+def queue_update(sender, instance, **kwargs):
+    """
+    Queues a ``RelatedEntryUpdate`` for an Entry whose Tags,
+    Categories or status changed, if it is or was live.
+    
+    """
+    old = getattr(instance, '_related_state', None)
+    new = None
+    if kwargs.get('signal') is not signals.post_delete:
+        new = _state(instance)
+    instance._related_state = new
+    if old == new or not [state for state in (old, new) if state is not None and state[0]]:
+        return
+    changed = set()
+    for state in (old, new):
+        if state is not None:
+            changed.update(state[1])
+    RelatedEntryUpdate.objects.create(entry_id=instance.id, features='\n'.join(sorted(changed)))
+
+
+signals.pre_save.connect(capture_state, sender=Entry)
+signals.post_save.connect(queue_update, sender=Entry)
+signals.pre_delete.connect(capture_state, sender=Entry)
+signals.post_delete.connect(queue_update, sender=Entry)
+entry_categories_changing.connect(capture_state, sender=Entry)
+entry_categories_changed.connect(queue_update, sender=Entry)
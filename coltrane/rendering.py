@@ -0,0 +1,42 @@
+"""
+Memoized text-to-HTML conversion.
+
+``render`` wraps ``template_utils.markup.formatter``, caching the
+HTML it produces under a hash of the source text and the
+``MARKUP_FILTER`` setting, so that re-saving an object whose text
+hasn't changed doesn't run the formatter again, while changing
+``MARKUP_FILTER`` still produces fresh HTML.
+
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.encoding import smart_str
+from django.utils.hashcompat import md5_constructor
+from template_utils.markup import formatter
+
+
+CACHE_TIMEOUT = getattr(settings, 'COLTRANE_MARKUP_CACHE_TIMEOUT', 60 * 60 * 24 * 30)
+
+
+def cache_key(text):
+    """
+    Returns the cache key of the HTML for ``text`` under the current
+    ``MARKUP_FILTER``.
+    
+    """
+    fingerprint = '%r:%s' % (getattr(settings, 'MARKUP_FILTER', None), smart_str(text))
+    return 'coltrane.rendering.%s' % md5_constructor(fingerprint).hexdigest()
+
+def render(text):
+    """
+    Returns ``text`` converted to HTML by ``formatter``, reusing a
+    cached result if the same text has been converted before.
+    
+    """
+    key = cache_key(text)
+    html = cache.get(key)
+    if html is None:
+        html = formatter(text)
+        cache.set(key, html, CACHE_TIMEOUT)
+    return html
@@ -0,0 +1,270 @@
+"""
+A full-text search index of Entries and Links.
+
+The index is an inverted index kept in the ``SearchPosting`` table:
+one row per (term, object), holding the term's weighted frequency in
+the object (words in the title count ``TITLE_WEIGHT`` times). It is
+updated whenever an Entry or Link is saved or deleted, and can be
+rebuilt from scratch with the ``rebuild_search_index`` management
+command.
+
+A query matches the objects containing every one of its terms, and
+these are ranked by the sum of their terms' weighted frequency times
+inverse document frequency, computed in Python from the postings of
+the query's terms. The only other query is a count of each model's
+objects for the inverse document frequency, which is cached for
+``COLTRANE_SEARCH_COUNT_TIMEOUT`` seconds (an hour by default); only
+the objects on the page of results shown are fetched.
+
+Entries of every status are indexed, so the admin can search drafts
+(see ``filter_matching()``). Each posting records whether its object
+is public, so public searches only return live Entries without
+looking up which of the matches are live; they leave out objects
+dated in the future with a subquery on the few of them there are.
+
+"""
+
+import datetime
+import math
+import re
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import signals
+from django.utils.html import escape, strip_tags
+from django.utils.safestring import mark_safe
+
+from coltrane.models import Entry, Link, SearchPosting
+
+
+TITLE_WEIGHT = 3
+SNIPPET_LENGTH = getattr(settings, 'COLTRANE_SEARCH_SNIPPET_LENGTH', 200)
+COUNT_TIMEOUT = getattr(settings, 'COLTRANE_SEARCH_COUNT_TIMEOUT', 60 * 60)
+COUNT_KEY = 'coltrane.search.count.%s'
+TERM_LENGTH = SearchPosting._meta.get_field('term').max_length
+
+# Field names of the indexed text of each model, and of the HTML its
+# snippets are taken from.
+SEARCH_FIELDS = {
+    Entry: (('excerpt', 'body'), ('excerpt_html', 'body_html')),
+    Link: (('description',), ('description_html',)),
+    }
+
+word_re = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    """
+    Returns the list of index terms in ``text``, which may be HTML.
+    
+    """
+    return [word[:TERM_LENGTH] for word in word_re.findall(strip_tags(text or u'').lower()) if len(word) > 1]
+
+def _is_public(obj):
+    return not isinstance(obj, Entry) or obj.status == Entry.LIVE_STATUS
+
+def _weights(obj):
+    weights = {}
+    for term in tokenize(obj.title):
+        weights[term] = weights.get(term, 0) + TITLE_WEIGHT
+    for field_name in SEARCH_FIELDS[obj.__class__][0]:
+        for term in tokenize(getattr(obj, field_name)):
+            weights[term] = weights.get(term, 0) + 1
+    return weights
+
+def unindex(obj):
+    """
+    Removes ``obj`` from the index.
+    
+    """
+    ctype = ContentType.objects.get_for_model(obj)
+    SearchPosting.objects.filter(content_type__pk=ctype.id, object_id=obj.id).delete()
+
+def index(obj):
+    """
+    Replaces the postings of ``obj`` with ones for its current text.
+    
+    """
+    unindex(obj)
+    ctype = ContentType.objects.get_for_model(obj)
+    opts = SearchPosting._meta
+    qn = connection.ops.quote_name
+    columns = [opts.get_field(name).column for name in ('term', 'content_type', 'object_id', 'weight', 'public')]
+    public = opts.get_field('public').get_db_prep_save(_is_public(obj))
+    rows = [(term, ctype.id, obj.id, weight, public) for term, weight in _weights(obj).items()]
+    if rows:
+        cursor = connection.cursor()
+        cursor.executemany('INSERT INTO %s (%s) VALUES (%%s, %%s, %%s, %%s, %%s)' % \
+                           (qn(opts.db_table), ', '.join([qn(column) for column in columns])),
+                           rows)
+
+def _document_count(model):
+    """
+    Returns the number of objects of ``model``, as counted at most
+    ``COUNT_TIMEOUT`` seconds ago.
+    
+    """
+    key = COUNT_KEY % model._meta.object_name.lower()
+    count = cache.get(key)
+    if count is None:
+        count = model._default_manager.count()
+        cache.set(key, count, COUNT_TIMEOUT)
+    return count
+
+def _rank(model, terms, public=False):
+    """
+    Returns a list of ``(score, id)`` pairs for the objects of
+    ``model`` containing every one of ``terms``, best first. If
+    ``public`` is ``True``, only public objects whose publication
+    time has passed are ranked.
+    
+    """
+    ctype = ContentType.objects.get_for_model(model)
+    postings = SearchPosting.objects.filter(content_type__pk=ctype.id, term__in=terms)
+    if public:
+        qn = connection.ops.quote_name
+        model_opts = model._meta
+        where = '%s.%s NOT IN (SELECT %s FROM %s WHERE %s > %%s)' % \
+                (qn(SearchPosting._meta.db_table), qn(SearchPosting._meta.get_field('object_id').column),
+                 qn(model_opts.pk.column), qn(model_opts.db_table), qn(model_opts.get_field('pub_date').column))
+        postings = postings.filter(public=True).extra(where=[where], params=[datetime.datetime.now()])
+    by_term = {}
+    for term, object_id, weight in postings.values_list('term', 'object_id', 'weight').iterator():
+        by_term.setdefault(term, {})[object_id] = weight
+    if len(by_term) < len(terms):
+        return []
+    document_count = float(_document_count(model))
+    ids = None
+    for weights in by_term.values():
+        ids = ids is None and set(weights) or ids & set(weights)
+    scores = dict.fromkeys(ids, 0.0)
+    for weights in by_term.values():
+        idf = math.log(1 + document_count / len(weights))
+        for object_id in ids:
+            scores[object_id] += weights[object_id] * idf
+    ranked = [(score, object_id) for object_id, score in scores.items()]
+    ranked.sort()
+    ranked.reverse()
+    return ranked
+
+def filter_matching(queryset, query):
+    """
+    Narrows ``queryset`` down to the objects matching ``query``, with a
+    subquery on the index (so any number of objects may match), or
+    returns it as it is if ``query`` contains no index terms.
+    
+    """
+    terms = list(set(tokenize(query)))
+    if not terms:
+        return queryset
+    qn = connection.ops.quote_name
+    model_opts = queryset.model._meta
+    opts = SearchPosting._meta
+    object_id = qn(opts.get_field('object_id').column)
+    where = '%s.%s IN (SELECT %s FROM %s WHERE %s = %%s AND %s IN (%s) GROUP BY %s HAVING COUNT(*) = %%s)' % \
+            (qn(model_opts.db_table), qn(model_opts.pk.column), object_id, qn(opts.db_table),
+             qn(opts.get_field('content_type').column), qn(opts.get_field('term').column),
+             ', '.join(['%s'] * len(terms)), object_id)
+    params = [ContentType.objects.get_for_model(queryset.model).id] + terms + [len(terms)]
+    return queryset.extra(where=[where], params=params)
+
+
+class SearchResult(object):
+    """
+    An object matching a search, with its score and a snippet of its
+    text around the first match.
+    
+    """
+    def __init__(self, object, score, terms):
+        self.object = object
+        self.score = score
+        self.terms = terms
+    
+    def _get_snippet(self):
+        text = u' '.join([strip_tags(getattr(self.object, field_name) or u'')
+                          for field_name in SEARCH_FIELDS[self.object.__class__][1]])
+        return highlight(text, self.terms)
+    snippet = property(_get_snippet)
+    
+    def _get_model_name(self):
+        return self.object._meta.module_name
+    model_name = property(_get_model_name)
+
+
+def highlight(text, terms, length=SNIPPET_LENGTH):
+    """
+    Returns about ``length`` characters of plain ``text`` around the
+    first occurrence of any of ``terms``, HTML-escaped and with every
+    occurrence of a term wrapped in ``<strong>``.
+    
+    """
+    if not terms:
+        return escape(text[:length])
+    term_re = re.compile(r'\b(%s)\b' % '|'.join([re.escape(term) for term in terms]), re.IGNORECASE | re.UNICODE)
+    match = term_re.search(text)
+    start = match and max(0, match.start() - length // 4) or 0
+    excerpt = text[start:start + length]
+    pieces = []
+    position = 0
+    for match in term_re.finditer(excerpt):
+        pieces.append(escape(excerpt[position:match.start()]))
+        pieces.append(u'<strong>%s</strong>' % escape(match.group(0)))
+        position = match.end()
+    pieces.append(escape(excerpt[position:]))
+    return mark_safe(u'%s%s%s' % (start and u'&hellip;' or u'',
+                                  u''.join(pieces),
+                                  start + length < len(text) and u'&hellip;' or u''))
+
+def search(query):
+    """
+    Returns a list of the ``(score, model, id)`` of each live Entry
+    and Link matching ``query`` whose publication time has passed,
+    best first, from the index alone;
+    pass the slice shown to ``get_results()`` to fetch the objects.
+    
+    """
+    terms = list(set(tokenize(query)))
+    if not terms:
+        return []
+    results = [(score, Entry, object_id) for score, object_id in _rank(Entry, terms, public=True)]
+    results.extend([(score, Link, object_id) for score, object_id in _rank(Link, terms, public=True)])
+    results.sort()
+    results.reverse()
+    return results
+
+def get_results(ranked, query):
+    """
+    Returns ``SearchResult`` objects for a slice of the list returned
+    by ``search()``, fetching the objects with one query per model.
+    
+    """
+    terms = list(set(tokenize(query)))
+    objects = {}
+    for model in (Entry, Link):
+        objects[model] = model._default_manager.in_bulk([object_id for score, m, object_id in ranked if m is model])
+    return [SearchResult(objects[model][object_id], score, terms)
+            for score, model, object_id in ranked if object_id in objects[model]]
+
+def rebuild():
+    """
+    Rebuilds the whole index.
+    
+    """
+    SearchPosting.objects.all().delete()
+    for model in (Entry, Link):
+        for obj in model._default_manager.all().iterator():
+            index(obj)
+rebuild = transaction.commit_on_success(rebuild)
+
+
+def update_index(sender, instance, **kwargs):
+    index(instance)
+
+def remove_from_index(sender, instance, **kwargs):
+    unindex(instance)
+
+for model in (Entry, Link):
+    signals.post_save.connect(update_index, sender=model)
+    signals.post_delete.connect(remove_from_index, sender=model)
@@ -0,0 +1,19 @@
+"""
+Custom signals sent by coltrane.
+
+"""
+
+from django.dispatch import Signal
+
+
+# Sent with the Entry as ``instance`` before and after its Categories
+# are changed. Django sends no signal when a many-to-many relation is
+# saved, so ``Entry.categories`` sends these itself whenever it is
+# assigned to or its ``add()``, ``remove()`` or ``clear()`` is called,
+# as the admin does. Changes made any other way -- through
+# ``Category.entry_set``, or in SQL -- send neither; send them around
+# the change, or run the ``rebuild_archive_index``,
+# ``rebuild_category_counts`` and ``rebuild_related_entries``
+# management commands afterwards.
+entry_categories_changing = Signal(providing_args=['instance'])
+entry_categories_changed = Signal(providing_args=['instance'])
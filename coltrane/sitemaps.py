@@ -0,0 +1,320 @@
+"""
+XML sitemaps of a weblog's Entries, Links, Categories and date
+archives.
+
+The sitemap index lists each section split into shards of at most
+``COLTRANE_SITEMAP_LIMIT`` URLs (50,000, the limit of the sitemap
+protocol). Entries and Links are sharded by date, packing whole days
+into each shard using the counts in the archive index
+(``coltrane.archive``), so a shard always covers the same range of
+days until the counts around it change.
+
+Shards are built by streaming ``(pub_date, slug)`` rows rather than
+instantiating objects, and cached under a key which includes the
+range of days they cover and the versions of the months in it; when
+a change to the counts moves a shard's boundaries, its key changes
+too, so a copy built for the old range is never served. Saving or deleting an Entry or
+Link bumps the versions of the months it was and is in, so only the
+shards covering those months are rebuilt.
+
+Objects dated in the future are left out until their publication
+time passes, when the ``publish_scheduled`` management command bumps
+the versions of their months.
+
+"""
+
+import datetime
+import time
+
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.core.urlresolvers import NoReverseMatch, reverse
+from django.db.models import signals
+from django.http import Http404, HttpResponse
+from django.utils.hashcompat import md5_constructor
+from django.utils.xmlutils import SimplerXMLGenerator
+
+from coltrane.archive import get_buckets
+from coltrane.export import date_kwargs
+from coltrane.models import Category, Entry, Link
+
+
+LIMIT = getattr(settings, 'COLTRANE_SITEMAP_LIMIT', 50000)
+CACHE_TIMEOUT = getattr(settings, 'COLTRANE_SITEMAP_CACHE_TIMEOUT', 60 * 60 * 24 * 7)
+
+SECTIONS = ('entries', 'links', 'categories', 'archives')
+
+# The sections' models, for those sharded by date.
+DATE_SECTIONS = {
+    'entries': Entry,
+    'links': Link,
+    }
+
+# Versions of the sections which aren't sharded by date.
+CATEGORIES_VERSION = 'categories'
+ARCHIVES_VERSION = 'archives'
+
+
+def _version_key(name):
+    return 'coltrane.sitemaps.version.%s' % name
+
+def _versions(names):
+    """
+    Returns the current versions of ``names``, in order, setting any
+    which are missing to the current time.
+    
+    """
+    keys = [_version_key(name) for name in names]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            versions[key] = repr(time.time())
+            cache.set(key, versions[key], CACHE_TIMEOUT)
+    return [versions[key] for key in keys]
+
+def _bump(names):
+    version = repr(time.time())
+    for name in set(names):
+        cache.set(_version_key(name), version, CACHE_TIMEOUT)
+
+def _month(model, date):
+    return '%s.%s' % (model._meta.module_name, date.strftime('%Y.%m'))
+
+def _absolute(url):
+    return 'http://%s%s' % (Site.objects.get_current().domain, url)
+
+
+def date_shards(model):
+    """
+    Returns a list of ``(start, end, months)`` tuples describing the
+    shards of ``model``: each holds the objects published on or after
+    the date ``start`` and before the date ``end`` (either being
+    ``None`` for no bound), and ``months`` names the version of each
+    month in that range.
+    
+    A single day with more objects than the limit gets a shard of its
+    own, which is then over the limit.
+    
+    """
+    shards = []
+    start = None
+    total = 0
+    months = []
+    days = get_buckets(model).filter(day__gt=0, count__gt=0).order_by('year', 'month', 'day')
+    for year, month, day, count in days.values_list('year', 'month', 'day', 'count').iterator():
+        date = datetime.date(year, month, day)
+        if start is not None and total + count > LIMIT:
+            shards.append((start, date, months))
+            start, total, months = None, 0, []
+        if start is None:
+            start = date
+        total += count
+        if not months or months[-1] != _month(model, date):
+            months.append(_month(model, date))
+    if start is None:
+        return [(None, None, [])]
+    shards.append((start, None, months))
+    shards[0] = (None,) + shards[0][1:]
+    return shards
+
+def _date_urls(model, start, end):
+    if model is Entry:
+        qs = Entry.live.all()
+    else:
+        qs = Link.objects.all()
+    # Like the archive index the shards are built from, leave out
+    # objects dated in the future.
+    qs = qs.filter(pub_date__lte=datetime.datetime.now())
+    if start is not None:
+        qs = qs.filter(pub_date__gte=datetime.datetime.combine(start, datetime.time.min))
+    if end is not None:
+        qs = qs.filter(pub_date__lt=datetime.datetime.combine(end, datetime.time.min))
+    url_name = 'coltrane_%s_detail' % model._meta.module_name
+    for pub_date, slug in qs.order_by('pub_date', 'id').values_list('pub_date', 'slug').iterator():
+        kwargs = date_kwargs(pub_date.year, pub_date.month, pub_date.day, slug)
+        yield reverse(url_name, kwargs=kwargs), pub_date
+
+def _category_urls():
+    for slug, last_entry_date in Category.objects.order_by('id').values_list('slug', 'last_entry_date').iterator():
+        yield reverse('coltrane_category_detail', kwargs={ 'slug': slug }), last_entry_date
+
+def _archive_urls():
+    for model in (Entry, Link):
+        name = model._meta.module_name
+        try:
+            yield reverse('coltrane_%s_archive_index' % name), None
+        except NoReverseMatch:
+            continue
+        for year, month, day in get_buckets(model).filter(count__gt=0).values_list('year', 'month', 'day').iterator():
+            route = day and 'day' or month and 'month' or 'year'
+            yield reverse('coltrane_%s_archive_%s' % (name, route), kwargs=date_kwargs(year, month, day)), None
+
+def _chunk(urls, shard):
+    """
+    Yields the ``shard``-th run of ``LIMIT`` items from ``urls``.
+    
+    """
+    first = shard * LIMIT
+    for i, item in enumerate(urls):
+        if i >= first + LIMIT:
+            break
+        if i >= first:
+            yield item
+
+def shards(section):
+    """
+    Returns a list of the ``(urls, versions, bounds)`` of each shard
+    of ``section``: ``urls`` is a callable yielding the ``(url,
+    lastmod)`` of every page in the shard, ``versions`` the names of
+    the versions its cached copy depends on, and ``bounds`` a string
+    naming the range it covers.
+    
+    Raises ``NoReverseMatch`` if the section's URLconf isn't included
+    in the project's.
+    
+    """
+    if section in DATE_SECTIONS:
+        model = DATE_SECTIONS[section]
+        reverse('coltrane_%s_archive_index' % model._meta.module_name)
+        return [(lambda start=start, end=end: _date_urls(model, start, end), months, '%s-%s' % (start, end))
+                for start, end, months in date_shards(model)]
+    if section == 'categories':
+        reverse('coltrane_category_list')
+        count = Category.objects.count()
+        return [(lambda shard=shard: _chunk(_category_urls(), shard), [CATEGORIES_VERSION], '')
+                for shard in range(max(1, (count + LIMIT - 1) // LIMIT))]
+    count = sum([get_buckets(model).filter(count__gt=0).count() + 1 for model in (Entry, Link)])
+    return [(lambda shard=shard: _chunk(_archive_urls(), shard), [ARCHIVES_VERSION], '')
+            for shard in range(max(1, (count + LIMIT - 1) // LIMIT))]
+
+def _write(handler, urls):
+    handler.startDocument()
+    handler.startElement(u'urlset', { u'xmlns': u'http://www.sitemaps.org/schemas/sitemap/0.9' })
+    for url, lastmod in urls:
+        handler.startElement(u'url', {})
+        handler.addQuickElement(u'loc', _absolute(url))
+        if lastmod is not None:
+            handler.addQuickElement(u'lastmod', lastmod.strftime('%Y-%m-%d'))
+        handler.endElement(u'url')
+    handler.endElement(u'urlset')
+
+
+class _Buffer(object):
+    """
+    Collects what is written to it as a list of strings, which is
+    cheaper than repeated concatenation for a large document.
+    
+    """
+    def __init__(self):
+        self.parts = []
+    
+    def write(self, s):
+        self.parts.append(s)
+    
+    def getvalue(self):
+        return ''.join(self.parts)
+
+
+def render_shard(section, shard):
+    """
+    Returns the XML of a shard of a section, from the cache if its
+    versions haven't changed since it was last built.
+    
+    """
+    try:
+        urls, names, bounds = shards(section)[shard]
+    except (IndexError, NoReverseMatch):
+        raise Http404
+    digest = md5_constructor(':'.join([bounds] + _versions(names))).hexdigest()
+    key = 'coltrane.sitemaps.shard.%s.%s.%s' % (section, shard, digest)
+    xml = cache.get(key)
+    if xml is None:
+        buffer = _Buffer()
+        _write(SimplerXMLGenerator(buffer, settings.DEFAULT_CHARSET), urls())
+        xml = buffer.getvalue()
+        cache.set(key, xml, CACHE_TIMEOUT)
+    return xml
+
+def sitemap_index(request):
+    """
+    The sitemap index, listing every shard of every section whose
+    URLconf is included in the project's.
+    
+    """
+    buffer = _Buffer()
+    handler = SimplerXMLGenerator(buffer, settings.DEFAULT_CHARSET)
+    handler.startDocument()
+    handler.startElement(u'sitemapindex', { u'xmlns': u'http://www.sitemaps.org/schemas/sitemap/0.9' })
+    for section in SECTIONS:
+        try:
+            count = len(shards(section))
+        except NoReverseMatch:
+            continue
+        for shard in range(count):
+            handler.startElement(u'sitemap', {})
+            url = reverse('coltrane_sitemap_section', kwargs={ 'section': section, 'shard': str(shard) })
+            handler.addQuickElement(u'loc', _absolute(url))
+            handler.endElement(u'sitemap')
+    handler.endElement(u'sitemapindex')
+    return HttpResponse(buffer.getvalue(), mimetype='application/xml')
+
+def sitemap_section(request, section, shard):
+    """
+    One shard of a section of the sitemap.
+    
+    """
+    if section not in SECTIONS:
+        raise Http404
+    return HttpResponse(render_shard(section, int(shard)), mimetype='application/xml')
+
+
+def capture_date(sender, instance, **kwargs):
+    """
+    Remembers the stored ``pub_date`` of an Entry or Link (if it is
+    listed in the sitemap) before it is saved or deleted.
+    
+    """
+    instance._sitemap_date = None
+    if instance.id:
+        fields = sender is Entry and ('pub_date', 'status') or ('pub_date',)
+        stored = list(sender._default_manager.filter(pk=instance.id).values_list(*fields))
+        if stored and (sender is Link or stored[0][1] == Entry.LIVE_STATUS):
+            instance._sitemap_date = stored[0][0]
+
+def bump_versions(sender, instance, **kwargs):
+    """
+    Bumps the versions of the months an Entry or Link was and is
+    listed in, and of the sections derived from them.
+    
+    """
+    names = []
+    old = getattr(instance, '_sitemap_date', None)
+    if old is not None:
+        names.append(_month(sender, old))
+    if kwargs.get('signal') is not signals.post_delete and \
+       (sender is Link or instance.status == Entry.LIVE_STATUS):
+        names.append(_month(sender, instance.pub_date))
+    if names:
+        _bump(names + [ARCHIVES_VERSION, CATEGORIES_VERSION])
+
+def bump_categories(sender, instance, **kwargs):
+    _bump([CATEGORIES_VERSION])
+
+def bump_dates(model, dates):
+    """
+    Bumps the versions of the months of ``dates`` in ``model``'s
+    section, and of the sections derived from them, for changes made
+    without sending the signals which bump them.
+    
+    """
+    _bump([_month(model, date) for date in dates] + [ARCHIVES_VERSION, CATEGORIES_VERSION])
+
+
+for model in (Entry, Link):
+    signals.pre_save.connect(capture_date, sender=model)
+    signals.post_save.connect(bump_versions, sender=model)
+    signals.pre_delete.connect(capture_date, sender=model)
+    signals.post_delete.connect(bump_versions, sender=model)
+signals.post_save.connect(bump_categories, sender=Category)
+signals.post_delete.connect(bump_categories, sender=Category)
@@ -0,0 +1,155 @@
+"""
+A single chronological stream of live Entries and Links whose
+publication time has passed.
+
+A page of the stream is a k-way merge, with ``heapq.merge``, of the
+newest rows of each source past the page's cursor: at most
+``per_page + 1`` rows are fetched from each, however long the archive
+is, and nothing is sorted in Python beyond merging the two short,
+already ordered lists.
+
+Objects are ordered by ``pub_date``, then by source and ``id`` so that
+the order is total; cursors (see ``coltrane.pagination``) name all
+three, e.g. '20080821143000.000000-e42' for the Entry with id 42.
+Each object on a page gets a ``stream_type`` attribute of 'entry' or
+'link', for templates to tell them apart.
+
+"""
+
+import datetime
+import heapq
+
+from django.db.models import Q
+from django.http import Http404
+
+from coltrane import pagination
+from coltrane.models import Entry, Link
+
+
+# The sources of the stream: the ``stream_type`` of their objects, the
+# code standing for it in cursors, and its rank in the order of objects
+# published at the same moment.
+SOURCES = (
+    ('entry', 'e', 1),
+    ('link', 'l', 0),
+    )
+
+_CODES = dict([(stream_type, code) for stream_type, code, rank in SOURCES])
+_RANKS = dict([(code, rank) for stream_type, code, rank in SOURCES])
+
+
+def _querysets():
+    return { 'entry': Entry.live.listing(), 'link': Link.objects.listing() }
+
+def encode_cursor(obj):
+    """
+    Returns the cursor identifying the position of ``obj`` in the
+    stream.
+    
+    """
+    return '%s.%06d-%s%s' % (obj.pub_date.strftime(pagination.CURSOR_DATE_FORMAT),
+                             obj.pub_date.microsecond,
+                             _CODES[obj.stream_type],
+                             obj.id)
+
+def decode_cursor(cursor):
+    """
+    Returns the ``(datetime, rank, id)`` a stream cursor identifies,
+    raising ``Http404`` if it is malformed.
+    
+    """
+    try:
+        date, position = cursor.split('-')
+        code, id = position[:1], int(position[1:])
+        return pagination.decode_cursor('%s-%s' % (date, id))[0], _RANKS[code], id
+    except (KeyError, ValueError):
+        raise Http404
+
+def _seek(queryset, rank, cursor, older):
+    """
+    Filters ``queryset``, of the source of the given ``rank``, to the
+    objects older (or newer) than the position ``cursor``.
+    
+    """
+    date, cursor_rank, id = cursor
+    if rank == cursor_rank:
+        if older:
+            return queryset.filter(Q(pub_date__lt=date) | Q(pub_date=date, id__lt=id))
+        return queryset.filter(Q(pub_date__gt=date) | Q(pub_date=date, id__gt=id))
+    if older:
+        if rank < cursor_rank:
+            return queryset.filter(pub_date__lte=date)
+        return queryset.filter(pub_date__lt=date)
+    if rank > cursor_rank:
+        return queryset.filter(pub_date__gte=date)
+    return queryset.filter(pub_date__gt=date)
+
+def _sort_key(obj, rank, older):
+    delta = obj.pub_date - datetime.datetime.min
+    key = (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds, rank, obj.id
+    if older:
+        return tuple([-part for part in key])
+    return key
+
+def _source(stream_type, queryset, limit, cursor, older):
+    """
+    Yields ``(sort key, object)`` pairs for at most ``limit`` objects
+    of one source, nearest the cursor first.
+    
+    """
+    rank = _RANKS[_CODES[stream_type]]
+    if cursor is not None:
+        queryset = _seek(queryset, rank, cursor, older)
+    if older:
+        queryset = queryset.order_by('-pub_date', '-id')
+    else:
+        queryset = queryset.order_by('pub_date', 'id')
+    for obj in queryset[:limit]:
+        obj.stream_type = stream_type
+        yield _sort_key(obj, rank, older), obj
+
+def get_page(per_page, after=None, before=None, **lookups):
+    """
+    Returns the ``pagination.KeysetPage`` of at most ``per_page``
+    live Entries and Links, newest first, which follows the cursor
+    ``after`` or precedes the cursor ``before``; with neither, returns
+    the first page.
+    
+    Any keyword arguments are ``pub_date`` lookups restricting both
+    sources, e.g. ``pub_date__year=2008``.
+    
+    """
+    older = before is None
+    cursor = None
+    if after is not None or before is not None:
+        cursor = decode_cursor(after or before)
+    # Like the archive index ``dates()`` reads, the stream leaves out
+    # objects dated in the future.
+    now = datetime.datetime.now()
+    sources = []
+    for stream_type, queryset in _querysets().items():
+        queryset = queryset.filter(pub_date__lte=now).filter(**lookups)
+        sources.append(_source(stream_type, queryset, per_page + 1, cursor, older))
+    object_list = []
+    for key, obj in heapq.merge(*sources):
+        object_list.append(obj)
+        if len(object_list) > per_page:
+            break
+    more = len(object_list) > per_page
+    object_list = object_list[:per_page]
+    if older:
+        return pagination.KeysetPage(object_list, more, after is not None, encode=encode_cursor)
+    object_list.reverse()
+    return pagination.KeysetPage(object_list, True, more, encode=encode_cursor)
+
+def dates(kind, **lookups):
+    """
+    Returns the list of years (``kind`` 'year') or months (``kind``
+    'month') in which any live Entry or Link was published, newest
+    first, read from the archive index.
+    
+    """
+    date_list = set()
+    for queryset in _querysets().values():
+        date_list.update(queryset.filter(**lookups).dates('pub_date', kind))
+    return sorted(date_list, reverse=True)
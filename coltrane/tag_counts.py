@@ -0,0 +1,109 @@
+"""
+Maintenance of the precomputed tag usage counts.
+
+For every Tag, a ``TagCount`` per model stores how many live Entries,
+or how many Links, carry it, so that tag archives and tag clouds can
+be built from a single read of the ``TagCount`` table instead of one
+count query per Tag.
+
+The counts of a Tag are recounted, and its posting lists in
+``coltrane.tag_index`` dropped, whenever an Entry or Link gaining or
+losing it is saved or deleted (or re-dated, or for Entries, published
+or unpublished); the ``rebuild_tag_counts`` management command
+rebuilds them all.
+
+"""
+
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import signals
+from tagging.models import Tag, TaggedItem
+from tagging.utils import get_tag, parse_tag_input
+
+from coltrane import tag_index
+from coltrane.models import Entry, Link, TagCount
+
+
+def _counted(model):
+    if model is Entry:
+        return Entry.live.all()
+    return Link.objects.all()
+
+def _set_count(model, tag, count):
+    ctype = ContentType.objects.get_for_model(model)
+    try:
+        tag_count = TagCount.objects.get(tag=tag, content_type__pk=ctype.id)
+    except TagCount.DoesNotExist:
+        tag_count = TagCount(tag=tag, content_type=ctype, name=tag.name)
+    if tag_count.count != count or not tag_count.id:
+        tag_count.count = count
+        tag_count.save()
+
+def refresh(model, name):
+    """
+    Recounts the objects of ``model`` carrying the Tag ``name``, and
+    drops its posting list.
+    
+    """
+    tag_index.invalidate(model, name)
+    tag = get_tag(name)
+    if tag is not None:
+        _set_count(model, tag, TaggedItem.objects.get_by_model(_counted(model), tag).count())
+
+def rebuild(model):
+    """
+    Recounts every Tag for ``model``.
+    
+    """
+    ctype = ContentType.objects.get_for_model(model)
+    filters = model is Entry and { 'status': Entry.LIVE_STATUS } or None
+    counted = {}
+    for tag in Tag.objects.usage_for_model(model, counts=True, filters=filters):
+        _set_count(model, tag, tag.count)
+        counted[tag.id] = True
+    for tag_count in TagCount.objects.filter(content_type__pk=ctype.id).select_related('tag'):
+        if tag_count.tag_id not in counted and tag_count.count:
+            tag_count.count = 0
+            tag_count.save()
+
+def _state(instance):
+    """
+    Returns the tag names, counted-ness and ``pub_date`` stored for
+    ``instance``.
+    
+    """
+    model = instance.__class__
+    try:
+        stored = model._default_manager.get(pk=instance.id)
+    except model.DoesNotExist:
+        return None
+    return (set(parse_tag_input(stored.tags)),
+            model is Link or stored.status == Entry.LIVE_STATUS,
+            stored.pub_date)
+
+def capture_state(sender, instance, **kwargs):
+    instance._tag_count_state = instance.id and _state(instance) or None
+
+def update_counts(sender, instance, **kwargs):
+    """
+    Recounts the Tags an object carried before it was saved or
+    deleted, and those it carries now, if either set or the object's
+    status or ``pub_date`` changed.
+    
+    """
+    old = getattr(instance, '_tag_count_state', None)
+    new = instance.id and _state(instance) or None
+    if old == new:
+        return
+    names = set()
+    for state in (old, new):
+        if state is not None:
+            names.update(state[0])
+    for name in names:
+        refresh(sender, name)
+
+
+for model in (Entry, Link):
+    signals.pre_save.connect(capture_state, sender=model)
+    signals.post_save.connect(update_counts, sender=model)
+    signals.pre_delete.connect(capture_state, sender=model)
+    signals.post_delete.connect(update_counts, sender=model)
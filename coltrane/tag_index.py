@@ -0,0 +1,153 @@
+"""
+A posting-list index of tagged Entries and Links.
+
+For each Tag, the ``(pub_date, id)`` of every live Entry, and of every
+Link, carrying it are kept as a sorted list in the cache, built with a
+single query the first time it's needed and dropped by
+``coltrane.tag_counts`` whenever an object gains or loses the Tag, or
+is re-dated, published or unpublished. Objects dated in the future are
+left out until their publication time passes, when the
+``publish_scheduled`` management command drops the lists of their Tags.
+
+Queries for several Tags at once -- objects carrying all of them
+(``AND``) or any of them (``OR``) -- are answered by intersecting or
+merging these lists in memory, and paged by ``pub_date`` with the
+cursors of ``coltrane.pagination``, so that fetching a page costs one
+query for the objects on it.
+
+"""
+
+import bisect
+import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.encoding import smart_str
+from django.utils.hashcompat import md5_constructor
+from tagging.models import TaggedItem
+from tagging.utils import get_tag, parse_tag_input
+
+from coltrane.models import Entry, Link
+from coltrane.pagination import KeysetPage, decode_cursor
+
+
+CACHE_TIMEOUT = getattr(settings, 'COLTRANE_TAG_INDEX_CACHE_TIMEOUT', 60 * 60 * 24)
+
+AND = 'and'
+OR = 'or'
+
+# A tag query in a URL: a tag name, or several joined by '+' (``AND``)
+# or by ',' (``OR``). It's kept free of nested groups so that the URLs
+# using it can still be reversed.
+QUERY_PATTERN = r'[-\w+,]+'
+
+
+def _key(model, name):
+    return 'coltrane.tag_index.%s.%s' % (model._meta.module_name,
+                                         md5_constructor(smart_str(name.lower())).hexdigest())
+
+def _tagged(model):
+    if model is Entry:
+        queryset = Entry.live.all()
+    else:
+        queryset = Link.objects.all()
+    return queryset.filter(pub_date__lte=datetime.datetime.now())
+
+def postings(model, name):
+    """
+    Returns the ascending list of the ``(pub_date, id)`` of the
+    objects of ``model`` carrying the Tag ``name``.
+    
+    """
+    key = _key(model, name)
+    result = cache.get(key)
+    if result is None:
+        tag = get_tag(name)
+        if tag is None:
+            return []
+        result = list(TaggedItem.objects.get_by_model(_tagged(model), tag).order_by('pub_date', 'id').values_list('pub_date', 'id'))
+        cache.set(key, result, CACHE_TIMEOUT)
+    return result
+
+def invalidate(model, name):
+    """
+    Drops the posting list of the Tag ``name`` for ``model``.
+    
+    """
+    cache.delete(_key(model, name))
+
+def invalidate_objects(objects):
+    """
+    Drops the posting lists of every Tag carried by the Entries and
+    Links ``objects``.
+    
+    """
+    for obj in objects:
+        for name in parse_tag_input(obj.tags):
+            invalidate(obj.__class__, name)
+
+def parse_query(value):
+    """
+    Parses a tag query as it appears in a URL -- tag names joined by
+    '+' for ``AND`` or by ',' for ``OR`` -- into a ``(names,
+    operator)`` pair; a query mixing the two has no names.
+    
+    """
+    if ',' in value and '+' in value:
+        return [], AND
+    if ',' in value:
+        return [name for name in value.split(',') if name], OR
+    return [name for name in value.split('+') if name], AND
+
+def query(model, names, operator=AND):
+    """
+    Returns the ascending list of the ``(pub_date, id)`` of the
+    objects of ``model`` carrying all (``operator`` ``AND``) or any
+    (``operator`` ``OR``) of the Tags ``names``.
+    
+    """
+    lists = [postings(model, name) for name in names]
+    if not lists:
+        return []
+    if operator == OR:
+        merged = set()
+        for postings_list in lists:
+            merged.update(postings_list)
+        return sorted(merged)
+    lists.sort(key=len)
+    result = lists[0]
+    for postings_list in lists[1:]:
+        others = set(postings_list)
+        result = [posting for posting in result if posting in others]
+    return result
+
+def get_page(model, names, per_page, operator=AND, after=None, before=None, listing=False):
+    """
+    Returns the ``pagination.KeysetPage`` of the objects of ``model``
+    matching a tag query which follows the cursor ``after`` or
+    precedes the cursor ``before``, newest first, as
+    ``pagination.get_page`` would for a ``QuerySet``.
+    
+    If ``listing`` is ``True``, the objects are fetched without their
+    long text (see ``ArchiveQuerySet.listing()``).
+    
+    """
+    result = query(model, names, operator)
+    if before is not None:
+        start = bisect.bisect_right(result, decode_cursor(before))
+        window = result[start:start + per_page]
+        has_next, has_previous = True, start + per_page < len(result)
+    else:
+        end = len(result)
+        if after is not None:
+            end = bisect.bisect_left(result, decode_cursor(after))
+        window = result[max(0, end - per_page):end]
+        has_next, has_previous = end - per_page > 0, after is not None
+    queryset = _tagged(model)
+    if listing:
+        queryset = queryset.listing()
+    objects = queryset.in_bulk([id for pub_date, id in window])
+    object_list = [objects[id] for pub_date, id in window if id in objects]
+    object_list.reverse()
+    return KeysetPage(object_list, has_next, has_previous)
+
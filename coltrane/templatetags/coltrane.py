@@ -1,17 +1,73 @@
+from __future__ import absolute_import
+
 from django import template
-from template_utils.templatetags.generic_content import GenericContentNode
+from django.db.models import get_model
+
+from coltrane.featured import get_featured_entries
+from coltrane.instrumentation import instrument
 
 register = template.Library()
 
-class LatestFeaturedNode(GenericContentNode):
-    def _get_query_set(self):
-        return self.query_set.filter(featured__exact=True)
+class LatestFeaturedNode(template.Node):
+    def __init__(self, num, varname):
+        self.num = num
+        self.varname = varname
+    
+    def render(self, context):
+        entries = get_featured_entries(self.num)
+        if self.num == 1:
+            context[self.varname] = entries and entries[0] or None
+        else:
+            context[self.varname] = entries
+        return ''
+    render = instrument(render, 'get_featured_entries', 1)
+
+
+class PopularEntriesNode(template.Node):
+    def __init__(self, num, varname):
+        self.num = num
+        self.varname = varname
+    
+    def render(self, context):
+        entry_model = get_model('coltrane', 'entry')
+        context[self.varname] = entry_model.live.popular(self.num)
+        return ''
+
+
+class RelatedEntriesNode(template.Node):
+    def __init__(self, entry, varname, num=None):
+        self.entry = template.Variable(entry)
+        self.varname = varname
+        self.num = num
+    
+    def render(self, context):
+        try:
+            entry = self.entry.resolve(context)
+        except template.VariableDoesNotExist:
+            return ''
+        context[self.varname] = entry.get_related_entries(self.num)
+        return ''
+
+
+class TagCloudNode(template.Node):
+    def __init__(self, model, varname, steps=4):
+        self.model = get_model(*model.split('.'))
+        if self.model is None:
+            raise template.TemplateSyntaxError("'get_tag_cloud' tag got an invalid model: %s" % model)
+        self.varname = varname
+        self.steps = steps
+    
+    def render(self, context):
+        tag_count_model = get_model('coltrane', 'tagcount')
+        context[self.varname] = tag_count_model.objects.cloud(self.model, self.steps)
+        return ''
 
 
 def do_featured_entries(parser, token):
     """
-    Retrieves the latest ``num`` featured entries and stores them in a
-    specified context variable.
+    Retrieves the latest ``num`` live featured entries, from the cached
+    list in ``coltrane.featured``, and stores them in a specified
+    context variable.
     
     Syntax::
     
@@ -27,12 +83,16 @@ def do_featured_entries(parser, token):
         raise template.TemplateSyntaxError("'%s' tag takes three arguments" % bits[0])
     if bits[2] != 'as':
         raise template.TemplateSyntaxError("second argument to '%s' tag must be 'as'" % bits[0])
-    return LatestFeaturedNode('coltrane.entry', bits[1], bits[3])
+    try:
+        return LatestFeaturedNode(int(bits[1]), bits[3])
+    except ValueError:
+        raise template.TemplateSyntaxError("first argument to '%s' tag must be an integer" % bits[0])
 
 def do_featured_entry(parser, token):
     """
-    Retrieves the latest featured Entry and stores it in a specified
-    context variable.
+    Retrieves the latest live featured Entry, from the cached list in
+    ``coltrane.featured``, and stores it in a specified context
+    variable.
     
     Syntax::
     
@@ -48,7 +108,92 @@ def do_featured_entry(parser, token):
         raise template.TemplateSyntaxError("'%s' tag takes two arguments" % bits[0])
     if bits[1] != 'as':
         raise template.TemplateSyntaxError("first argument to '%s' tag must be 'as'" % bits[0])
-    return LatestFeaturedNode('coltrane.entry', 1, bits[2])
+    return LatestFeaturedNode(1, bits[2])
+
+def do_popular_entries(parser, token):
+    """
+    Retrieves the ``num`` most viewed live Entries of the last few
+    days, from the ranking kept by ``coltrane.hits``, and stores them
+    in a specified context variable.
+    
+    Syntax::
+    
+        {% get_popular_entries [num] as [varname] %}
+    
+    Example::
+    
+        {% get_popular_entries 5 as popular_entries %}
+    
+    """
+    bits = token.contents.split()
+    if len(bits) != 4:
+        raise template.TemplateSyntaxError("'%s' tag takes three arguments" % bits[0])
+    if bits[2] != 'as':
+        raise template.TemplateSyntaxError("second argument to '%s' tag must be 'as'" % bits[0])
+    try:
+        return PopularEntriesNode(int(bits[1]), bits[3])
+    except ValueError:
+        raise template.TemplateSyntaxError("first argument to '%s' tag must be an integer" % bits[0])
+
+def do_related_entries(parser, token):
+    """
+    Retrieves the live Entries most similar to an Entry by their Tags
+    and Categories, most similar first, and stores them in a specified
+    context variable.
+    
+    Syntax::
+    
+        {% get_related_entries [entry] as [varname] [num] %}
+    
+    Example::
+    
+        {% get_related_entries object as related_entries 3 %}
+    
+    """
+    bits = token.contents.split()
+    if len(bits) not in (4, 5):
+        raise template.TemplateSyntaxError("'%s' tag takes three or four arguments" % bits[0])
+    if bits[2] != 'as':
+        raise template.TemplateSyntaxError("second argument to '%s' tag must be 'as'" % bits[0])
+    if len(bits) == 5:
+        try:
+            return RelatedEntriesNode(bits[1], bits[3], int(bits[4]))
+        except ValueError:
+            raise template.TemplateSyntaxError("fourth argument to '%s' tag must be an integer" % bits[0])
+    return RelatedEntriesNode(bits[1], bits[3])
+
+def do_tag_cloud(parser, token):
+    """
+    Retrieves a tag cloud of the Tags used by live Entries or by
+    Links, from the precomputed tag counts, and stores it in a
+    specified context variable.
+    
+    Each item has a ``name``, a ``count`` and a ``font_size`` from 1
+    to ``steps`` (4 by default).
+    
+    Syntax::
+    
+        {% get_tag_cloud [app_name].[model_name] as [varname] [steps] %}
+    
+    Example::
+    
+        {% get_tag_cloud coltrane.link as link_cloud %}
+    
+    """
+    bits = token.contents.split()
+    if len(bits) not in (4, 5):
+        raise template.TemplateSyntaxError("'%s' tag takes three or four arguments" % bits[0])
+    if bits[2] != 'as':
+        raise template.TemplateSyntaxError("second argument to '%s' tag must be 'as'" % bits[0])
+    if len(bits) == 5:
+        try:
+            return TagCloudNode(bits[1], bits[3], int(bits[4]))
+        except ValueError:
+            raise template.TemplateSyntaxError("fourth argument to '%s' tag must be an integer" % bits[0])
+    return TagCloudNode(bits[1], bits[3])
 
 register.tag('get_featured_entries', do_featured_entries)
 register.tag('get_featured_entry', do_featured_entry)
+register.tag('get_popular_entries', do_popular_entries)
+register.tag('get_related_entries', do_related_entries)
+register.tag('get_tag_cloud', do_tag_cloud)
@@ -0,0 +1,18 @@
+"""
+Tests for coltrane, run by ``manage.py test coltrane`` in a project
+which has it installed.
+
+They expect the local-memory or dummy cache backend, so that each test
+can start with an empty cache (see ``coltrane.tests.base``).
+
+"""
+
+from coltrane.tests.budgets import *
+from coltrane.tests.bulk import *
+from coltrane.tests.counts import *
+from coltrane.tests.hits import *
+from coltrane.tests.invalidation import *
+from coltrane.tests.pagination import *
+from coltrane.tests.searching import *
+from coltrane.tests.static_export import *
+from coltrane.tests.stream import *
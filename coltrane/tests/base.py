@@ -0,0 +1,103 @@
+"""
+A base class for coltrane's tests, with helpers to create content.
+
+Coltrane ships no templates, so while a test runs every template is
+loaded by ``load_template_source()`` here, which gives the same
+simple template for any name.
+
+"""
+
+import datetime
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.template import loader
+from django.test import TestCase
+
+from coltrane.models import Category, Entry, Link, comment_model
+
+
+TEMPLATE = u'{% for object in object_list %}{{ object }} {% endfor %}' \
+           u'{% for object in latest %}{{ object }} {% endfor %}{{ object }}'
+
+PUB_DATE = datetime.datetime(2008, 8, 21, 12, 0)
+
+
+def load_template_source(template_name, template_dirs=None):
+    return TEMPLATE, 'coltrane.tests:%s' % template_name
+load_template_source.is_usable = True
+
+def clear_cache():
+    """
+    Empties the cache, if it is the local-memory backend; the dummy
+    backend is always empty.
+    
+    """
+    for name in ('_cache', '_expire_info'):
+        if isinstance(getattr(cache, name, None), dict):
+            getattr(cache, name).clear()
+
+
+class ColtraneTestCase(TestCase):
+    urls = 'coltrane.tests.urls'
+    
+    def setUp(self):
+        self.template_loaders = settings.TEMPLATE_LOADERS
+        settings.TEMPLATE_LOADERS = ('coltrane.tests.base.load_template_source',)
+        loader.template_source_loaders = None
+        clear_cache()
+        self.user = User.objects.create_user('author', 'author@example.com', 'password')
+    
+    def tearDown(self):
+        settings.TEMPLATE_LOADERS = self.template_loaders
+        loader.template_source_loaders = None
+    
+    def create_category(self, slug, **kwargs):
+        values = { 'title': slug.title(), 'slug': slug, 'description': u'About %s.' % slug }
+        values.update(kwargs)
+        category = Category(**values)
+        category.save()
+        return category
+    
+    def create_entry(self, slug, categories=(), **kwargs):
+        """
+        Creates a live Entry, in the given Categories, published on
+        ``PUB_DATE`` unless told otherwise.
+        
+        """
+        values = { 'title': slug.title(), 'slug': slug, 'author': self.user,
+                   'pub_date': PUB_DATE, 'body': u'The text of %s.' % slug }
+        values.update(kwargs)
+        entry = Entry(**values)
+        entry.save()
+        if categories:
+            entry.categories.add(*categories)
+        return entry
+    
+    def create_link(self, slug, **kwargs):
+        values = { 'title': slug.title(), 'slug': slug, 'posted_by': self.user,
+                   'pub_date': PUB_DATE, 'url': 'http://example.com/%s/' % slug,
+                   'description': u'A link to %s.' % slug, 'post_elsewhere': False }
+        values.update(kwargs)
+        link = Link(**values)
+        link.save()
+        return link
+    
+    def create_comment(self, obj, **kwargs):
+        """
+        Creates a public comment on ``obj``, setting whichever of the
+        usual fields the comment model has.
+        
+        """
+        values = { 'content_type': ContentType.objects.get_for_model(obj), 'object_id': obj.id,
+                   'comment': u'A comment.', 'person_name': u'Commenter', 'user': self.user,
+                   'submit_date': datetime.datetime.now(), 'is_public': True,
+                   'ip_address': '127.0.0.1', 'site': Site.objects.get_current() }
+        values.update(kwargs)
+        names = [field.name for field in comment_model._meta.fields]
+        comment = comment_model(**dict([(name, value) for name, value in values.items() if name in names]))
+        comment.save()
+        return comment
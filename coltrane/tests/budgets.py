@@ -0,0 +1,137 @@
+"""
+Tests holding every public route to its query budget (see
+``coltrane.instrumentation``).
+
+"""
+
+import datetime
+import sys
+import threading
+
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.template import Template
+
+from coltrane import export, instrumentation
+from coltrane.models import Entry
+from coltrane.tests.base import ColtraneTestCase
+
+
+# The names of the routes in ``coltrane.urls`` which don't appear in
+# ``export.pages()``, with the keyword arguments to request them with.
+OTHER_ROUTES = (
+    ('coltrane_feed_entries', { 'format': 'atom' }),
+    ('coltrane_feed_links', { 'format': 'rss' }),
+    ('coltrane_feed_category', { 'slug': 'django', 'format': 'atom' }),
+    ('coltrane_feed_tag', { 'tag': 'python', 'format': 'atom' }),
+    ('coltrane_search', {}),
+    ('coltrane_stream', {}),
+    ('coltrane_stream_archive_year', { 'year': '2008' }),
+    ('coltrane_stream_archive_month', { 'year': '2008', 'month': 'aug' }),
+    ('coltrane_sitemap_index', {}),
+    ('coltrane_sitemap_section', { 'section': 'entries', 'shard': '0' }),
+    )
+
+# Routes whose views are instrumented under their own names.
+VIEW_NAMES = {
+    'coltrane_category_detail': 'category_detail',
+    }
+
+
+class QueryBudgetTests(ColtraneTestCase):
+    def setUp(self):
+        super(QueryBudgetTests, self).setUp()
+        django = self.create_category('django')
+        for day in range(1, 6):
+            self.create_entry('entry-%s' % day, categories=[django], tags='python django',
+                              pub_date=datetime.datetime(2008, 8, day, 12, 0))
+            self.create_link('link-%s' % day, tags='python',
+                             pub_date=datetime.datetime(2008, 8, day, 12, 0))
+        instrumentation.set_enforce_budgets(True)
+    
+    def tearDown(self):
+        instrumentation.set_enforce_budgets(False)
+        super(QueryBudgetTests, self).tearDown()
+    
+    def test_every_route_has_a_budget(self):
+        names = set([name for name, kwargs in OTHER_ROUTES])
+        for prefix in ('entry', 'link'):
+            for route in ('archive_index', 'archive_year', 'archive_month', 'archive_day', 'detail',
+                          'tag_archive', 'tag_cloud', 'tag_detail'):
+                names.add('coltrane_%s_%s' % (prefix, route))
+        names.update(['coltrane_category_list', 'coltrane_category_detail'])
+        for name in names:
+            self.failIf(instrumentation.get_budget(VIEW_NAMES.get(name, name)) is None,
+                        "%s has no query budget." % name)
+    
+    def test_pages_within_budget(self):
+        # A page over its budget raises ``QueryBudgetExceeded``, which
+        # the test client raises here.
+        paths = [path for path, tags in export.pages()]
+        paths.extend([reverse(name, kwargs=kwargs) for name, kwargs in OTHER_ROUTES])
+        for path in paths:
+            response = self.client.get(path, { 'q': 'text' })
+            self.assertEqual(response.status_code, 200, path)
+    
+    def test_pages_within_budget_when_warm(self):
+        paths = [path for path, tags in export.pages()]
+        for path in paths:
+            self.client.get(path)
+        for path in paths:
+            self.assertEqual(self.client.get(path).status_code, 200, path)
+    
+    def test_over_budget(self):
+        def two_queries():
+            list(Entry.objects.all())
+            list(Entry.objects.all())
+        self.assertRaises(instrumentation.QueryBudgetExceeded,
+                          instrumentation.instrument(two_queries, 'two_queries', 1))
+    
+    def test_counted_once(self):
+        enabled = instrumentation.ENABLED
+        instrumentation.set_enabled(True)
+        instrumentation.reset()
+        try:
+            self.client.get(reverse('coltrane_category_detail', kwargs={ 'slug': 'django' }))
+            names = instrumentation.snapshot().keys()
+        finally:
+            instrumentation.set_enabled(enabled)
+            instrumentation.reset()
+        self.failUnless('category_detail' in names)
+        self.failIf('coltrane_category_detail' in names)
+    
+    def test_unpatched_when_off(self):
+        enabled = instrumentation.ENABLED
+        patched_render = Template.__dict__['render']
+        instrumentation.set_enabled(False)
+        instrumentation.set_enforce_budgets(False)
+        try:
+            self.failIf(isinstance(connection.cursor(), instrumentation.TimingCursor))
+            self.failIf(Template.__dict__['render'] is patched_render)
+        finally:
+            instrumentation.set_enabled(enabled)
+            instrumentation.set_enforce_budgets(True)
+        self.failUnless(isinstance(connection.cursor(), instrumentation.TimingCursor))
+    
+    def test_other_threads(self):
+        # Each thread has its own connection, which must be measured
+        # too. Plain queries need no tables, which a thread's own
+        # connection to an in-memory test database wouldn't have.
+        def two_queries():
+            cursor = connection.cursor()
+            cursor.execute('SELECT 1')
+            cursor.execute('SELECT 1')
+        instrumented = instrumentation.instrument(two_queries, 'two_queries', 1)
+        errors = []
+        def run():
+            try:
+                try:
+                    instrumented()
+                except instrumentation.QueryBudgetExceeded:
+                    errors.append(sys.exc_info()[1])
+            finally:
+                connection.close()
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+        self.assertEqual(len(errors), 1)
@@ -0,0 +1,76 @@
+"""
+Tests that exporting a weblog and importing it into an empty one
+gives the same weblog back.
+
+"""
+
+import datetime
+from StringIO import StringIO
+
+from coltrane import search
+from coltrane.bulk import Importer, export_records, read_jsonl, read_wxr, write_jsonl, write_wxr
+from coltrane.models import Category, Entry, Link
+from coltrane.tests.base import ColtraneTestCase
+
+
+class RoundTripTests(ColtraneTestCase):
+    def setUp(self):
+        super(RoundTripTests, self).setUp()
+        django = self.create_category('django')
+        python = self.create_category('python')
+        self.create_entry('first', categories=[django, python], tags='django python', excerpt=u'The first.')
+        self.create_entry('draft', status=Entry.DRAFT_STATUS, featured=True, enable_comments=False,
+                          pub_date=datetime.datetime(2008, 9, 1, 8, 30))
+        self.create_link('link', tags='python', via_name=u'Someone', via_url='http://example.org/')
+    
+    def records(self):
+        # A small batch size, so more than one batch is read.
+        records = list(export_records(batch_size=1))
+        for record in records:
+            if record['type'] == 'entry':
+                record['categories'].sort()
+        return records
+    
+    def reimport(self, records):
+        for model in (Link, Entry, Category):
+            for obj in model._default_manager.all():
+                obj.delete()
+        importer = Importer(batch_size=2)
+        for record in records:
+            importer.add(record)
+        return importer.finish(processes=1)
+    
+    def test_jsonl(self):
+        records = self.records()
+        stream = StringIO()
+        write_jsonl(records, stream)
+        counts = self.reimport(read_jsonl(StringIO(stream.getvalue())))
+        self.assertEqual(counts, { 'categories': 2, 'entries': 2, 'links': 1, 'skipped': 0 })
+        self.assertEqual(self.records(), records)
+    
+    def test_wxr(self):
+        # WXR has no equivalent of a Link.
+        records = [record for record in self.records() if record['type'] != 'link']
+        stream = StringIO()
+        write_wxr(records, stream)
+        counts = self.reimport(read_wxr(StringIO(stream.getvalue())))
+        self.assertEqual(counts, { 'categories': 2, 'entries': 2, 'links': 0, 'skipped': 0 })
+        self.assertEqual(self.records(), records)
+    
+    def test_imported_objects_complete(self):
+        self.reimport(self.records())
+        entry = Entry.objects.get(slug='first')
+        self.failUnless(u'The text of first.' in entry.body_html)
+        self.failUnless(u'The first.' in entry.excerpt_html)
+        self.failUnless(u'A link to link.' in Link.objects.get(slug='link').description_html)
+        self.assertEqual([object_id for score, model, object_id in search.search('first')], [entry.id])
+        self.assertEqual(Category.objects.get(slug='django').live_entry_count, 1)
+        self.assertEqual(self.client.get(entry.get_absolute_url()).status_code, 200)
+    
+    def test_imported_again(self):
+        records = self.records()
+        importer = Importer()
+        for record in records:
+            importer.add(record)
+        self.assertEqual(importer.finish(processes=1), { 'categories': 0, 'entries': 0, 'links': 0, 'skipped': 5 })
+        self.assertEqual(self.records(), records)
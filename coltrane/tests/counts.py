@@ -0,0 +1,64 @@
+"""
+Tests that the archive index and Category counts are kept up to date
+as Entries change Categories, status or publication time.
+
+"""
+
+import datetime
+
+from django.core.management import call_command
+
+from coltrane import archive
+from coltrane.models import Category, Entry
+from coltrane.tests.base import ColtraneTestCase
+
+
+class CountTests(ColtraneTestCase):
+    def setUp(self):
+        super(CountTests, self).setUp()
+        self.category = self.create_category('django')
+    
+    def live_entry_count(self):
+        return Category.objects.get(pk=self.category.id).live_entry_count
+    
+    def day_count(self, date, category_id=None):
+        buckets = archive.get_buckets(Entry, category_id).filter(year=date.year, month=date.month, day=date.day)
+        return sum([bucket.count for bucket in buckets])
+    
+    def test_categories_changed(self):
+        entry = self.create_entry('entry', categories=[self.category])
+        self.assertEqual(self.live_entry_count(), 1)
+        self.assertEqual(self.day_count(entry.pub_date, self.category.id), 1)
+        entry.categories.remove(self.category)
+        self.assertEqual(self.live_entry_count(), 0)
+        self.assertEqual(self.day_count(entry.pub_date, self.category.id), 0)
+        entry.categories.add(self.category)
+        self.assertEqual(self.live_entry_count(), 1)
+        entry.categories.clear()
+        self.assertEqual(self.live_entry_count(), 0)
+        entry.categories = [self.category]
+        self.assertEqual(self.live_entry_count(), 1)
+        self.assertEqual(self.day_count(entry.pub_date, self.category.id), 1)
+    
+    def test_status_changed(self):
+        entry = self.create_entry('entry', categories=[self.category])
+        entry.status = Entry.DRAFT_STATUS
+        entry.save()
+        self.assertEqual(self.live_entry_count(), 0)
+        self.assertEqual(self.day_count(entry.pub_date), 0)
+        entry.delete()
+        self.assertEqual(self.live_entry_count(), 0)
+    
+    def test_scheduled(self):
+        now = datetime.datetime.now()
+        entry = self.create_entry('scheduled', categories=[self.category],
+                                  pub_date=now + datetime.timedelta(days=1))
+        self.assertEqual(self.live_entry_count(), 0)
+        self.assertEqual(self.day_count(entry.pub_date), 0)
+        # Its publication time passes, which sends no signal.
+        published = now - datetime.timedelta(minutes=1)
+        Entry.objects.filter(pk=entry.id).update(pub_date=published)
+        call_command('publish_scheduled', verbosity=0)
+        self.assertEqual(self.live_entry_count(), 1)
+        self.assertEqual(self.day_count(published), 1)
+        self.assertEqual(self.day_count(published, self.category.id), 1)
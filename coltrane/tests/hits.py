@@ -0,0 +1,42 @@
+"""
+Tests of the recording, rolling up and ranking of page views.
+
+"""
+
+import datetime
+
+from coltrane import hits as hit_counts
+from coltrane.models import Entry, HitBucket
+from coltrane.tests.base import ColtraneTestCase
+
+
+class HitTests(ColtraneTestCase):
+    def test_flush(self):
+        entry = self.create_entry('viewed')
+        hit_counts.record(Entry, '2008', 'Aug', '21', 'viewed', 2)
+        hit_counts.record(Entry, '2008', 'aug', '21', 'missing')
+        hit_counts.flush()
+        self.assertEqual(sum(HitBucket.objects.filter(object_id=entry.id).values_list('count', flat=True)), 2)
+        self.assertEqual(HitBucket.objects.count(), 1)
+    
+    def test_buckets_added_to(self):
+        entry = self.create_entry('viewed')
+        start = datetime.datetime(2008, 8, 21, 12, 0)
+        hit_counts._write({ (Entry, entry.id): 2 }, start)
+        hit_counts._write({ (Entry, entry.id): 3 }, start)
+        self.assertEqual(list(HitBucket.objects.values_list('count', flat=True)), [5])
+    
+    def test_rollup_and_rank(self):
+        entry = self.create_entry('viewed')
+        other = self.create_entry('other')
+        now = datetime.datetime.now()
+        self.assertEqual(hit_counts.popular(Entry.live.all()), [])
+        for hours in (1, 2):
+            hit_counts._write({ (Entry, entry.id): 2, (Entry, other.id): 1 }, now - datetime.timedelta(days=3, hours=hours))
+        hit_counts.rollup(now)
+        self.assertEqual(HitBucket.objects.filter(period__exact=HitBucket.HOUR_PERIOD).count(), 0)
+        self.assertEqual(sum(HitBucket.objects.filter(object_id=entry.id).values_list('count', flat=True)), 4)
+        hit_counts.rank(now)
+        self.assertEqual([obj.id for obj in hit_counts.popular(Entry.live.all())], [entry.id, other.id])
+        entry.delete()
+        self.assertEqual([obj.id for obj in hit_counts.popular(Entry.live.all())], [other.id])
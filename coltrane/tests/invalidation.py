@@ -0,0 +1,211 @@
+"""
+Tests that each of coltrane's caches and precomputed indexes is
+brought up to date by every kind of change which affects it.
+
+A cache which is never invalidated passes these tests with the dummy
+backend, which caches nothing; run them with the local-memory backend.
+
+"""
+
+import datetime
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+
+from coltrane import featured, feeds, neighbors, page_cache, sitemaps, tag_index
+from coltrane.bulk import render_markup
+from coltrane.models import Entry
+from coltrane.tests.base import ColtraneTestCase
+
+
+DETAIL_KWARGS = { 'year': '2008', 'month': 'aug', 'day': '21', 'slug': 'cached' }
+
+
+class PageCacheTests(ColtraneTestCase):
+    def setUp(self):
+        super(PageCacheTests, self).setUp()
+        self.page_cache_settings = (page_cache.ENABLED, page_cache.CACHE_TIMEOUT)
+        page_cache.ENABLED = True
+        page_cache.CACHE_TIMEOUT = 60
+        self.entry = self.create_entry('cached')
+        self.path = self.entry.get_absolute_url()
+    
+    def tearDown(self):
+        page_cache.ENABLED, page_cache.CACHE_TIMEOUT = self.page_cache_settings
+        super(PageCacheTests, self).tearDown()
+    
+    def digest(self):
+        return page_cache.page_version(self.path, page_cache.page_tags('entry', DETAIL_KWARGS))[0]
+    
+    def test_entry_saved(self):
+        self.failUnless('Cached' in self.client.get(self.path).content)
+        self.entry.title = u'Renamed'
+        self.entry.save()
+        self.failUnless('Renamed' in self.client.get(self.path).content)
+    
+    def test_neighbor_saved(self):
+        self.client.get(self.path)
+        digest = self.digest()
+        self.create_entry('next', pub_date=datetime.datetime(2008, 8, 22, 12, 0))
+        self.assertNotEqual(self.digest(), digest)
+    
+    def test_comment_saved(self):
+        digest = self.digest()
+        comment = self.create_comment(self.entry)
+        self.assertNotEqual(self.digest(), digest)
+        digest = self.digest()
+        comment.delete()
+        self.assertNotEqual(self.digest(), digest)
+    
+    def test_head_cached_separately(self):
+        self.client.head(self.path)
+        self.assertEqual(cache.get('%s.page.GET.%s' % (page_cache.KEY_PREFIX, self.digest())), None)
+        self.failUnless('Cached' in self.client.get(self.path).content)
+    
+    def test_purge_all(self):
+        digest = self.digest()
+        page_cache.purge_all()
+        self.assertNotEqual(self.digest(), digest)
+
+
+class FeaturedTests(ColtraneTestCase):
+    def featured_ids(self):
+        return [entry.id for entry in featured.get_featured_entries()]
+    
+    def test_featured_saved(self):
+        self.assertEqual(self.featured_ids(), [])
+        entry = self.create_entry('featured', featured=True)
+        self.assertEqual(self.featured_ids(), [entry.id])
+        entry.featured = False
+        entry.save()
+        self.assertEqual(self.featured_ids(), [])
+    
+    def test_status_changed(self):
+        entry = self.create_entry('featured', featured=True)
+        self.assertEqual(self.featured_ids(), [entry.id])
+        entry.status = Entry.DRAFT_STATUS
+        entry.save()
+        self.assertEqual(self.featured_ids(), [])
+    
+    def test_invalidate_all(self):
+        entry = self.create_entry('plain')
+        self.assertEqual(self.featured_ids(), [])
+        Entry.objects.filter(pk=entry.id).update(featured=True)
+        featured.invalidate_all()
+        self.assertEqual(self.featured_ids(), [entry.id])
+
+
+class FeedItemTests(ColtraneTestCase):
+    def test_entry_saved(self):
+        entry = self.create_entry('syndicated')
+        self.assertEqual(feeds.get_items(Entry, [entry.id])[0]['title'], u'Syndicated')
+        entry.title = u'Renamed'
+        entry.save()
+        self.assertEqual(feeds.get_items(Entry, [entry.id])[0]['title'], u'Renamed')
+    
+    def test_markup_rendered(self):
+        entry = self.create_entry('syndicated')
+        feeds.get_items(Entry, [entry.id])
+        Entry.objects.filter(pk=entry.id).update(body=u'Rewritten text.', body_html=u'')
+        self.assertEqual(render_markup(Entry, unrendered=True), 1)
+        self.failUnless(u'Rewritten text.' in feeds.get_items(Entry, [entry.id])[0]['description'])
+    
+    def test_scheduled_entry_published(self):
+        settings = (page_cache.ENABLED, page_cache.CACHE_TIMEOUT)
+        page_cache.ENABLED = True
+        page_cache.CACHE_TIMEOUT = 60
+        try:
+            now = datetime.datetime.now()
+            entry = self.create_entry('scheduled', pub_date=now + datetime.timedelta(days=1))
+            path = reverse('coltrane_feed_entries', kwargs={ 'format': 'atom' })
+            self.failIf('Scheduled' in self.client.get(path).content)
+            # Its publication time passes, which sends no signal.
+            Entry.objects.filter(pk=entry.id).update(pub_date=now - datetime.timedelta(minutes=1))
+            call_command('publish_scheduled', verbosity=0)
+            self.failUnless('Scheduled' in self.client.get(path).content)
+        finally:
+            page_cache.ENABLED, page_cache.CACHE_TIMEOUT = settings
+
+
+class NeighborTests(ColtraneTestCase):
+    def next_id(self, entry):
+        # A fresh copy, since each Entry remembers its neighbors.
+        try:
+            return neighbors.get_neighbor(Entry.objects.get(pk=entry.id), 'next').id
+        except Entry.DoesNotExist:
+            return None
+    
+    def test_entry_published(self):
+        first = self.create_entry('first', pub_date=datetime.datetime(2008, 8, 1, 12, 0))
+        last = self.create_entry('last', pub_date=datetime.datetime(2008, 8, 3, 12, 0))
+        self.assertEqual(self.next_id(first), last.id)
+        middle = self.create_entry('middle', pub_date=datetime.datetime(2008, 8, 2, 12, 0))
+        self.assertEqual(self.next_id(first), middle.id)
+        middle.status = Entry.DRAFT_STATUS
+        middle.save()
+        self.assertEqual(self.next_id(first), last.id)
+        last.delete()
+        self.assertEqual(self.next_id(first), None)
+
+
+class SitemapTests(ColtraneTestCase):
+    def test_entry_saved(self):
+        first = self.create_entry('first')
+        self.failUnless(first.get_absolute_url() in sitemaps.render_shard('entries', 0))
+        later = self.create_entry('later', pub_date=datetime.datetime(2008, 9, 1, 12, 0))
+        self.failUnless(later.get_absolute_url() in sitemaps.render_shard('entries', 0))
+        later.delete()
+        self.failIf(later.get_absolute_url() in sitemaps.render_shard('entries', 0))
+    
+    def test_shard_bounds_moved(self):
+        # Adding an Entry in August moves the boundary between two
+        # shards which only cover September, whose version is unchanged.
+        limit = sitemaps.LIMIT
+        sitemaps.LIMIT = 2
+        try:
+            september = [self.create_entry('september-%s' % day, pub_date=datetime.datetime(2008, 9, day, 12, 0))
+                         for day in (1, 2, 3)]
+            xml = sitemaps.render_shard('entries', 1)
+            self.failIf(september[1].get_absolute_url() in xml)
+            self.create_entry('august', pub_date=datetime.datetime(2008, 8, 31, 12, 0))
+            xml = sitemaps.render_shard('entries', 1)
+            self.failUnless(september[1].get_absolute_url() in xml)
+            self.failUnless(september[2].get_absolute_url() in xml)
+        finally:
+            sitemaps.LIMIT = limit
+    
+    def test_scheduled_entry_published(self):
+        now = datetime.datetime.now()
+        self.create_entry('first')
+        scheduled = self.create_entry('scheduled', pub_date=now + datetime.timedelta(days=1))
+        self.failIf(scheduled.get_absolute_url() in sitemaps.render_shard('entries', 0))
+        # Its publication time passes, which sends no signal.
+        Entry.objects.filter(pk=scheduled.id).update(pub_date=now - datetime.timedelta(minutes=1))
+        scheduled = Entry.objects.get(pk=scheduled.id)
+        call_command('publish_scheduled', verbosity=0)
+        self.failUnless(scheduled.get_absolute_url() in sitemaps.render_shard('entries', 0))
+
+
+class TagIndexTests(ColtraneTestCase):
+    def ids(self, name):
+        return [id for pub_date, id in tag_index.postings(Entry, name)]
+    
+    def test_tags_changed(self):
+        entry = self.create_entry('tagged', tags='python')
+        self.assertEqual(self.ids('python'), [entry.id])
+        entry.tags = 'django'
+        entry.save()
+        self.assertEqual(self.ids('python'), [])
+        self.assertEqual(self.ids('django'), [entry.id])
+    
+    def test_scheduled_entry_published(self):
+        now = datetime.datetime.now()
+        first = self.create_entry('first', tags='python')
+        scheduled = self.create_entry('scheduled', tags='python', pub_date=now + datetime.timedelta(days=1))
+        self.assertEqual(self.ids('python'), [first.id])
+        self.assertEqual(tag_index.get_page(Entry, ['python'], 10).object_list, [first])
+        # Its publication time passes, which sends no signal.
+        Entry.objects.filter(pk=scheduled.id).update(pub_date=now - datetime.timedelta(minutes=1))
+        call_command('publish_scheduled', verbosity=0)
+        self.assertEqual(self.ids('python'), [first.id, scheduled.id])
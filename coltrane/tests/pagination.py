@@ -0,0 +1,79 @@
+"""
+Tests of keyset pagination and of its cursors.
+
+"""
+
+from django.http import Http404
+
+from coltrane import pagination as keyset
+from coltrane.models import Entry
+from coltrane.tests.base import PUB_DATE, ColtraneTestCase
+
+
+class CursorTests(ColtraneTestCase):
+    def test_round_trip(self):
+        entry = self.create_entry('entry', pub_date=PUB_DATE.replace(microsecond=250))
+        self.assertEqual(keyset.decode_cursor(keyset.encode_cursor(entry)), (entry.pub_date, entry.id))
+    
+    def test_malformed(self):
+        for cursor in ('', 'garbage', '20080821120000.000000', '20080821120000-42',
+                       '20080821120000.000000-x42', '20081321120000.000000-42',
+                       '20080821120000.9999999-42', '20080821120000.000000-4-2'):
+            self.assertRaises(Http404, keyset.decode_cursor, cursor)
+            self.assertRaises(Http404, keyset.get_page, Entry.live.all(), 2, after=cursor)
+            self.assertRaises(Http404, keyset.get_page, Entry.live.all(), 2, before=cursor)
+
+
+class KeysetPageTests(ColtraneTestCase):
+    def setUp(self):
+        super(KeysetPageTests, self).setUp()
+        # Several Entries published at the same moment, so that pages
+        # split ties, between others on the days either side.
+        entries = [self.create_entry('entry-%s' % i) for i in range(5)]
+        for day in (20, 22):
+            entries.append(self.create_entry('entry-%s' % day, pub_date=PUB_DATE.replace(day=day)))
+        # Newest first, and at the same moment later ids before earlier
+        # ones.
+        entries.sort(key=lambda entry: (entry.pub_date, entry.id), reverse=True)
+        self.expected = [entry.id for entry in entries]
+    
+    def ids(self, page):
+        return [entry.id for entry in page.object_list]
+    
+    def walk(self, per_page):
+        """
+        Returns the pages from the first to the last, following each
+        page's next cursor.
+        
+        """
+        pages = [keyset.get_page(Entry.live.all(), per_page)]
+        while pages[-1].has_next():
+            pages.append(keyset.get_page(Entry.live.all(), per_page, after=pages[-1].next_cursor))
+        return pages
+    
+    def test_after(self):
+        for per_page in (1, 2, 3, 4, len(self.expected), len(self.expected) + 1):
+            pages = self.walk(per_page)
+            found = []
+            for page in pages:
+                found.extend(self.ids(page))
+            self.assertEqual(found, self.expected, per_page)
+            self.failIf(pages[0].has_previous())
+            for page in pages[1:]:
+                self.failUnless(page.has_previous())
+    
+    def test_before(self):
+        for per_page in (1, 2, 3, 4):
+            pages = self.walk(per_page)
+            for i in range(1, len(pages)):
+                previous = keyset.get_page(Entry.live.all(), per_page, before=pages[i].previous_cursor)
+                self.assertEqual(self.ids(previous), self.ids(pages[i - 1]), (per_page, i))
+                self.assertEqual(previous.has_previous(), i > 1, (per_page, i))
+                self.failUnless(previous.has_next())
+                self.assertEqual(previous.next_cursor, pages[i - 1].next_cursor)
+    
+    def test_before_first(self):
+        first = keyset.get_page(Entry.live.all(), 3)
+        page = keyset.get_page(Entry.live.all(), 3, before=keyset.encode_cursor(first.object_list[0]))
+        self.assertEqual(page.object_list, [])
+        self.failIf(page.has_previous())
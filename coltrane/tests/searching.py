@@ -0,0 +1,81 @@
+"""
+Tests of searches, including ones matching more objects than SQLite
+allows parameters in one statement (999), which must not put the
+matches in an ``IN`` list.
+
+"""
+
+import datetime
+
+from django.core.urlresolvers import reverse
+
+from coltrane import search
+from coltrane.bulk import Importer
+from coltrane.models import Entry, Link
+from coltrane.tests.base import ColtraneTestCase
+
+
+MATCHES = 1200
+
+
+class LargeSearchTests(ColtraneTestCase):
+    def setUp(self):
+        super(LargeSearchTests, self).setUp()
+        importer = Importer()
+        for i in range(MATCHES):
+            importer.add({ 'type': 'entry', 'author': 'author', 'title': u'Entry %s' % i,
+                           'slug': 'entry-%s' % i, 'pub_date': '2008-08-21T12:00:00', 'status': 'live',
+                           'body': u'Some common text, number %s.' % i })
+        importer.add({ 'type': 'entry', 'author': 'author', 'title': u'Draft', 'slug': 'draft',
+                       'pub_date': '2008-08-21T12:00:00', 'status': 'draft',
+                       'body': u'Some common text, not yet published.' })
+        importer.add({ 'type': 'link', 'posted_by': 'author', 'title': u'Link', 'slug': 'link',
+                       'pub_date': '2008-08-21T12:00:00', 'url': 'http://example.com/',
+                       'description': u'A common link.' })
+        importer.finish(processes=1)
+        self.draft = Entry.objects.get(slug='draft')
+    
+    def test_search(self):
+        results = search.search('common text')
+        ids = [object_id for score, model, object_id in results if model is Entry]
+        self.assertEqual(len(results), MATCHES)
+        self.assertEqual(len(set(ids)), MATCHES)
+        self.failIf(self.draft.id in ids)
+        self.assertEqual(len(search.search('common')), MATCHES + 1)
+        self.assertEqual(search.search('common missing'), [])
+    
+    def test_get_results(self):
+        results = search.get_results(search.search('common text')[:10], 'common text')
+        self.assertEqual(len(results), 10)
+        for result in results:
+            self.failUnless(u'<strong>common</strong>' in result.snippet)
+    
+    def test_filter_matching(self):
+        # Drafts match too, for the admin.
+        queryset = search.filter_matching(Entry.objects.all(), 'common text')
+        self.assertEqual(queryset.count(), MATCHES + 1)
+        self.assertEqual(len(list(queryset.values_list('id', flat=True))), MATCHES + 1)
+        self.assertEqual(search.filter_matching(Entry.objects.all(), 'common missing').count(), 0)
+        self.assertEqual(search.filter_matching(Link.objects.all(), 'common').count(), 1)
+        self.assertEqual(search.filter_matching(Entry.objects.all(), '').count(), MATCHES + 1)
+    
+    def test_search_view(self):
+        response = self.client.get(reverse('coltrane_search'), { 'q': 'common' })
+        self.assertEqual(response.status_code, 200)
+
+
+class ScheduledSearchTests(ColtraneTestCase):
+    def test_scheduled_left_out(self):
+        now = datetime.datetime.now()
+        published = self.create_entry('published', body=u'Some common text.')
+        scheduled = self.create_entry('scheduled', body=u'Some common text.',
+                                      pub_date=now + datetime.timedelta(days=1))
+        self.create_link('scheduled-link', description=u'A common link.', pub_date=scheduled.pub_date)
+        self.assertEqual([(model, object_id) for score, model, object_id in search.search('common')],
+                         [(Entry, published.id)])
+        # Its publication time passes.
+        Entry.objects.filter(pk=scheduled.id).update(pub_date=now - datetime.timedelta(minutes=1))
+        ids = [object_id for score, model, object_id in search.search('common text')]
+        self.assertEqual(sorted(ids), sorted([published.id, scheduled.id]))
+        # Scheduled posts still match for the admin.
+        self.assertEqual(search.filter_matching(Link.objects.all(), 'common').count(), 1)
@@ -0,0 +1,122 @@
+"""
+Tests of the static export of the public pages.
+
+"""
+
+import datetime
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.template import loader
+from django.utils import simplejson
+
+from coltrane import page_cache
+from coltrane.export import MANIFEST_NAME, _filename, export
+from coltrane.tests.base import ColtraneTestCase, load_template_source
+
+
+def load_broken_template_source(template_name, template_dirs=None):
+    """
+    Loads templates as ``load_template_source()`` does, except that
+    the Entry detail template fails.
+    
+    """
+    if template_name == 'coltrane/entry_detail.html':
+        raise RuntimeError("Broken template.")
+    return load_template_source(template_name, template_dirs)
+load_broken_template_source.is_usable = True
+
+
+class StaticExportTests(ColtraneTestCase):
+    def setUp(self):
+        super(StaticExportTests, self).setUp()
+        self.enabled = page_cache.ENABLED
+        self.output_dir = tempfile.mkdtemp()
+        self.entry = self.create_entry('exported')
+        self.filename = _filename(self.output_dir, self.entry.get_absolute_url())
+    
+    def tearDown(self):
+        page_cache.ENABLED = self.enabled
+        shutil.rmtree(self.output_dir)
+        super(StaticExportTests, self).tearDown()
+    
+    def export(self, **kwargs):
+        return export(self.output_dir, processes=1, **kwargs)
+    
+    def content(self):
+        f = open(self.filename)
+        try:
+            return f.read()
+        finally:
+            f.close()
+    
+    def test_incremental(self):
+        page_cache.ENABLED = True
+        counts = self.export()
+        self.failUnless(counts['rendered'])
+        self.assertEqual(counts['failed'], 0)
+        self.failUnless(os.path.exists(os.path.join(self.output_dir, MANIFEST_NAME)))
+        cache.set('coltrane.tests.probe', True)
+        if not cache.get('coltrane.tests.probe'):
+            # Tag versions aren't kept by the dummy backend.
+            return
+        self.assertEqual(self.export()['rendered'], 0)
+        self.entry.title = u'Renamed'
+        self.entry.save()
+        self.failUnless(0 < self.export()['rendered'] < counts['rendered'])
+        self.failUnless('Renamed' in self.content())
+    
+    def test_without_tag_versions(self):
+        # Nothing purges tag versions, so every page is rendered again.
+        page_cache.ENABLED = False
+        counts = self.export()
+        self.entry.title = u'Renamed'
+        self.entry.save()
+        again = self.export()
+        self.assertEqual(again['rendered'], counts['rendered'])
+        self.assertEqual(again['unchanged'], 0)
+        self.failUnless('Renamed' in self.content())
+    
+    def test_removed(self):
+        page_cache.ENABLED = False
+        self.export()
+        self.failUnless(os.path.exists(self.filename))
+        self.entry.delete()
+        self.failUnless(self.export()['removed'])
+        self.failIf(os.path.exists(self.filename))
+    
+    def test_failed_page(self):
+        page_cache.ENABLED = False
+        settings.TEMPLATE_LOADERS = ('coltrane.tests.static_export.load_broken_template_source',)
+        loader.template_source_loaders = None
+        failed = []
+        counts = self.export(failed=failed)
+        self.assertEqual(counts['failed'], 1)
+        self.assertEqual([path for path, reason in failed], [self.entry.get_absolute_url()])
+        self.failUnless('Broken template.' in failed[0][1])
+        self.failUnless(counts['rendered'])
+        # The pages rendered are still recorded, and the failed one
+        # tried again next time.
+        manifest = simplejson.load(open(os.path.join(self.output_dir, MANIFEST_NAME)))
+        self.assertEqual(len(manifest), counts['rendered'])
+        self.failIf(self.entry.get_absolute_url() in manifest)
+    
+    def test_pagination_left_out(self):
+        for day in range(1, 17):
+            self.create_entry('entry-%s' % day, pub_date=datetime.datetime(2008, 7, day, 12, 0))
+        self.create_entry('tagged', tags=' '.join(['tag%s' % i for i in range(41)]))
+        index = reverse('coltrane_entry_archive_index')
+        tag_archive = reverse('coltrane_entry_tag_archive')
+        self.failUnless(self.client.get(index).context['has_next'])
+        self.failUnless(self.client.get(tag_archive).context['is_paginated'])
+        headers = { page_cache.STATIC_EXPORT_HEADER: '1' }
+        context = self.client.get(index, **headers).context
+        self.failIf(context['has_next'])
+        self.assertEqual(context['next_cursor'], None)
+        context = self.client.get(tag_archive, **headers).context
+        self.failIf(context['is_paginated'])
+        self.assertEqual(len(context['object_list']), 41)
@@ -0,0 +1,126 @@
+"""
+Tests of the merged stream of Entries and Links, and of its cursors.
+
+"""
+
+import datetime
+
+from django.http import Http404
+
+from coltrane import stream as stream_index
+from coltrane.models import Entry, Link
+from coltrane.tests.base import PUB_DATE, ColtraneTestCase
+
+
+class StreamCursorTests(ColtraneTestCase):
+    def test_round_trip(self):
+        entry = self.create_entry('entry', pub_date=PUB_DATE.replace(microsecond=250))
+        entry.stream_type = 'entry'
+        link = self.create_link('link')
+        link.stream_type = 'link'
+        self.assertEqual(stream_index.decode_cursor(stream_index.encode_cursor(entry)),
+                         (entry.pub_date, 1, entry.id))
+        self.assertEqual(stream_index.decode_cursor(stream_index.encode_cursor(link)),
+                         (link.pub_date, 0, link.id))
+    
+    def test_malformed(self):
+        for cursor in ('', 'garbage', '20080821120000.000000', '20080821120000.000000-42',
+                       '20080821120000.000000-x42', '20080821120000.000000-e', '20080821120000.000000-ex',
+                       '20081321120000.000000-e42', '20080821120000-e42', '20080821120000.000000-e4-2'):
+            self.assertRaises(Http404, stream_index.decode_cursor, cursor)
+            self.assertRaises(Http404, stream_index.get_page, 2, after=cursor)
+            self.assertRaises(Http404, stream_index.get_page, 2, before=cursor)
+
+
+class StreamPageTests(ColtraneTestCase):
+    def setUp(self):
+        super(StreamPageTests, self).setUp()
+        # Several Entries and Links published at the same moment, so
+        # that pages split ties between and within the two sources.
+        self.objects = []
+        for i in range(3):
+            entry = self.create_entry('entry-%s' % i)
+            entry.stream_type = 'entry'
+            link = self.create_link('link-%s' % i)
+            link.stream_type = 'link'
+            self.objects.extend([entry, link])
+        for day in (20, 22):
+            entry = self.create_entry('entry-%s' % day, pub_date=PUB_DATE.replace(day=day))
+            entry.stream_type = 'entry'
+            link = self.create_link('link-%s' % day, pub_date=PUB_DATE.replace(day=day, hour=8))
+            link.stream_type = 'link'
+            self.objects.extend([entry, link])
+        # Newest first; at the same moment Entries come before Links,
+        # and later ids before earlier ones.
+        ranks = { 'entry': 1, 'link': 0 }
+        self.objects.sort(key=lambda obj: (obj.pub_date, ranks[obj.stream_type], obj.id), reverse=True)
+        self.expected = [self.key(obj) for obj in self.objects]
+    
+    def key(self, obj):
+        return (obj.stream_type, obj.id)
+    
+    def keys(self, page):
+        return [self.key(obj) for obj in page.object_list]
+    
+    def walk(self, per_page):
+        """
+        Returns the pages from the first to the last, following each
+        page's next cursor.
+        
+        """
+        pages = [stream_index.get_page(per_page)]
+        while pages[-1].has_next():
+            pages.append(stream_index.get_page(per_page, after=pages[-1].next_cursor))
+        return pages
+    
+    def test_after(self):
+        for per_page in (1, 2, 3, 4, len(self.expected), len(self.expected) + 1):
+            pages = self.walk(per_page)
+            found = []
+            for page in pages:
+                found.extend(self.keys(page))
+            self.assertEqual(found, self.expected, per_page)
+            self.failIf(pages[0].has_previous())
+            for page in pages[1:]:
+                self.failUnless(page.has_previous())
+    
+    def test_before(self):
+        for per_page in (1, 2, 3, 4):
+            pages = self.walk(per_page)
+            for i in range(1, len(pages)):
+                previous = stream_index.get_page(per_page, before=pages[i].previous_cursor)
+                self.assertEqual(self.keys(previous), self.keys(pages[i - 1]), (per_page, i))
+                self.assertEqual(previous.has_previous(), i > 1, (per_page, i))
+                self.failUnless(previous.has_next())
+                self.assertEqual(previous.next_cursor, pages[i - 1].next_cursor)
+    
+    def test_seek(self):
+        # The Entry and Link with the highest ids of those tied at PUB_DATE.
+        tied_entry = [obj for obj in self.objects if obj.stream_type == 'entry' and obj.pub_date == PUB_DATE][0]
+        tied_link = [obj for obj in self.objects if obj.stream_type == 'link' and obj.pub_date == PUB_DATE][0]
+        entries = Entry.live.all()
+        links = Link.objects.all()
+        at_entry = (PUB_DATE, 1, tied_entry.id)
+        at_link = (PUB_DATE, 0, tied_link.id)
+        # Entries come before Links at the same moment, so every tied
+        # Link is older than an Entry, and every tied Entry newer than
+        # a Link.
+        older_links = stream_index._seek(links, 0, at_entry, True)
+        self.assertEqual(older_links.filter(pub_date=PUB_DATE).count(), 3)
+        newer_entries = stream_index._seek(entries, 1, at_link, False)
+        self.assertEqual(newer_entries.filter(pub_date=PUB_DATE).count(), 3)
+        self.assertEqual(stream_index._seek(entries, 1, at_link, True).filter(pub_date=PUB_DATE).count(), 0)
+        self.assertEqual(stream_index._seek(links, 0, at_entry, False).filter(pub_date=PUB_DATE).count(), 0)
+        # Within a source, ties are split by id.
+        older_entries = stream_index._seek(entries, 1, at_entry, True).filter(pub_date=PUB_DATE)
+        self.failIf([id for id in older_entries.values_list('id', flat=True) if id >= tied_entry.id])
+    
+    def test_scheduled_left_out(self):
+        scheduled = self.create_entry('scheduled', pub_date=datetime.datetime.now() + datetime.timedelta(days=1))
+        self.create_link('scheduled-link', pub_date=scheduled.pub_date)
+        found = []
+        for page in self.walk(4):
+            found.extend(self.keys(page))
+        self.assertEqual(found, self.expected)
+        self.assertEqual(stream_index.dates('year'), [datetime.datetime(2008, 1, 1)])
+        self.assertEqual(self.keys(stream_index.get_page(20, pub_date__year=scheduled.pub_date.year)), [])
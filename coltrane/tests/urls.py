@@ -0,0 +1,18 @@
+"""
+The URLconf the tests are run against, including every one of
+coltrane's.
+
+"""
+
+from django.conf.urls.defaults import *
+
+
+urlpatterns = patterns('',
+                       (r'^weblog/categories/', include('coltrane.urls.categories')),
+                       (r'^weblog/feeds/', include('coltrane.urls.feeds')),
+                       (r'^weblog/links/', include('coltrane.urls.links')),
+                       (r'^weblog/search/', include('coltrane.urls.search')),
+                       (r'^weblog/stream/', include('coltrane.urls.stream')),
+                       (r'^weblog/', include('coltrane.urls.sitemaps')),
+                       (r'^weblog/', include('coltrane.urls.entries')),
+                       )
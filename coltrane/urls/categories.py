@@ -6,16 +6,20 @@ URLs for categories in a weblog.
 from django.conf.urls.defaults import *
 from django.views.generic.list_detail import object_list
 
+from coltrane.instrumentation import url
 from coltrane.models import Category
+from coltrane.page_cache import cache_page
 from coltrane.views import category_detail
 
 
 urlpatterns = patterns('',
                        url(r'^$',
-                           object_list,
+                           cache_page(object_list, 'categories'),
                            { 'queryset': Category.objects.all() },
+                           budget=2,
                            name='coltrane_category_list'),
                        url(r'^(?P<slug>[-\w]+)/$',
                            category_detail,
+                           budget=6,
                            name='coltrane_category_detail'),
                        )
@@ -6,7 +6,12 @@ URLs for entries in a weblog.
 from django.conf.urls.defaults import *
 from django.views.generic import date_based
 
-from coltrane.models import Entry
+from coltrane.hits import count_views
+from coltrane.instrumentation import url
+from coltrane.models import Entry, TagCount
+from coltrane.page_cache import cache_page
+from coltrane.tag_index import QUERY_PATTERN
+from coltrane.views import archive_index, tag_archive, tag_cloud, tagged_object_list
 
 
 entry_info_dict = {
@@ -14,26 +19,53 @@ entry_info_dict = {
     'date_field': 'pub_date',
     }
 
+# List pages leave out the long text they don't show.
+entry_list_dict = dict(entry_info_dict, queryset=Entry.live.listing())
+
 
 urlpatterns = patterns('',
                        url(r'^$',
-                           date_based.archive_index,
-                           entry_info_dict,
+                           cache_page(archive_index, 'entry'),
+                           entry_list_dict,
+                           budget=6,
                            name='coltrane_entry_archive_index'),
+                       url(r'^tags/$',
+                           cache_page(tag_archive, 'entry_tags'),
+                           { 'queryset': TagCount.objects.for_model(Entry),
+                             'template_name': 'coltrane/entry_tag_archive.html',
+                             'paginate_by': 40 },
+                           budget=4,
+                           name='coltrane_entry_tag_archive'),
+                       url(r'^tags/cloud/$',
+                           cache_page(tag_cloud, 'entry_tags'),
+                           { 'model': Entry },
+                           budget=4,
+                           name='coltrane_entry_tag_cloud'),
+                       url(r'^tags/(?P<tag>%s)/$' % QUERY_PATTERN,
+                           cache_page(tagged_object_list, 'entry_tag', split_key='tag'),
+                           { 'model': Entry,
+                             'template_name': 'coltrane/entry_tag_detail.html',
+                             'paginate_by': 20 },
+                           budget=6,
+                           name='coltrane_entry_tag_detail'),
                        url(r'^(?P<year>\d{4})/$',
-                           date_based.archive_year,
-                           dict(entry_info_dict, make_object_list=True),
+                           cache_page(date_based.archive_year, 'entry'),
+                           dict(entry_list_dict, make_object_list=True),
+                           budget=6,
                            name='coltrane_entry_archive_year'),
                        url(r'^(?P<year>\d{4})/(?P<month>\w{3})/$',
-                           date_based.archive_month,
-                           entry_info_dict,
+                           cache_page(date_based.archive_month, 'entry'),
+                           entry_list_dict,
+                           budget=6,
                            name='coltrane_entry_archive_month'),
                        url(r'^(?P<year>\d{4})/(?P<month>\w{3})/(?P<day>\d{2})/$',
-                           date_based.archive_day,
-                           entry_info_dict,
+                           cache_page(date_based.archive_day, 'entry'),
+                           entry_list_dict,
+                           budget=6,
                            name='coltrane_entry_archive_day'),
                        url(r'^(?P<year>\d{4})/(?P<month>\w{3})/(?P<day>\d{2})/(?P<slug>[-\w]+)/$',
-                           date_based.object_detail,
+                           count_views(cache_page(date_based.object_detail, 'entry'), Entry),
                            dict(entry_info_dict, slug_field='slug'),
+                           budget=4,
                            name='coltrane_entry_detail'),
                        )
@@ -0,0 +1,30 @@
+"""
+URLs for the Atom and RSS feeds of a weblog.
+
+"""
+
+from django.conf.urls.defaults import *
+
+from coltrane import feeds
+from coltrane.instrumentation import url
+from coltrane.page_cache import cache_page
+
+
+urlpatterns = patterns('',
+                       url(r'^entries/(?P<format>atom|rss)/$',
+                           cache_page(feeds.latest_entries, 'entry'),
+                           budget=6,
+                           name='coltrane_feed_entries'),
+                       url(r'^links/(?P<format>atom|rss)/$',
+                           cache_page(feeds.latest_links, 'link'),
+                           budget=6,
+                           name='coltrane_feed_links'),
+                       url(r'^categories/(?P<slug>[-\w]+)/(?P<format>atom|rss)/$',
+                           cache_page(feeds.category_entries, 'category', ('slug',)),
+                           budget=6,
+                           name='coltrane_feed_category'),
+                       url(r'^tags/(?P<tag>[-\w]+)/(?P<format>atom|rss)/$',
+                           cache_page(feeds.tagged_items, 'tag', ('tag',)),
+                           budget=8,
+                           name='coltrane_feed_tag'),
+                       )
@@ -0,0 +1,15 @@
+"""
+URLs for the staff-only report of coltrane's performance figures.
+
+"""
+
+from django.conf.urls.defaults import *
+
+from coltrane import instrumentation
+
+
+urlpatterns = patterns('',
+                       url(r'^$',
+                           instrumentation.report_view,
+                           name='coltrane_instrumentation_report'),
+                       )
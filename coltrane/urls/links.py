@@ -5,12 +5,13 @@ URLs for links in a weblog.
 
 from django.conf.urls.defaults import *
 from django.views.generic import date_based
-from django.views.generic import list_detail
 
-from tagging.models import Tag
-from tagging.views import tagged_object_list
-
-from coltrane.models import Link
+from coltrane.hits import count_views
+from coltrane.instrumentation import url
+from coltrane.models import Link, TagCount
+from coltrane.page_cache import cache_page
+from coltrane.tag_index import QUERY_PATTERN
+from coltrane.views import archive_index, tag_archive, tag_cloud, tagged_object_list
 
 
 link_info_dict = {
@@ -18,37 +19,53 @@ link_info_dict = {
     'date_field': 'pub_date',
     }
 
+# List pages leave out the long text they don't show.
+link_list_dict = dict(link_info_dict, queryset=Link.objects.listing())
+
 
 urlpatterns = patterns('',
                        url(r'^$',
-                           date_based.archive_index,
-                           link_info_dict,
+                           cache_page(archive_index, 'link'),
+                           link_list_dict,
+                           budget=6,
                            name='coltrane_link_archive_index'),
                        url(r'^links/tags/$',
-                           list_detail.object_list,
-                           { 'queryset': Tag.objects.all(),
+                           cache_page(tag_archive, 'link_tags'),
+                           { 'queryset': TagCount.objects.for_model(Link),
                              'template_name': 'coltrane/link_tag_archive.html',
                              'paginate_by': 40 },
+                           budget=4,
                            name='coltrane_link_tag_archive'),
-                       url(r'^links/tags/(?P<tag>[-\w]+)/$',
-                           tagged_object_list,
-                           { 'queryset_or_model': Link.objects.all(),
-                             'template_name': 'coltrane/link_tag_detail.html' },
+                       url(r'^links/tags/cloud/$',
+                           cache_page(tag_cloud, 'link_tags'),
+                           { 'model': Link },
+                           budget=4,
+                           name='coltrane_link_tag_cloud'),
+                       url(r'^links/tags/(?P<tag>%s)/$' % QUERY_PATTERN,
+                           cache_page(tagged_object_list, 'link_tag', split_key='tag'),
+                           { 'model': Link,
+                             'template_name': 'coltrane/link_tag_detail.html',
+                             'paginate_by': 20 },
+                           budget=6,
                            name='coltrane_link_tag_detail'),
                        url(r'^(?P<year>\d{4})/$',
-                           date_based.archive_year,
-                           dict(link_info_dict, make_object_list=True),
+                           cache_page(date_based.archive_year, 'link'),
+                           dict(link_list_dict, make_object_list=True),
+                           budget=6,
                            name='coltrane_link_archive_year'),
                        url(r'^(?P<year>\d{4})/(?P<month>\w{3})/$',
-                           date_based.archive_month,
-                           link_info_dict,
+                           cache_page(date_based.archive_month, 'link'),
+                           link_list_dict,
+                           budget=6,
                            name='coltrane_link_archive_month'),
                        url(r'^(?P<year>\d{4})/(?P<month>\w{3})/(?P<day>\d{2})/$',
-                           date_based.archive_day,
-                           link_info_dict,
+                           cache_page(date_based.archive_day, 'link'),
+                           link_list_dict,
+                           budget=6,
                            name='coltrane_link_archive_day'),
                        url(r'^(?P<year>\d{4})/(?P<month>\w{3})/(?P<day>\d{2})/(?P<slug>[-\w]+)/$',
-                           date_based.object_detail,
+                           count_views(cache_page(date_based.object_detail, 'link'), Link),
                            dict(link_info_dict, slug_field='slug'),
+                           budget=4,
                            name='coltrane_link_detail'),
                        )
@@ -0,0 +1,17 @@
+"""
+URLs for searching a weblog.
+
+"""
+
+from django.conf.urls.defaults import *
+
+from coltrane.instrumentation import url
+from coltrane.views import search
+
+
+urlpatterns = patterns('',
+                       url(r'^$',
+                           search,
+                           budget=8,
+                           name='coltrane_search'),
+                       )
@@ -0,0 +1,21 @@
+"""
+URLs for the XML sitemaps of a weblog.
+
+"""
+
+from django.conf.urls.defaults import *
+
+from coltrane import sitemaps
+from coltrane.instrumentation import url
+
+
+urlpatterns = patterns('',
+                       url(r'^sitemap\.xml$',
+                           sitemaps.sitemap_index,
+                           budget=8,
+                           name='coltrane_sitemap_index'),
+                       url(r'^sitemap-(?P<section>[a-z]+)-(?P<shard>\d+)\.xml$',
+                           sitemaps.sitemap_section,
+                           budget=6,
+                           name='coltrane_sitemap_section'),
+                       )
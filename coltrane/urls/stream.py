@@ -0,0 +1,26 @@
+"""
+URLs for the combined stream of entries and links in a weblog.
+
+"""
+
+from django.conf.urls.defaults import *
+
+from coltrane.instrumentation import url
+from coltrane.page_cache import cache_page
+from coltrane.views import stream, stream_archive_month, stream_archive_year
+
+
+urlpatterns = patterns('',
+                       url(r'^$',
+                           cache_page(stream, 'stream'),
+                           budget=6,
+                           name='coltrane_stream'),
+                       url(r'^(?P<year>\d{4})/$',
+                           cache_page(stream_archive_year, 'stream'),
+                           budget=6,
+                           name='coltrane_stream_archive_year'),
+                       url(r'^(?P<year>\d{4})/(?P<month>\w{3})/$',
+                           cache_page(stream_archive_month, 'stream'),
+                           budget=6,
+                           name='coltrane_stream_archive_month'),
+                       )
@@ -1,10 +1,17 @@
 import datetime
 
 from django.conf import settings
+from django.core.paginator import InvalidPage, Paginator
+from django.http import Http404, HttpResponse
 from django.shortcuts import get_object_or_404, render_to_response
+from django.template import loader, RequestContext
 from django.views.generic import date_based, list_detail
+from tagging.models import Tag
 
-from coltrane.models import Category
+from coltrane import pagination, search as search_index, stream as stream_index, tag_index
+from coltrane.instrumentation import instrument
+from coltrane.models import Category, TagCount
+from coltrane.page_cache import cache_page, is_static_export
 
 
 def _category_kwarg_helper(category, kwarg_dict):
@@ -17,7 +24,325 @@ def _category_kwarg_helper(category, kwarg_dict):
             del kwarg_dict[key]
     return kwarg_dict
 
-def category_detail(request, slug, **kwargs):
+def _category_entries(category, full_text):
+    if full_text:
+        return category.live_entry_set
+    return category.live_entry_set.listing()
+
+def _cache_category_view(view_func):
+    return instrument(cache_page(view_func, 'category', ('slug', 'year', 'month', 'day'), owner_keys=('slug',)),
+                      view_func.__name__)
+
+def _render(request, template_name, context, extra_context=None, context_processors=None, mimetype=None):
+    c = RequestContext(request, context, context_processors)
+    for key, value in (extra_context or {}).items():
+        if callable(value):
+            c[key] = value()
+        else:
+            c[key] = value
+    return HttpResponse(loader.get_template(template_name).render(c), mimetype=mimetype)
+
+def _page_context(request, page):
+    if is_static_export(request):
+        # A static file can't be chosen by the cursor in a query
+        # string, so an exported page doesn't link to others.
+        page.next_cursor = page.previous_cursor = None
+    return { 'page': page,
+             'is_paginated': page.has_other_pages(),
+             'has_next': page.has_next(),
+             'has_previous': page.has_previous(),
+             'next_cursor': page.next_cursor,
+             'previous_cursor': page.previous_cursor }
+
+def _keyset_context(request, queryset, paginate_by, date_field='pub_date'):
+    page = pagination.get_page(queryset, paginate_by,
+                               after=request.GET.get('after'),
+                               before=request.GET.get('before'),
+                               date_field=date_field)
+    return page, _page_context(request, page)
+
+def keyset_object_list(request, queryset, paginate_by, date_field='pub_date', template_name=None,
+                       template_object_name='object', extra_context=None, allow_empty=True,
+                       context_processors=None, mimetype=None):
+    """
+    A list of objects, newest first, split into pages by keyset
+    pagination (see ``coltrane.pagination``) rather than by offset.
+    
+    The page is chosen by the ``after`` or ``before`` cursor in the
+    query string, so a page deep into a large list costs the same as
+    the first one.
+    
+    Context::
+        object_list
+            The objects on this page (the name can be changed with
+            ``template_object_name``, as for
+            ``list_detail.object_list``).
+        
+        page
+            The ``pagination.KeysetPage``.
+        
+        is_paginated
+            Whether there is more than one page.
+        
+        has_next, has_previous
+            Whether there is a next or previous page.
+        
+        next_cursor, previous_cursor
+            The cursors to pass as ``after`` and ``before``
+            respectively to reach the next or previous page.
+    
+    Template::
+        <app_label>/<model_name>_list.html, by default.
+    
+    """
+    page, context = _keyset_context(request, queryset, paginate_by, date_field)
+    if not page.object_list and not allow_empty:
+        raise Http404
+    context['%s_list' % template_object_name] = page.object_list
+    if template_name is None:
+        model = queryset.model
+        template_name = '%s/%s_list.html' % (model._meta.app_label, model._meta.object_name.lower())
+    return _render(request, template_name, context, extra_context, context_processors, mimetype)
+
+def archive_index(request, queryset, date_field, paginate_by=15, template_name=None,
+                  template_object_name='latest', extra_context=None, allow_empty=True,
+                  context_processors=None, mimetype=None, allow_future=False):
+    """
+    A drop-in replacement for the generic ``date_based.archive_index``
+    view whose list of latest objects is paged by keyset pagination.
+    
+    The first page is what ``date_based.archive_index`` would show
+    with ``num_latest`` set to ``paginate_by``; the context variables
+    of ``keyset_object_list`` are added so that templates can link to
+    older pages.
+    
+    Template::
+        <app_label>/<model_name>_archive.html, by default.
+    
+    """
+    if not allow_future:
+        queryset = queryset.filter(**{ '%s__lte' % date_field: datetime.datetime.now() })
+    date_list = queryset.dates(date_field, 'year')[::-1]
+    if not date_list and not allow_empty:
+        raise Http404
+    page, context = _keyset_context(request, queryset, paginate_by, date_field)
+    context.update(date_list=date_list)
+    context[template_object_name] = page.object_list
+    if template_name is None:
+        model = queryset.model
+        template_name = '%s/%s_archive.html' % (model._meta.app_label, model._meta.object_name.lower())
+    return _render(request, template_name, context, extra_context, context_processors, mimetype)
+
+def tag_archive(request, queryset, paginate_by=None, **kwargs):
+    """
+    ``list_detail.object_list`` of the ``TagCount`` objects in
+    ``queryset``, which puts them all on one page in the static
+    export, since that can't follow links to '?page=2'.
+    
+    """
+    if is_static_export(request):
+        paginate_by = None
+    return list_detail.object_list(request, queryset, paginate_by=paginate_by, **kwargs)
+
+def tagged_object_list(request, model, tag, paginate_by, full_text=False, template_name=None,
+                       template_object_name='object', extra_context=None, allow_empty=True,
+                       context_processors=None, mimetype=None):
+    """
+    Live Entries or Links carrying a given tag, or a combination of
+    tags, paged by keyset pagination.
+    
+    ``tag`` is a tag name, or several joined by '+' for objects
+    carrying all of them or by ',' for objects carrying any of them;
+    the query is answered from the posting lists in
+    ``coltrane.tag_index``. The objects' long text is left out (see
+    ``ArchiveQuerySet.listing()``) unless ``full_text`` is ``True``.
+    
+    Context::
+        As for ``keyset_object_list``, plus:
+        
+        tags
+            The ``Tag`` objects named in the query.
+        
+        tag
+            The first of them.
+        
+        operator
+            'and' or 'or'.
+    
+    Template::
+        <app_label>/<model_name>_tag_detail.html, by default.
+    
+    """
+    names, operator = tag_index.parse_query(tag)
+    found = dict([(obj.name, obj) for obj in Tag.objects.filter(name__in=names)])
+    tags = [found[name] for name in names if name in found]
+    if not tags or len(tags) < len(names) and operator == tag_index.AND:
+        raise Http404
+    page = tag_index.get_page(model, [obj.name for obj in tags], paginate_by, operator,
+                              after=request.GET.get('after'),
+                              before=request.GET.get('before'),
+                              listing=not full_text)
+    if not page.object_list and not allow_empty:
+        raise Http404
+    context = _page_context(request, page)
+    context.update(tags=tags, tag=tags[0], operator=operator)
+    context['%s_list' % template_object_name] = page.object_list
+    if template_name is None:
+        template_name = '%s/%s_tag_detail.html' % (model._meta.app_label, model._meta.object_name.lower())
+    return _render(request, template_name, context, extra_context, context_processors, mimetype)
+
+def tag_cloud(request, model, steps=4, template_name=None, extra_context=None,
+              context_processors=None, mimetype=None):
+    """
+    Cloud of the Tags used by the live Entries or the Links, read from
+    the precomputed tag counts.
+    
+    Context::
+        object_list
+            The ``TagCount`` objects of the Tags used by ``model``, in
+            alphabetical order, each with a ``name``, a ``count`` and
+            a ``font_size`` from 1 to ``steps``.
+    
+    Template::
+        <app_label>/<model_name>_tag_cloud.html, by default.
+    
+    """
+    if template_name is None:
+        template_name = '%s/%s_tag_cloud.html' % (model._meta.app_label, model._meta.object_name.lower())
+    return _render(request, template_name,
+                   { 'object_list': TagCount.objects.cloud(model, steps) },
+                   extra_context, context_processors, mimetype)
+
+def search(request, paginate_by=20, template_name='coltrane/search.html', extra_context=None,
+           context_processors=None, mimetype=None):
+    """
+    Full-text search of live Entries and Links, using the index in
+    ``coltrane.search``.
+    
+    The query is read from the ``q`` parameter of the query string,
+    and the results are paged by the ``page`` parameter.
+    
+    Context::
+        query
+            The query.
+        
+        object_list
+            The ``coltrane.search.SearchResult`` objects on this page,
+            best first. Each has the matching ``object``, its
+            ``score``, its ``model_name`` ('entry' or 'link') and an
+            HTML ``snippet`` of its text with the matches highlighted.
+        
+        paginator, page_obj, is_paginated
+            As for ``list_detail.object_list``.
+    
+    Template::
+        coltrane/search.html
+    
+    """
+    query = request.GET.get('q', '').strip()
+    paginator = Paginator(query and search_index.search(query) or [], paginate_by)
+    try:
+        page = paginator.page(request.GET.get('page', 1))
+    except (InvalidPage, ValueError):
+        raise Http404
+    context = { 'query': query,
+                'object_list': search_index.get_results(page.object_list, query),
+                'paginator': paginator,
+                'page_obj': page,
+                'is_paginated': page.has_other_pages() }
+    return _render(request, template_name, context, extra_context, context_processors, mimetype)
+
+def stream(request, paginate_by=20, template_name='coltrane/stream.html', extra_context=None,
+           context_processors=None, mimetype=None):
+    """
+    The latest live Entries and Links together, newest first, paged by
+    keyset pagination (see ``coltrane.stream``).
+    
+    Context::
+        As for ``keyset_object_list``, plus:
+        
+        date_list
+            The years in which anything was published, newest first.
+        
+        Each object has a ``stream_type`` of 'entry' or 'link'.
+    
+    Template::
+        coltrane/stream.html
+    
+    """
+    page = stream_index.get_page(paginate_by,
+                                 after=request.GET.get('after'),
+                                 before=request.GET.get('before'))
+    context = _page_context(request, page)
+    context.update(object_list=page.object_list, date_list=stream_index.dates('year'))
+    return _render(request, template_name, context, extra_context, context_processors, mimetype)
+
+def stream_archive_year(request, year, paginate_by=20, template_name='coltrane/stream_archive_year.html',
+                        extra_context=None, context_processors=None, mimetype=None):
+    """
+    The live Entries and Links published in a given year, newest
+    first, paged as in ``stream``.
+    
+    Context::
+        As for ``stream``, plus:
+        
+        year
+            The year, as a string.
+        
+        date_list
+            The months of that year in which anything was published,
+            newest first.
+    
+    Template::
+        coltrane/stream_archive_year.html
+    
+    """
+    lookups = { 'pub_date__year': int(year) }
+    date_list = stream_index.dates('month', **lookups)
+    if not date_list:
+        raise Http404
+    page = stream_index.get_page(paginate_by,
+                                 after=request.GET.get('after'),
+                                 before=request.GET.get('before'),
+                                 **lookups)
+    context = _page_context(request, page)
+    context.update(object_list=page.object_list, date_list=date_list, year=year)
+    return _render(request, template_name, context, extra_context, context_processors, mimetype)
+
+def stream_archive_month(request, year, month, paginate_by=20, template_name='coltrane/stream_archive_month.html',
+                         extra_context=None, context_processors=None, mimetype=None):
+    """
+    The live Entries and Links published in a given month, newest
+    first, paged as in ``stream``.
+    
+    Context::
+        As for ``keyset_object_list``, plus:
+        
+        month
+            The first day of the month, as a ``datetime.date``.
+        
+        Each object has a ``stream_type`` of 'entry' or 'link'.
+    
+    Template::
+        coltrane/stream_archive_month.html
+    
+    """
+    try:
+        date = datetime.datetime.strptime('%s-%s' % (year, month), '%Y-%b').date()
+    except ValueError:
+        raise Http404
+    page = stream_index.get_page(paginate_by,
+                                 after=request.GET.get('after'),
+                                 before=request.GET.get('before'),
+                                 pub_date__year=date.year,
+                                 pub_date__month=date.month)
+    if not page.object_list:
+        raise Http404
+    context = _page_context(request, page)
+    context.update(object_list=page.object_list, month=date)
+    return _render(request, template_name, context, extra_context, context_processors, mimetype)
+
+def category_detail(request, slug, keyset=False, full_text=False, **kwargs):
     """
     Detail view of a ``Category``, listing entries published in it.
     
@@ -34,21 +359,35 @@ def category_detail(request, slug, **kwargs):
     with these exceptions:
 
     * ``queryset`` will always be the ``QuerySet`` of live entries in
-      the ``Category``.
+      the ``Category``, without their long text (see
+      ``Entry.live.listing()``) unless ``full_text`` is ``True``.
     * ``template_name`` will always be 'coltrane/category_detail.html'.
     
+    If ``keyset`` is ``True``, the entries are instead paged by
+    ``keyset_object_list``, and its keyword arguments and context
+    variables apply.
+    
     Template::
         coltrane/category_detail.html
     
     """
     category = get_object_or_404(Category, slug__exact=slug)
     kwarg_dict = _category_kwarg_helper(category, kwargs)
+    if is_static_export(request) and not keyset:
+        # Offset pages can't be exported, so all entries go on one.
+        kwarg_dict.pop('paginate_by', None)
+    if keyset:
+        return keyset_object_list(request,
+                                  queryset=_category_entries(category, full_text),
+                                  template_name='coltrane/category_detail.html',
+                                  **kwarg_dict)
     return list_detail.object_list(request,
-                                   queryset=category.live_entry_set,
+                                   queryset=_category_entries(category, full_text),
                                    template_name='coltrane/category_detail.html',
                                    **kwarg_dict)
+category_detail = _cache_category_view(category_detail)
 
-def category_archive_index(request, slug, **kwargs):
+def category_archive_index(request, slug, full_text=False, **kwargs):
     """
     View of the latest entries published in a ``Category``.
     
@@ -65,7 +404,8 @@ def category_archive_index(request, slug, **kwargs):
     with these exceptions:
     
     * ``queryset`` will always be the ``QuerySet`` of live entries in
-      the ``Category``.
+      the ``Category``, without their long text (see
+      ``Entry.live.listing()``) unless ``full_text`` is ``True``.
     * ``date_field`` will always be 'pub_date'.
     * ``template_name`` will always be 'coltrane/category_archive.html'.
     
@@ -76,12 +416,13 @@ def category_archive_index(request, slug, **kwargs):
     category = get_object_or_404(Category, slug__exact=slug)
     kwarg_dict = _category_kwarg_helper(category, kwargs)
     return date_based.archive_index(request,
-                                    queryset=category.live_entry_set,
+                                    queryset=_category_entries(category, full_text),
                                     date_field='pub_date',
                                     template_name='coltrane/category_archive.html',
                                     **kwarg_dict)
+category_archive_index = _cache_category_view(category_archive_index)
 
-def category_archive_year(request, slug, year, **kwargs):
+def category_archive_year(request, slug, year, full_text=False, **kwargs):
     """
     View of entries published in a ``Category`` in a given year.
     
@@ -98,7 +439,8 @@ def category_archive_year(request, slug, year, **kwargs):
     with these exceptions:
     
     * ``queryset`` will always be the ``QuerySet`` of live entries in
-      the ``Category``.
+      the ``Category``, without their long text (see
+      ``Entry.live.listing()``) unless ``full_text`` is ``True``.
     * ``date_field`` will always be 'pub_date'.
     * ``template_name`` will always be 'coltrane/category_archive_year.html'.
     
@@ -110,12 +452,13 @@ def category_archive_year(request, slug, year, **kwargs):
     kwarg_dict = _category_kwarg_helper(category, kwargs)
     return date_based.archive_year(request,
                                    year=year,
-                                   queryset=category.live_entry_set,
+                                   queryset=_category_entries(category, full_text),
                                    date_field='pub_date',
                                    template_name='coltrane/category_archive_year.html',
                                    **kwarg_dict)
+category_archive_year = _cache_category_view(category_archive_year)
 
-def category_archive_month(request, slug, year, month, **kwargs):
+def category_archive_month(request, slug, year, month, full_text=False, **kwargs):
     """
     View of entries published in a ``Category`` in a given month.
     
@@ -132,7 +475,8 @@ def category_archive_month(request, slug, year, month, **kwargs):
     with these exceptions:
     
     * ``queryset`` will always be the ``QuerySet`` of live entries in
-      the ``Category``.
+      the ``Category``, without their long text (see
+      ``Entry.live.listing()``) unless ``full_text`` is ``True``.
     * ``date_field`` will always be 'pub_date'.
     * ``template_name`` will always be 'coltrane/category_archive_month.html'.
     
@@ -145,12 +489,13 @@ def category_archive_month(request, slug, year, month, **kwargs):
     return date_based.archive_month(request,
                                     year=year,
                                     month=month,
-                                    queryset=category.live_entry_set,
+                                    queryset=_category_entries(category, full_text),
                                     date_field='pub_date',
                                     template_name='coltrane/category_archive_month.html',
                                     **kwarg_dict)
+category_archive_month = _cache_category_view(category_archive_month)
 
-def category_archive_day(request, slug, year, month, day, **kwargs):
+def category_archive_day(request, slug, year, month, day, full_text=False, **kwargs):
     """
     View of entries published in a ``Category`` on a given day.
     
@@ -167,7 +512,8 @@ def category_archive_day(request, slug, year, month, day, **kwargs):
     these exceptions:
     
     * ``queryset`` will always be the ``QuerySet`` of live entries in
-      the ``Category``.
+      the ``Category``, without their long text (see
+      ``Entry.live.listing()``) unless ``full_text`` is ``True``.
     * ``date_field`` will always be 'pub_date'.
     * ``template_name`` will always be 'coltrane/category_archive_day.html'.
     
@@ -181,10 +527,11 @@ def category_archive_day(request, slug, year, month, day, **kwargs):
                                  year=year,
                                  month=month,
                                  day=day,
-                                 queryset=category.live_entry_set,
+                                 queryset=_category_entries(category, full_text),
                                  date_field='pub_date',
                                  template_name='coltrane/category_archive_day.html',
                                  **kwarg_dict)
+category_archive_day = _cache_category_view(category_archive_day)
 
 def category_archive_today(request, slug, **kwargs):
     """
@@ -204,7 +551,8 @@ def category_archive_today(request, slug, **kwargs):
     these exceptions:
     
     * ``queryset`` will always be the ``QuerySet`` of live entries in
-      the ``Category``.
+      the ``Category``, without their long text (see
+      ``Entry.live.listing()``) unless ``full_text`` is ``True``.
     * ``date_field`` will always be 'pub_date'.
     * ``template_name`` will always be 'coltrane/category_archive_day.html'.
     